@@ -0,0 +1,253 @@
+# archive.py
+"""
+Columnar Event Archive
+----------------------
+Handles:
+- Converting daily partition files (see partitions.py) into compressed Parquet
+  files (archive/events_YYYYMMDD.parquet). raw_data is stored verbatim in its
+  own column; each payload is additionally parsed into typed columns (user, pid,
+  query, ...) that exist only for predicate pushdown and column projection.
+- Reading archives back with column projection and predicate pushdown, in
+  the same row shape as the live tables
+- A token-only FTS5 index per archived day (archive/search_YYYYMMDD.db) so
+  archived events stay searchable (see search.py): it holds the index and the
+  id/timestamp/source/event_type needed for filtering, never the payload text,
+  which is read back from Parquet for the matching ids only
+- Archive retention by deleting whole files (Parquet and search index together)
+
+Configuration (environment variables):
+    THREAT_ARCHIVE_DIR, THREAT_ARCHIVE_AFTER_DAYS, THREAT_ARCHIVE_RETENTION_DAYS, THREAT_ARCHIVE_COMPRESSION
+"""
+
+import glob
+import os
+import re
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+import partitions
+from scoring import parse_payloads
+
+# ==============================
+# CONFIGURATION
+# ==============================
+ARCHIVE_DIR = os.environ.get("THREAT_ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.environ.get("THREAT_ARCHIVE_AFTER_DAYS", "2"))          # partition age before archiving
+ARCHIVE_RETENTION_DAYS = int(os.environ.get("THREAT_ARCHIVE_RETENTION_DAYS", "365"))
+ARCHIVE_COMPRESSION = os.environ.get("THREAT_ARCHIVE_COMPRESSION", "zstd")
+ROW_GROUP_SIZE = 100000
+
+BASE_COLUMNS = ["id", "timestamp", "source", "event_type", "anomaly_score", "is_anomaly"]
+
+ROW_COLUMNS = BASE_COLUMNS + ["raw_data"]  # what a query returns by default (the live-table row shape)
+STORED_COLUMNS = ROW_COLUMNS + ["ioc_match"]  # kept for search results; older archives lack ioc_match
+
+# Payload keys → (typed archive column, dtype). Filter/projection aids only: raw_data is
+# always returned as stored and never rebuilt from these.
+PAYLOAD_COLUMNS = {
+    "host": ("host", "string"),
+    "user": ("user", "string"),
+    "pid": ("pid", "Int64"),
+    "path": ("path", "string"),
+    "cmdline": ("cmdline", "string"),
+    "id.orig_h": ("orig_h", "string"),
+    "id.resp_h": ("resp_h", "string"),
+    "query": ("query", "string"),
+    "proto": ("proto", "string"),
+}
+
+# Typed payload columns of the live tables (see payloads.py) → archive columns, for filter
+# pushdown. A field mapped to several columns matches if any of them equals the value.
+FIELD_COLUMNS = {"host": ("host", "orig_h"), "dst_ip": ("resp_h",), "user": ("user",), "pid": ("pid",),
+                 "path": ("path",), "cmdline": ("cmdline",), "query": ("query",)}
+
+ARCHIVE_FILE = re.compile(r"events_(\d{8})\.parquet$")
+
+# Per-day search index: contentless FTS5 (tokens only) keyed by event id, plus the filter columns
+SEARCH_SCHEMA = [
+    "CREATE TABLE events (id INTEGER PRIMARY KEY, timestamp TEXT, source TEXT, event_type TEXT)",
+    "CREATE VIRTUAL TABLE event_search USING fts5(raw_data, content='')",
+]
+
+# ==============================
+# WRITE
+# ==============================
+def archive_path(day: date) -> str:
+    return os.path.join(ARCHIVE_DIR, f"events_{day:%Y%m%d}.parquet")
+
+def search_path(day: date) -> str:
+    return os.path.join(ARCHIVE_DIR, f"search_{day:%Y%m%d}.db")
+
+def to_columnar(frame: pd.DataFrame) -> pd.DataFrame:
+    """Archive layout: the row columns (raw_data untouched), ioc_match and typed payload columns."""
+    frame = frame.reset_index(drop=True)
+    payload = parse_payloads(frame["raw_data"])
+    out = frame[ROW_COLUMNS].copy()
+    out["raw_data"] = out["raw_data"].astype("string")
+    out["ioc_match"] = (frame["ioc_match"] if "ioc_match" in frame else pd.Series(pd.NA, index=frame.index)).astype("string")
+    for key, (column, dtype) in PAYLOAD_COLUMNS.items():
+        values = payload[key] if key in payload else pd.Series(pd.NA, index=frame.index)
+        if dtype in ("Int64", "Float64"):
+            out[column] = pd.to_numeric(values, errors="coerce").astype(dtype)
+        else:
+            out[column] = values.astype(dtype)
+    for column in ("source", "event_type"):
+        out[column] = out[column].astype("category")
+    return out
+
+def write_search_index(day: date, frame: pd.DataFrame):
+    """(Re)build the day's search index from archived rows (id, timestamp, source, event_type, raw_data)."""
+    target = search_path(day)
+    tmp = target + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    try:
+        for statement in SEARCH_SCHEMA:
+            conn.execute(statement)
+        rows = frame[["id", "timestamp", "source", "event_type", "raw_data"]].astype(object)
+        rows = list(rows.where(rows.notna(), None).itertuples(index=False, name=None))
+        conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?)", [row[:4] for row in rows])
+        conn.executemany("INSERT INTO event_search (rowid, raw_data) VALUES (?, ?)", [(row[0], row[4]) for row in rows])
+        conn.execute("INSERT INTO event_search (event_search) VALUES ('optimize')")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp, target)
+
+def archive_partition(day: date) -> int:
+    """Write one partition file to Parquet, index it for search and delete it. Returns rows archived."""
+    source = partitions.partition_path(day)
+    conn = sqlite3.connect(source)
+    try:
+        stored = [c for c in STORED_COLUMNS if c in {row[1] for row in conn.execute("PRAGMA table_info(events)")}]
+        frame = pd.read_sql_query(f"SELECT {', '.join(stored)} FROM events ORDER BY timestamp, id", conn)
+    finally:
+        conn.close()
+
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    target = archive_path(day)
+    if os.path.exists(target):  # day already partly archived (e.g. late rotation): merge
+        frame = pd.concat([read_archive_file(target, columns=archived_columns(target, STORED_COLUMNS)), frame],
+                          ignore_index=True)
+        frame = frame.drop_duplicates("id").sort_values(["timestamp", "id"])
+
+    tmp = target + ".tmp"
+    to_columnar(frame).to_parquet(
+        tmp, engine="pyarrow", compression=ARCHIVE_COMPRESSION, index=False, row_group_size=ROW_GROUP_SIZE
+    )
+    os.replace(tmp, target)
+    write_search_index(day, frame)  # before the partition (and its own index) goes away
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(source + suffix):
+            os.remove(source + suffix)
+    return len(frame)
+
+def archive_partitions(now: datetime = None) -> dict:
+    """Archive every partition older than ARCHIVE_AFTER_DAYS. Returns {day: rows}."""
+    cutoff = (now or datetime.now()).date() - timedelta(days=ARCHIVE_AFTER_DAYS)
+    return {day.isoformat(): archive_partition(day) for day in partitions.partition_days() if day < cutoff}
+
+def index_archives() -> list:
+    """Build the search index of archived days that have none (archived before search indexes existed)."""
+    indexed = []
+    for day in archive_days():
+        if not os.path.exists(search_path(day)):
+            write_search_index(day, read_archive_file(
+                archive_path(day), columns=["id", "timestamp", "source", "event_type", "raw_data"]
+            ))
+            indexed.append(day.isoformat())
+    return indexed
+
+def enforce_archive_retention(now: datetime = None) -> list:
+    """Delete archive files (and their search indexes) older than ARCHIVE_RETENTION_DAYS."""
+    cutoff = (now or datetime.now()).date() - timedelta(days=ARCHIVE_RETENTION_DAYS)
+    dropped = []
+    for day in archive_days():
+        if day < cutoff:
+            if os.path.exists(search_path(day)):
+                os.remove(search_path(day))
+            os.remove(archive_path(day))
+            dropped.append(day.isoformat())
+    return dropped
+
+def run_archival(now: datetime = None) -> dict:
+    """Maintenance hook: archive cold partitions, index older archives for search, apply archive retention."""
+    return {
+        "archived": archive_partitions(now),
+        "archives_indexed": index_archives(),
+        "archives_dropped": enforce_archive_retention(now),
+    }
+
+# ==============================
+# READ
+# ==============================
+def archive_days() -> list:
+    """Days that have an archive file, oldest first."""
+    days = []
+    for path in glob.glob(os.path.join(ARCHIVE_DIR, "events_*.parquet")):
+        match = ARCHIVE_FILE.search(path)
+        if match:
+            days.append(datetime.strptime(match.group(1), "%Y%m%d").date())
+    return sorted(days)
+
+def archived_columns(path: str, columns: list) -> list:
+    """The subset of `columns` stored in an archive file (older files lack some, e.g. ioc_match)."""
+    stored = set(pq.read_schema(path).names)
+    return [c for c in columns if c in stored]
+
+def read_events(day: date, ids: list) -> pd.DataFrame:
+    """Archived rows of `day` with the given ids, in STORED_COLUMNS shape (ioc_match None where not stored)."""
+    path = archive_path(day)
+    frame = read_archive_file(path, filters=[("id", "in", list(ids))], columns=archived_columns(path, STORED_COLUMNS))
+    if "ioc_match" not in frame:
+        frame["ioc_match"] = None
+    frame = frame[STORED_COLUMNS]
+    return frame.astype(object).where(frame.notna(), None)
+
+def read_archive_file(path: str, filters=None, columns=None) -> pd.DataFrame:
+    frame = pd.read_parquet(path, engine="pyarrow", filters=filters or None, columns=columns)
+    for column in ("source", "event_type"):
+        if column in frame:
+            frame[column] = frame[column].astype(str)
+    return frame
+
+def query_archive(since: str, until: str, source: str = None, event_type: str = None,
+                  limit: int = 1000, columns: list = None, fields: dict = None) -> list:
+    """
+    Archived events in [since, until), newest first.
+    Filters are pushed down to Parquet row groups; `columns` restricts what is read
+    (default: the live-table row columns; typed payload columns may be requested too).
+    `fields` filters on typed payload columns by their live-table names (see FIELD_COLUMNS).
+    """
+    filters = [("timestamp", ">=", since), ("timestamp", "<", until)]
+    if source is not None:
+        filters.append(("source", "==", source))
+    if event_type is not None:
+        filters.append(("event_type", "==", event_type))
+    # Disjunctive normal form: one conjunction per combination of alternative columns
+    filters = [filters]
+    for field, value in (fields or {}).items():
+        if value is not None:
+            filters = [f + [(column, "==", value)] for f in filters for column in FIELD_COLUMNS[field]]
+    columns = list(dict.fromkeys(["id", "timestamp", *(columns or ROW_COLUMNS)]))
+
+    frames = []
+    collected = 0
+    for day in reversed(archive_days()):
+        if not since[:10] <= day.isoformat() <= until[:10]:
+            continue
+        frame = read_archive_file(archive_path(day), filters=filters, columns=columns)
+        frames.append(frame)
+        collected += len(frame)
+        if collected >= limit:
+            break  # earlier days are strictly older than what we already have
+    if not frames:
+        return []
+
+    result = pd.concat(frames, ignore_index=True).sort_values(["timestamp", "id"], ascending=False).head(limit)
+    result = result.astype(object).where(result.notna(), None)
+    return result.to_dict(orient="records")
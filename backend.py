@@ -3,112 +3,205 @@
 FastAPI Backend for AI Threat Detection Demo
 --------------------------------------------
 Handles:
-- Data ingestion from osquery & Zeek clients
-- Mock ML anomaly detection (Amber / Isolation Forest)
-- Mock Gemini AI review for mitigation suggestions
-- Storage in SQLite and retrieval for Streamlit dashboard
+- Data ingestion from osquery & Zeek clients (single events or batches; optional multi-process mode, see ingest.py)
+- Streaming upload of raw Zeek / osquery log files (see sensor_logs.py)
+- Full-text payload search and IOC flagging at ingest (see search.py)
+- ML anomaly detection (Isolation Forest scoring engine, see scoring.py)
+- Mock Gemini AI review for mitigation suggestions (queued, see review_queue.py)
+- Storage in SQLite (pooled WAL connections, see storage.py) and retrieval for Streamlit dashboard
+- Prometheus-style metrics at /metrics (see metrics.py)
 """
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import sqlite3
+from fastapi import FastAPI, HTTPException, Request, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from typing import List, Optional
+from contextlib import asynccontextmanager
+from collections import OrderedDict
 import pandas as pd
+import asyncio
 import random
 import json
+import base64
 from datetime import datetime
 import os
+import uuid
+import zlib
+import storage
+from executor import run_blocking
+import review_queue
+import review_cache
+import partitions
+import archive
+import summary
+import serialization
+import models
+import payloads
+import search
+import ingest
+import sensor_logs
+from broadcast import BroadcastHub
+import scoring
+from batcher import MicroBatcher
+import metrics
+import executor
+import time
 
 # ==============================
 # FASTAPI INITIALIZATION
 # ==============================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load the scoring model and run the background workers (AI review, partition maintenance) for the lifetime of the app."""
+    await run_blocking(scoring.engine.load)
+    if ingest_pool is not None:
+        ingest_pool.start()
+    review_worker.start()
+    maintenance_worker.start()
+    yield
+    maintenance_worker.stop()
+    review_worker.stop()
+    if ingest_pool is not None:
+        ingest_pool.stop()
+
 app = FastAPI(
     title="AI Threat Detection Backend",
     description="Handles event ingestion, anomaly detection, and AI review.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-DB_FILE = "threat_events.db"
+DB_FILE = storage.DB_FILE
 
 # ==============================
 # DATABASE SETUP
 # ==============================
-def get_db_connection():
-    """Create a new SQLite connection with threading disabled for FastAPI use."""
-    return sqlite3.connect(DB_FILE, check_same_thread=False)
+# Ordered schema migrations applied by setup_database (tracked in PRAGMA user_version).
+# Append new steps; never edit or reorder existing ones.
+MIGRATIONS = [
+    # 1. Indexes for the threat feed and /threats keyset pagination
+    [
+        "CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events (timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS idx_events_anomaly_timestamp ON events (timestamp, id) WHERE is_anomaly = 1",
+        "CREATE INDEX IF NOT EXISTS idx_events_source_timestamp ON events (source, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS idx_events_type_timestamp ON events (event_type, timestamp, id)",
+    ],
+    # 2. Persistent Gemini review cache
+    review_cache.SCHEMA,
+    # 3. Per-minute event rollups (see partitions.py)
+    partitions.SCHEMA,
+    # 4. Confidence index for the dashboard summary (see summary.py)
+    summary.SCHEMA,
+    # 5. Typed payload columns (host, user, pid, ...) with lookup indexes (see payloads.py)
+    payloads.SCHEMA,
+    # 6. IOC match column and the FTS5 payload search index (see search.py)
+    search.SCHEMA,
+    # 7. Backfill progress for the typed payload columns of older events (see payloads.py)
+    payloads.BACKFILL_SCHEMA,
+    # 8. is_anomaly is the model verdict only: IOC matches reach the feed through ioc_match
+    [
+        "CREATE INDEX IF NOT EXISTS idx_events_threat_timestamp ON events (timestamp, id) "
+        "WHERE (is_anomaly = 1 OR ioc_match IS NOT NULL)",
+        f"""
+        UPDATE event_rollups SET anomalies = anomalies - fix.n
+        FROM (
+            SELECT substr(timestamp, 1, 16) AS minute, source, event_type, COUNT(*) AS n
+            FROM events
+            WHERE ioc_match IS NOT NULL AND is_anomaly = 1 AND anomaly_score <= {ingest.ANOMALY_THRESHOLD}
+            GROUP BY 1, 2, 3
+        ) AS fix
+        WHERE event_rollups.minute = fix.minute AND event_rollups.source = fix.source
+          AND event_rollups.event_type = fix.event_type
+        """,
+        f"UPDATE events SET is_anomaly = 0 WHERE ioc_match IS NOT NULL AND anomaly_score <= {ingest.ANOMALY_THRESHOLD}",
+    ],
+    # 9. Token-only search index, filled for older events by the maintenance backfill (see search.py)
+    search.INDEX_SCHEMA,
+]
 
 def setup_database():
     """Create tables for events and AI-reviewed threats."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            source TEXT,
-            event_type TEXT,
-            raw_data TEXT,
-            anomaly_score REAL,
-            is_anomaly INTEGER
-        )
-    """)
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS threat_detections (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_id INTEGER UNIQUE,
-            gemini_review TEXT,
-            mitigation_suggestion TEXT,
-            gemini_confidence REAL,
-            FOREIGN KEY (event_id) REFERENCES events(id)
-        )
-    """)
+    with storage.connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp TEXT,
+                source TEXT,
+                event_type TEXT,
+                raw_data TEXT,
+                anomaly_score REAL,
+                is_anomaly INTEGER
+            )
+        """)
 
-    conn.commit()
-    conn.close()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS threat_detections (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id INTEGER UNIQUE,
+                gemini_review TEXT,
+                mitigation_suggestion TEXT,
+                gemini_confidence REAL,
+                FOREIGN KEY (event_id) REFERENCES events(id)
+            )
+        """)
+
+        review_queue.setup_review_queue(cursor)
+
+        conn.commit()
+        storage.apply_migrations(conn, MIGRATIONS)
 
 setup_database()
 
 # ==============================
 # DATA MODELS
 # ==============================
-class RawEvent(BaseModel):
-    source: str
-    timestamp: str
-    event_type: str
-    data: str
-
-class ThreatResponse(BaseModel):
-    id: int
-    timestamp: str
-    source: str
-    event_type: str
-    anomaly_score: float
-    is_anomaly: bool
-    mitigation_suggestion: str = "N/A"
-    gemini_confidence: float = 0.0
+# Defined in models.py so ingestion worker processes can share them
+RawEvent = models.RawEvent
+ThreatResponse = models.ThreatResponse
 
 # ==============================
-# MOCK AI PIPELINES
+# AI PIPELINES
 # ==============================
 def ml_detection_pipeline(event: RawEvent) -> float:
     """
-    Mock ML anomaly detection using an "anomaly_factor" from data string.
-    In a real system, this would extract features and pass to Amber or Isolation Forest.
+    Anomaly score for a single event.
+    Prefer ml_detection_batch: the scoring engine is vectorized and much cheaper per row in batches.
     """
-    try:
-        if "anomaly_factor=" in event.data:
-            val = float(event.data.split("anomaly_factor=")[1].split(",")[0].strip())
-            return val
-    except Exception:
-        pass
-    return random.random()  # fallback if not found
+    return ml_detection_batch([event])[0]
+
+def ml_detection_batch(events: List[RawEvent], parsed: pd.DataFrame = None) -> List[float]:
+    """
+    Score a batch of events with the Isolation Forest scoring engine (see scoring.py).
+    Falls back to the demo "anomaly_factor" hint when no trained model is available.
+    `parsed` (ingest.parse_payloads of the events) avoids parsing the payloads twice.
+    Returns one anomaly score per event, in order.
+    """
+    with metrics.timed("ml_detection_pipeline"):
+        return ingest.score_events(events, parsed)
 
-def gemini_review_pipeline(event_data: str) -> dict:
+def ml_detection_parsed(events: List[RawEvent]) -> List[tuple]:
+    """
+    (anomaly score, parsed payload row) per event, in order: the micro-batcher's batch function.
+    Payloads are parsed once per batch; each caller passes its row on to store_events.
+    """
+    with metrics.timed("parse_payloads"):
+        parsed = ingest.parse_payloads(events)
+    scores = ml_detection_batch(events, parsed)
+    return [(score, parsed.iloc[[i]]) for i, score in enumerate(scores)]
+
+def gemini_review_pipeline(event_data: str, ioc_match: str = None) -> dict:
     """
     Mock Gemini review that analyzes a suspicious event and returns mitigation advice.
+    `ioc_match` lists the known-bad indicators the payload matched, if any.
     Replace this with an actual Gemini API call when integrating Google GenAI.
     """
+    if ioc_match:
+        return {
+            "review": f"Event matches known-bad indicator(s): {ioc_match}.",
+            "mitigation": "Block the indicator(s) at the perimeter, isolate the host and review related activity.",
+            "confidence": 0.95,
+        }
     # 80% chance to flag a high-confidence threat
     if random.random() < 0.8:
         return {
@@ -129,6 +222,347 @@ def gemini_review_pipeline(event_data: str) -> dict:
             "confidence": round(random.random() * 0.3, 2)
         }
 
+# ==============================
+# BATCH HELPERS
+# ==============================
+def parse_event_batch(body: bytes, content_type: str) -> List[RawEvent]:
+    """
+    Parse a batch request body into RawEvents.
+    Accepts either a JSON array of events or NDJSON (one event object per line).
+    """
+    with metrics.timed("parse"):
+        return models.parse_events(body, content_type)
+
+def ingest_events(events: List[RawEvent]) -> List[ThreatResponse]:
+    """
+    Score and store a list of events, queueing anomalies for Gemini review.
+    Payloads are parsed once, for scoring and for the typed payload columns.
+    """
+    with metrics.timed("parse_payloads"):
+        parsed = ingest.parse_payloads(events)
+    return store_events(events, ml_detection_batch(events, parsed), parsed)
+
+def store_events(events: List[RawEvent], scores: List[float], parsed: pd.DataFrame = None) -> List[ThreatResponse]:
+    """
+    Store already-scored events, queueing anomalies for Gemini review.
+    Events and review-queue entries are written with executemany in one transaction;
+    the background review worker writes threat_detections later.
+    """
+    rows = ingest.event_rows(events, scores, parsed)
+
+    with storage.connection() as conn:
+        event_ids = ingest.write_events(conn.cursor(), rows)
+        with metrics.timed("commit"):
+            conn.commit()
+
+    return ingest.responses(rows, event_ids)
+
+# Output column → SQL expression for the threat feed queries (order is the response column order)
+THREAT_FIELDS = {
+    "id": "e.id",
+    "timestamp": "e.timestamp",
+    "source": "e.source",
+    "event_type": "e.event_type",
+    "raw_data": "e.raw_data",
+    "anomaly_score": "e.anomaly_score",
+    "mitigation_suggestion": "td.mitigation_suggestion",
+    "gemini_confidence": "td.gemini_confidence",
+}
+DELTA_FIELDS = {"detection_id": "td.id", **THREAT_FIELDS}
+
+# Events on the threat feed: model anomalies and IOC matches (same expression as the
+# idx_events_threat_timestamp partial index, so the planner can use it)
+THREAT_CONDITION = "(e.is_anomaly = 1 OR e.ioc_match IS NOT NULL)"
+
+def select_list(fields: dict, columns: list = None, required: tuple = ()) -> str:
+    """SQL select list for the requested output columns plus any needed for paging."""
+    wanted = [c for c in fields if columns is None or c in columns or c in required]
+    return ", ".join(f"{fields[c]} AS {c}" for c in wanted)
+
+def query_latest_threats(columns: list = None) -> pd.DataFrame:
+    """Join event data with Gemini AI review results (latest 100 detections)."""
+    query = f"""
+        SELECT {select_list(THREAT_FIELDS, columns)}
+        FROM events e
+        INNER JOIN threat_detections td ON e.id = td.event_id
+        WHERE {THREAT_CONDITION}
+        ORDER BY e.timestamp DESC, e.id DESC
+        LIMIT 100
+    """
+    with storage.connection() as conn, metrics.timed("latest_threats_query"):
+        return pd.read_sql_query(query, conn)
+
+def encode_query(fmt: str, query, *args):
+    """Run a DataFrame query and encode its result, both on the blocking-work executor."""
+    result = query(*args)
+    frame, meta = result if isinstance(result, tuple) else (result, None)
+    with metrics.timed("serialize"):
+        return serialization.encode_frame(frame, fmt, meta)
+
+def encode_cursor(timestamp: str, event_id: int) -> str:
+    """Encode a (timestamp, id) keyset position as an opaque URL-safe cursor."""
+    return base64.urlsafe_b64encode(json.dumps([timestamp, event_id]).encode()).decode()
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a cursor produced by encode_cursor."""
+    try:
+        timestamp, event_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(timestamp), int(event_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def query_threats(limit: int = 100, cursor: str = None, source: str = None, event_type: str = None,
+                  min_score: float = None, max_score: float = None,
+                  min_confidence: float = None, max_confidence: float = None,
+                  since: str = None, until: str = None, columns: list = None) -> tuple:
+    """
+    Filtered, keyset-paginated threat query, newest first. Returns (rows, {"next_cursor"}).
+    Pages are ordered by (timestamp, id) DESC so each page is an index range scan
+    rather than an OFFSET over the whole table.
+    """
+    conditions = [THREAT_CONDITION]
+    params = []
+    for clause, value in [
+        ("e.source = ?", source),
+        ("e.event_type = ?", event_type),
+        ("e.anomaly_score >= ?", min_score),
+        ("e.anomaly_score <= ?", max_score),
+        ("td.gemini_confidence >= ?", min_confidence),
+        ("td.gemini_confidence <= ?", max_confidence),
+        ("e.timestamp >= ?", since),
+        ("e.timestamp < ?", until),
+    ]:
+        if value is not None:
+            conditions.append(clause)
+            params.append(value)
+    if cursor:
+        conditions.append("(e.timestamp, e.id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+
+    query = f"""
+        SELECT {select_list(THREAT_FIELDS, columns, required=("id", "timestamp"))}
+        FROM events e
+        INNER JOIN threat_detections td ON e.id = td.event_id
+        WHERE {" AND ".join(conditions)}
+        ORDER BY e.timestamp DESC, e.id DESC
+        LIMIT ?
+    """
+    with storage.connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params + [limit])
+
+    next_cursor = None
+    if len(df) == limit:
+        next_cursor = encode_cursor(df["timestamp"].iat[-1], int(df["id"].iat[-1]))
+    return (df[columns] if columns is not None else df), {"next_cursor": next_cursor}
+
+def query_threat_deltas(since_id: int = None, limit: int = 500, columns: list = None) -> tuple:
+    """
+    Detections written after the high-water mark `since_id`, oldest first.
+    Returns (rows, {"high_water_mark", "has_more"}).
+    The mark is threat_detections.id, which grows in write order even when the review
+    worker finishes events out of order. Without `since_id` the latest `limit`
+    detections are returned so a client can bootstrap its state.
+    """
+    selected = select_list(DELTA_FIELDS, columns, required=("detection_id",))
+    if since_id is None:
+        query = f"""
+            SELECT * FROM (
+                SELECT {selected}
+                FROM threat_detections td
+                INNER JOIN events e ON e.id = td.event_id
+                ORDER BY td.id DESC
+                LIMIT ?
+            ) ORDER BY detection_id
+        """
+        params = [limit]
+    else:
+        query = f"""
+            SELECT {selected}
+            FROM threat_detections td
+            INNER JOIN events e ON e.id = td.event_id
+            WHERE td.id > ?
+            ORDER BY td.id
+            LIMIT ?
+        """
+        params = [since_id, limit]
+
+    with storage.connection() as conn:
+        df = pd.read_sql_query(query, conn, params=params)
+
+    high_water_mark = int(df["detection_id"].iat[-1]) if len(df) else (since_id or 0)
+    meta = {"high_water_mark": high_water_mark, "has_more": len(df) == limit}
+    return (df[columns] if columns is not None else df), meta
+
+def query_detection_percentiles(since: str, until: str, interval: str = "hour", source: str = None) -> list:
+    """
+    Per-bucket, per-source count and p50/p90/p99 of anomaly score and Gemini confidence
+    for reviewed threats, computed in SQL with window functions (nearest-rank percentiles).
+    """
+    length, suffix = partitions.BUCKETS[interval]
+    conditions, params = [THREAT_CONDITION, "e.timestamp >= ?", "e.timestamp < ?"], [since, until]
+    if source is not None:
+        conditions.append("e.source = ?")
+        params.append(source)
+
+    def ranked(column):
+        return f"ROW_NUMBER() OVER (PARTITION BY bucket, source ORDER BY {column}) AS {column}_rank"
+
+    def pick(column, pct):
+        # nearest rank: smallest rank with rank >= pct% of n (integer arithmetic, no math extension needed)
+        return f"MIN(CASE WHEN {column}_rank * 100 >= {pct} * n THEN {column} END) AS {column}_p{pct}"
+
+    query = f"""
+        WITH detections AS (
+            SELECT substr(e.timestamp, 1, {length}) || '{suffix}' AS bucket, e.source,
+                   e.anomaly_score, td.gemini_confidence
+            FROM events e
+            INNER JOIN threat_detections td ON e.id = td.event_id
+            WHERE {" AND ".join(conditions)}
+        ),
+        ranked AS (
+            SELECT *, COUNT(*) OVER (PARTITION BY bucket, source) AS n,
+                   {ranked("anomaly_score")}, {ranked("gemini_confidence")}
+            FROM detections
+        )
+        SELECT bucket, source, n AS detections,
+               {", ".join(pick(c, p) for c in ("anomaly_score", "gemini_confidence") for p in (50, 90, 99))}
+        FROM ranked
+        GROUP BY bucket, source
+        ORDER BY bucket, source
+    """
+    with storage.connection() as conn, metrics.timed("aggregates_query"):
+        df = pd.read_sql_query(query, conn, params=params)
+    return df.to_dict(orient="records")
+
+def query_threat_aggregates(since: str, until: str, interval: str = "hour", source: str = None) -> list:
+    """
+    Time-bucketed trend rows per source: event/anomaly counts and score statistics
+    from the rollups, plus detection percentiles. Buckets without detections have null percentiles.
+    """
+    rows = {(r["bucket"], r["source"]): r for r in partitions.aggregate_rollups(since, until, interval, source)}
+    for row in query_detection_percentiles(since, until, interval, source):
+        # Detections whose events are outside the rollups (e.g. expired) still get a full row
+        rows.setdefault((row["bucket"], row["source"]), {
+            "bucket": row["bucket"], "source": row["source"], "events": 0, "anomalies": 0,
+            "score_mean": None, "score_std": None, "score_min": None, "score_max": None,
+        }).update(row)
+    return [rows[key] for key in sorted(rows)]
+
+def query_event_history(since: str, until: str, source: str = None, event_type: str = None,
+                        limit: int = 1000, fields: dict = None) -> list:
+    """
+    Events in [since, until) from SQLite (live + partitions) and the Parquet archive, newest first.
+    `fields` filters on typed payload columns, e.g. {"host": "10.0.0.42"} (see payloads.py).
+    """
+    rows = partitions.query_event_history(since, until, source, event_type, limit, fields)
+    rows += archive.query_archive(since, until, source, event_type, limit, fields=fields)
+    rows.sort(key=lambda r: (r["timestamp"], r["id"]), reverse=True)
+    return rows[:limit]
+
+def query_detections(event_ids: List[int]) -> list:
+    """Joined detection rows (same shape as /threats/delta items) for the given event ids."""
+    placeholders = ",".join("?" * len(event_ids))
+    query = f"""
+        SELECT
+            td.id AS detection_id, e.id, e.timestamp, e.source, e.event_type, e.raw_data,
+            e.anomaly_score, td.mitigation_suggestion, td.gemini_confidence
+        FROM threat_detections td
+        INNER JOIN events e ON e.id = td.event_id
+        WHERE td.event_id IN ({placeholders})
+        ORDER BY td.id
+    """
+    with storage.connection() as conn:
+        df = pd.read_sql_query(query, conn, params=list(event_ids))
+    return df.to_dict(orient="records")
+
+# ==============================
+# INFERENCE MICRO-BATCHER
+# ==============================
+# Single-event ingests share one model call per batch (see batcher.py for tuning knobs)
+scoring_batcher = MicroBatcher(ml_detection_parsed)
+
+# ==============================
+# MULTI-PROCESS INGESTION
+# ==============================
+# THREAT_INGEST_MODE=multiprocess: scoring worker processes + a single group-committing writer (see ingest.py)
+ingest_pool = ingest.IngestPool() if ingest.INGEST_MODE == "multiprocess" else None
+
+# ==============================
+# LIVE STREAM + BACKGROUND REVIEW WORKER
+# ==============================
+threat_hub = BroadcastHub()
+STREAM_HEARTBEAT = 15  # seconds between SSE keep-alive comments
+
+def publish_detections(event_ids: List[int]):
+    """Fan newly committed detections out to live stream subscribers."""
+    if threat_hub.subscriber_count == 0:
+        return
+    for row in query_detections(event_ids):
+        threat_hub.publish(row)
+
+def format_sse(row: dict) -> str:
+    """Format one detection row as a Server-Sent Events message."""
+    return f"id: {row['detection_id']}\nevent: threat\ndata: {json.dumps(row)}\n\n"
+
+review_results = review_cache.ReviewCache()
+review_worker = review_queue.ReviewWorker(
+    reviewer=review_results.wrap(gemini_review_pipeline),
+    on_reviewed=publish_detections
+)
+
+def after_rotate() -> dict:
+    """Maintenance between rotation and retention: archive cold partitions, trim the search index, expire cached reviews."""
+    return {
+        **archive.run_archival(),
+        **search.run_maintenance(),
+        "review_cache_purged": review_results.purge_expired(),
+    }
+
+def before_rotate() -> dict:
+    """Maintenance before rotation: backfill payload columns and the search index while the rows are still here."""
+    return {**payloads.backfill(), **search.backfill()}
+
+maintenance_worker = partitions.MaintenanceWorker(after_rotate=after_rotate, before_rotate=before_rotate)
+
+# Dashboard headline numbers, recomputed at most once per THREAT_SUMMARY_TTL
+summary_service = summary.SummaryService()
+
+# ==============================
+# METRICS GAUGES
+# ==============================
+metrics.Gauge("threat_db_pool_in_use", "SQLite connections checked out.").set_function(
+    lambda: storage.get_pool().in_use)
+metrics.Gauge("threat_db_pool_size", "SQLite connection pool capacity.").set_function(
+    lambda: storage.get_pool().size)
+metrics.Gauge("threat_executor_workers", "Threads available for blocking work.").set_function(
+    lambda: executor.EXECUTOR_WORKERS)
+metrics.Gauge("threat_review_queue_depth", "Queued reviews by status.", labels=("status",)).set_function(
+    review_queue.queue_depth)
+metrics.Gauge("threat_stream_subscribers", "Connected live-stream subscribers.").set_function(
+    lambda: threat_hub.subscriber_count)
+metrics.Gauge("threat_inference_batches", "Micro-batches run by the scoring batcher.").set_function(
+    lambda: scoring_batcher.batches)
+metrics.Gauge("threat_writer_backlog", "Scored batches waiting for the writer process.").set_function(
+    lambda: ingest_pool.writer_backlog if ingest_pool is not None else 0)
+metrics.Gauge("threat_review_cache", "Review cache counters.", labels=("kind",)).set_function(
+    lambda: {k: v for k, v in review_results.stats().items() if k != "hit_ratio"})
+
+app.add_middleware(serialization.CompressionMiddleware)
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Per-route request latency histogram."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - start,
+        method=request.method,
+        route=route.path if route else "unmatched",
+        status=response.status_code
+    )
+    return response
+
 # ==============================
 # API ROUTES
 # ==============================
@@ -136,74 +570,335 @@ def gemini_review_pipeline(event_data: str) -> dict:
 @app.post("/ingest_data", response_model=ThreatResponse)
 async def ingest_data(event: RawEvent):
     """
-    Endpoint to ingest an event, run ML detection, and trigger Gemini review if needed.
+    Endpoint to ingest an event, run ML detection, and queue Gemini review if needed.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    anomaly_score, parsed = await scoring_batcher.submit(event)
+    if ingest_pool is not None:
+        responses = await ingest_pool.store([event], [anomaly_score], parsed)
+    else:
+        responses = await run_blocking(store_events, [event], [anomaly_score], parsed)
+    return responses[0]
 
-    # 1. Run ML anomaly detection
-    anomaly_score = ml_detection_pipeline(event)
-    is_anomaly = 1 if anomaly_score > 0.5 else 0
+@app.post("/ingest_batch", response_model=List[ThreatResponse])
+async def ingest_batch(request: Request):
+    """
+    Endpoint to ingest many events in one request.
+    Body is a JSON array of RawEvents or an NDJSON stream (Content-Type: application/x-ndjson).
+    All events are scored together and stored in a single transaction
+    (in multiprocess mode: scored in a worker process and group-committed by the writer).
+    """
+    body = await request.body()
+    if ingest_pool is not None:
+        return await ingest_pool.ingest_body(body, request.headers.get("content-type", ""))
+    events = await run_blocking(parse_event_batch, body, request.headers.get("content-type", ""))
+    if not events:
+        return []
+    return await run_blocking(ingest_events, events)
 
-    # 2. Store raw event
-    cursor.execute("""
-        INSERT INTO events (timestamp, source, event_type, raw_data, anomaly_score, is_anomaly)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (event.timestamp, event.source, event.event_type, event.data, anomaly_score, is_anomaly))
-    conn.commit()
+# ==============================
+# LOG FILE UPLOADS
+# ==============================
+LOG_UPLOAD_HISTORY = 100  # finished uploads kept for progress lookups
+log_uploads = OrderedDict()  # upload id -> progress dict
 
-    event_id = cursor.lastrowid
+def _upload_progress(upload_id: str, parser, events: int, batches: int, started: float, status: str) -> dict:
+    elapsed = time.monotonic() - started
+    return {
+        "upload_id": upload_id,
+        "status": status,
+        "format": parser.format,
+        "bytes": parser.bytes,
+        "lines": parser.lines,
+        "events": events,
+        "skipped": parser.skipped,
+        "batches": batches,
+        "elapsed_s": round(elapsed, 3),
+        "events_per_s": round(events / elapsed, 1) if elapsed else 0.0,
+    }
 
-    # Default response values
-    mitigation = "N/A - Below Anomaly Threshold"
-    confidence = 0.0
+async def store_log_batch(events: List[RawEvent]):
+    if ingest_pool is not None:
+        await ingest_pool.store(events)  # scored on the worker processes
+    else:
+        await run_blocking(ingest_events, events)
 
-    # 3. Run Gemini AI review for anomalies
-    if is_anomaly:
-        review = gemini_review_pipeline(event.data)
-        cursor.execute("""
-            INSERT INTO threat_detections (event_id, gemini_review, mitigation_suggestion, gemini_confidence)
-            VALUES (?, ?, ?, ?)
-        """, (event_id, review["review"], review["mitigation"], review["confidence"]))
-        conn.commit()
+@app.post("/ingest/logs")
+async def ingest_logs(
+    request: Request,
+    format: str = Query("auto", pattern="^(auto|zeek|zeek_json|osquery|ndjson)$"),
+    batch_size: int = Query(5000, ge=1, le=50000),
+    upload_id: Optional[str] = None,
+):
+    """
+    Streaming upload of Zeek (TSV or JSON), osquery result or RawEvent NDJSON log files.
+    The body is parsed chunk by chunk (Content-Encoding: gzip is inflated on the fly) and
+    stored in batches of `batch_size`. Pass an `upload_id` to follow progress at
+    GET /ingest/logs/{upload_id} while the upload runs; the final counts are returned.
+    """
+    upload_id = upload_id or uuid.uuid4().hex
+    parser = sensor_logs.LogStreamParser(format, gzip=request.headers.get("content-encoding") == "gzip")
+    started = time.monotonic()
+    events_stored, batches, pending = 0, 0, []
 
-        mitigation = review["mitigation"]
-        confidence = review["confidence"]
-
-    conn.close()
-
-    # 4. Return structured response
-    return ThreatResponse(
-        id=event_id,
-        timestamp=event.timestamp,
-        source=event.source,
-        event_type=event.event_type,
-        anomaly_score=anomaly_score,
-        is_anomaly=bool(is_anomaly),
-        mitigation_suggestion=mitigation,
-        gemini_confidence=confidence
-    )
+    def progress(status: str) -> dict:
+        log_uploads[upload_id] = _upload_progress(upload_id, parser, events_stored, batches, started, status)
+        log_uploads.move_to_end(upload_id)
+        while len(log_uploads) > LOG_UPLOAD_HISTORY:
+            log_uploads.popitem(last=False)
+        return log_uploads[upload_id]
+
+    progress("running")
+    try:
+        async for chunk in request.stream():
+            pending.extend(await run_blocking(parser.feed, chunk))
+            while len(pending) >= batch_size:
+                batch, pending = pending[:batch_size], pending[batch_size:]
+                await store_log_batch(batch)
+                events_stored, batches = events_stored + len(batch), batches + 1
+                progress("running")
+        pending.extend(await run_blocking(parser.finish))
+        if pending:
+            await store_log_batch(pending)
+            events_stored, batches = events_stored + len(pending), batches + 1
+    except zlib.error as e:
+        progress("failed")
+        raise HTTPException(status_code=400, detail=f"Corrupt gzip body: {e}")
+    except Exception:
+        progress("failed")
+        raise
+    return progress("done")
+
+@app.get("/ingest/logs/{upload_id}")
+async def get_log_upload(upload_id: str):
+    """Progress of a running (or recently finished) log upload."""
+    if upload_id not in log_uploads:
+        raise HTTPException(status_code=404, detail="Unknown upload id")
+    return log_uploads[upload_id]
+
+# Shared response-shaping parameters (see serialization.py)
+FORMAT_QUERY = Query(None, description="json (default), columnar or arrow; overrides the Accept header")
+FIELDS_QUERY = Query(None, description="Comma-separated columns to return")
+EXCLUDE_QUERY = Query(None, description="Comma-separated columns to leave out, e.g. raw_data")
 
 @app.get("/get_latest_threats")
-async def get_latest_threats():
+async def get_latest_threats(
+    request: Request,
+    format: Optional[str] = FORMAT_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+    exclude: Optional[str] = EXCLUDE_QUERY,
+):
     """
     Endpoint for Streamlit dashboard to fetch latest reviewed threats.
     Joins event data with Gemini AI review results.
     """
-    conn = get_db_connection()
-    query = """
-        SELECT
-            e.id, e.timestamp, e.source, e.event_type, e.raw_data,
-            e.anomaly_score, td.mitigation_suggestion, td.gemini_confidence
-        FROM events e
-        INNER JOIN threat_detections td ON e.id = td.event_id
-        ORDER BY e.timestamp DESC
-        LIMIT 100
+    fmt = serialization.negotiate(request, format)
+    columns = serialization.select_fields(list(THREAT_FIELDS), fields, exclude)
+    return await run_blocking(encode_query, fmt, query_latest_threats, columns)
+
+@app.get("/threats")
+async def get_threats(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    min_score: Optional[float] = None,
+    max_score: Optional[float] = None,
+    min_confidence: Optional[float] = None,
+    max_confidence: Optional[float] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    format: Optional[str] = FORMAT_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+    exclude: Optional[str] = EXCLUDE_QUERY,
+):
+    """
+    Query reviewed threats with filters and cursor pagination.
+    Pass the returned `next_cursor` back as `cursor` to fetch the next (older) page
+    (for format=arrow it is in the X-Next-Cursor header).
     """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    fmt = serialization.negotiate(request, format)
+    columns = serialization.select_fields(list(THREAT_FIELDS), fields, exclude)
+    return await run_blocking(
+        encode_query, fmt, query_threats, limit, cursor, source, event_type,
+        min_score, max_score, min_confidence, max_confidence, since, until, columns
+    )
 
-    return df.to_dict(orient="records")
+@app.get("/threats/delta")
+async def get_threat_deltas(
+    request: Request,
+    since_id: Optional[int] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    format: Optional[str] = FORMAT_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+    exclude: Optional[str] = EXCLUDE_QUERY,
+):
+    """
+    Incremental feed for dashboard polling.
+    Returns only detections newer than `since_id`; pass the returned
+    `high_water_mark` as `since_id` on the next poll.
+    """
+    fmt = serialization.negotiate(request, format)
+    columns = serialization.select_fields(list(DELTA_FIELDS), fields, exclude)
+    return await run_blocking(encode_query, fmt, query_threat_deltas, since_id, limit, columns)
+
+@app.get("/threats/aggregates")
+async def get_threat_aggregates(
+    since: str,
+    until: str,
+    interval: str = Query("hour", pattern="^(minute|hour|day)$"),
+    source: Optional[str] = None,
+):
+    """Counts and score/confidence percentiles per source per interval, for trend charts."""
+    return await run_blocking(query_threat_aggregates, since, until, interval, source)
+
+@app.get("/threats/stream")
+async def stream_threats(request: Request):
+    """
+    Server-Sent Events stream of new detections as the review worker writes them.
+    Reconnecting clients send Last-Event-ID and get the missed detections replayed first;
+    otherwise the stream performs no database queries while idle.
+    """
+    last_event_id = request.headers.get("last-event-id")
+    subscription = threat_hub.subscribe()
+
+    async def event_stream():
+        try:
+            last_sent = 0
+            if last_event_id and last_event_id.isdigit():
+                last_sent = int(last_event_id)
+                while True:
+                    missed, meta = await run_blocking(query_threat_deltas, last_sent, 500)
+                    for row in missed.to_dict(orient="records"):
+                        yield format_sse(row)
+                    last_sent = meta["high_water_mark"]
+                    if not meta["has_more"]:
+                        break
+
+            while not await request.is_disconnected():
+                try:
+                    row = await subscription.get(timeout=STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if row is None:  # fell behind and was dropped; client reconnects with Last-Event-ID
+                    break
+                if row["detection_id"] > last_sent:
+                    yield format_sse(row)
+        finally:
+            threat_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/summary")
+async def get_summary():
+    """Headline counts for the dashboard (cached for THREAT_SUMMARY_TTL seconds)."""
+    return await run_blocking(summary_service.get)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus scrape endpoint."""
+    body = await run_blocking(metrics.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profile", response_class=PlainTextResponse)
+async def profile(seconds: float = Query(5.0, gt=0, le=60), interval_ms: float = Query(5.0, ge=1, le=1000)):
+    """
+    Sample all thread stacks for `seconds` and return collapsed stacks for a flame graph.
+    Only available when THREAT_ENABLE_PROFILER=1.
+    """
+    if not metrics.PROFILER_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiler disabled (set THREAT_ENABLE_PROFILER=1)")
+    return await asyncio.to_thread(metrics.sample_stacks, seconds, interval_ms / 1000)
+
+@app.get("/rollups")
+async def get_rollups(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    limit: int = Query(10000, ge=1, le=100000),
+):
+    """Per-minute event counts and anomaly score statistics (kept longer than raw events)."""
+    return await run_blocking(partitions.query_rollups, since, until, source, event_type, limit)
+
+@app.get("/events/history")
+async def get_event_history(
+    since: str,
+    until: str,
+    source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10000),
+    host: Optional[str] = Query(None, description="osquery host or Zeek id.orig_h"),
+    user: Optional[str] = None,
+    pid: Optional[int] = None,
+    dst_ip: Optional[str] = Query(None, description="Zeek id.resp_h"),
+    query: Optional[str] = Query(None, description="DNS query name"),
+):
+    """
+    Raw events in [since, until) across the live table, daily partition files and Parquet archives.
+    host / user / pid / dst_ip / query filter on the typed payload columns (indexed lookups).
+    """
+    fields = {"host": host, "user": user, "pid": pid, "dst_ip": dst_ip, "query": query}
+    return await run_blocking(query_event_history, since, until, source, event_type, limit, fields)
+
+@app.get("/events/archive")
+async def get_archived_events(
+    since: str,
+    until: str,
+    source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    columns: Optional[str] = Query(None, description="Comma-separated archive columns, e.g. query,orig_h"),
+    limit: int = Query(1000, ge=1, le=100000),
+):
+    """
+    Forensic query over the Parquet archive only, with column projection.
+    Columns: id, timestamp, source, event_type, anomaly_score, is_anomaly, raw_data (default set)
+    and the typed payload columns host, user, pid, path, cmdline, orig_h, resp_h, query, proto.
+    """
+    selected = [c.strip() for c in columns.split(",") if c.strip()] if columns else None
+    return await run_blocking(archive.query_archive, since, until, source, event_type, limit, selected)
+
+@app.get("/search")
+async def search_events(
+    request: Request,
+    q: Optional[str] = Query(None, description="Terms to find in event payloads, e.g. evil.example 10.0.0.42"),
+    syntax: str = Query("terms", pattern="^(terms|fts)$", description="terms: all terms as phrases; fts: raw FTS5 query"),
+    ioc_only: bool = False,
+    source: Optional[str] = None,
+    event_type: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, pattern=r"^\d+$"),
+    format: Optional[str] = FORMAT_QUERY,
+    fields: Optional[str] = FIELDS_QUERY,
+    exclude: Optional[str] = EXCLUDE_QUERY,
+):
+    """
+    Full-text search over event payloads (FTS5 index), newest first, optionally limited to
+    events that matched a known-bad indicator. Pass `next_cursor` back as `cursor` for older results.
+
+    Search window: the same events /events/history returns, i.e. the live table, partition
+    files (THREAT_RETENTION_DAYS) and archived days (THREAT_ARCHIVE_RETENTION_DAYS). Days
+    archived before their search index existed are indexed by the next maintenance run.
+    ioc_only without q covers IOC-flagged events, which stay in the live table.
+    """
+    fmt = serialization.negotiate(request, format)
+    columns = serialization.select_fields(search.FIELDS, fields, exclude)
+    return await run_blocking(
+        encode_query, fmt, search.search_events, q, syntax, limit, cursor,
+        source, event_type, since, until, ioc_only, columns
+    )
+
+@app.get("/search/iocs")
+async def get_ioc_status():
+    """Loaded IOC set: file, number of indicators and when it was last (re)loaded."""
+    return await run_blocking(search.iocs.status)
 
 # ==============================
 # STARTUP MESSAGE
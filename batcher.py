@@ -0,0 +1,105 @@
+# batcher.py
+"""
+Micro-Batching Scheduler for Model Inference
+--------------------------------------------
+Handles:
+- Gathering items submitted by concurrent requests for up to `max_batch_size`
+  items or `max_wait_ms` milliseconds, whichever comes first
+- Running one batched call (on the blocking-work executor) for the whole group
+- Resolving each caller's future with its own result
+
+Callers keep a per-item API (`await batcher.submit(item)`) while the model
+sees batches. When no batch is running, items are flushed on the next loop
+tick, so an idle backend adds no batching delay.
+
+Configuration (environment variables):
+    INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS
+"""
+
+import asyncio
+import os
+import weakref
+
+from executor import run_blocking
+
+# ==============================
+# CONFIGURATION
+# ==============================
+INFERENCE_MAX_BATCH = int(os.environ.get("INFERENCE_MAX_BATCH", "64"))
+INFERENCE_MAX_WAIT_MS = float(os.environ.get("INFERENCE_MAX_WAIT_MS", "5"))
+
+# ==============================
+# MICRO-BATCHER
+# ==============================
+class _LoopState:
+    """Pending items and flush timer for one event loop."""
+
+    def __init__(self):
+        self.items = []
+        self.timer = None
+        self.tasks = set()
+
+class MicroBatcher:
+    """
+    Collects items across concurrent `submit()` calls and runs `batch_fn(items) -> results`
+    once per batch. `batch_fn` is blocking and must return one result per item, in order.
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = INFERENCE_MAX_BATCH, max_wait_ms: float = INFERENCE_MAX_WAIT_MS):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._states = weakref.WeakKeyDictionary()  # event loop -> _LoopState
+        self.batches = 0
+        self.items = 0
+
+    def _state(self, loop) -> _LoopState:
+        state = self._states.get(loop)
+        if state is None:
+            state = self._states[loop] = _LoopState()
+        return state
+
+    async def submit(self, item):
+        """Queue `item` for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        state = self._state(loop)
+        future = loop.create_future()
+        state.items.append((item, future))
+
+        if len(state.items) >= self.max_batch_size:
+            self._flush(state)
+        elif state.timer is None:
+            # Idle: flush on the next loop tick so a lone request does not pay max_wait.
+            # Busy: let items accumulate while the running batch finishes (or max_wait passes).
+            delay = self.max_wait if state.tasks else 0
+            state.timer = loop.call_later(delay, self._flush, state)
+        return await future
+
+    def _flush(self, state: _LoopState):
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        batch, state.items = state.items, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            state.tasks.add(task)  # keep a reference until the batch finishes
+            task.add_done_callback(lambda t: self._batch_done(state, t))
+
+    def _batch_done(self, state: _LoopState, task):
+        state.tasks.discard(task)
+        if state.items and not state.tasks:
+            self._flush(state)  # items queued up while the model was busy
+
+    async def _run(self, batch: list):
+        self.batches += 1
+        self.items += len(batch)
+        try:
+            results = await run_blocking(self.batch_fn, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():  # caller may have been cancelled
+                future.set_result(result)
@@ -0,0 +1,254 @@
+# bench.py
+"""
+Benchmark Suite for the AI Threat Detection Backend
+---------------------------------------------------
+Measures, against an in-process FastAPI TestClient and a temporary SQLite file:
+- Single-event ingest (/ingest_data) and bulk ingest (/ingest_batch): events/s and latency percentiles
+- Query latency (/get_latest_threats, /threats, /threats/delta) as a function of table size
+- Scoring throughput (ml_detection_batch) and review throughput (gemini_review_pipeline)
+
+Results are written as JSON so runs can be compared:
+    python bench.py --out bench_results.json
+    python bench.py --sizes 10000 100000 1000000 10000000 --out big.json
+    python bench.py --compare old.json new.json
+
+The temporary databases are deleted on exit; pass --keep to inspect them afterwards.
+"""
+
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# Point the backend at a throwaway database before it is imported
+_TMP_DIR = tempfile.mkdtemp(prefix="threat-bench-")
+_cleanup = lambda: shutil.rmtree(_TMP_DIR, ignore_errors=True)
+atexit.register(_cleanup)
+os.environ.setdefault("THREAT_DB_FILE", os.path.join(_TMP_DIR, "bench.db"))
+
+from fastapi.testclient import TestClient
+import pandas as pd
+
+import backend
+import client
+import storage
+
+# ==============================
+# HELPERS
+# ==============================
+def percentiles(samples_ms: list) -> dict:
+    """p50/p95/p99/max/mean of a list of millisecond timings."""
+    if not samples_ms:
+        return {}
+    ordered = sorted(samples_ms)
+    pick = lambda p: ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+    return {
+        "p50_ms": round(pick(50), 3),
+        "p95_ms": round(pick(95), 3),
+        "p99_ms": round(pick(99), 3),
+        "max_ms": round(ordered[-1], 3),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+    }
+
+def fresh_database(name: str):
+    """Point the storage pool at a new, empty database file in the temp dir."""
+    path = os.path.join(_TMP_DIR, f"{name}.db")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    storage.configure(db_file=path)
+    backend.setup_database()
+    return path
+
+def mock_events(count: int) -> list:
+    return [client.generate_mock_event(random.choice(["osquery", "zeek"])) for _ in range(count)]
+
+def timed_requests(send, count: int, events_per_request: int = 0) -> dict:
+    """Call `send()` `count` times; report throughput and latency percentiles."""
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(count):
+        t0 = time.perf_counter()
+        response = send()
+        latencies.append((time.perf_counter() - t0) * 1000)
+        response.raise_for_status()
+    elapsed = time.perf_counter() - start
+    result = {"requests": count, "elapsed_s": round(elapsed, 3), "requests_per_s": round(count / elapsed, 1)}
+    if events_per_request:
+        result["events"] = count * events_per_request
+        result["events_per_s"] = round(count * events_per_request / elapsed, 1)
+    return {**result, **percentiles(latencies)}
+
+# ==============================
+# BENCHMARKS
+# ==============================
+def bench_ingest(api: TestClient, requests: int, batch_sizes: list) -> dict:
+    """Single-event and bulk ingest throughput."""
+    results = {}
+    fresh_database("ingest_single")
+    events = mock_events(requests)
+    it = iter(events)
+    results["single"] = timed_requests(lambda: api.post("/ingest_data", json=next(it)), requests, 1)
+
+    for size in batch_sizes:
+        fresh_database(f"ingest_batch_{size}")
+        batches = [mock_events(size) for _ in range(max(1, requests // size))]
+        it = iter(batches)
+        results[f"batch_{size}"] = timed_requests(lambda: api.post("/ingest_batch", json=next(it)), len(batches), size)
+    return results
+
+def populate(rows: int, chunk: int = 100000, anomaly_rate: float = 0.2):
+    """Bulk-load `rows` synthetic events (and detections for the anomalous ones)."""
+    base = datetime(2026, 1, 1)
+    templates = mock_events(200)
+    written = 0
+    with storage.connection() as conn:
+        while written < rows:
+            n = min(chunk, rows - written)
+            event_rows, detection_rows = [], []
+            for i in range(n):
+                event_id = written + i + 1
+                template = templates[event_id % len(templates)]
+                anomalous = random.random() < anomaly_rate
+                score = random.uniform(0.5, 1.0) if anomalous else random.uniform(0.0, 0.5)
+                event_rows.append((
+                    event_id, (base + timedelta(seconds=event_id)).isoformat(), template["source"],
+                    template["event_type"], template["data"], score, int(anomalous)
+                ))
+                if anomalous:
+                    detection_rows.append((event_id, "bench review", "bench mitigation", round(random.random(), 2)))
+            with conn:
+                conn.executemany("""
+                    INSERT INTO events (id, timestamp, source, event_type, raw_data, anomaly_score, is_anomaly)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, event_rows)
+                conn.executemany("""
+                    INSERT INTO threat_detections (event_id, gemini_review, mitigation_suggestion, gemini_confidence)
+                    VALUES (?, ?, ?, ?)
+                """, detection_rows)
+            written += n
+        conn.execute("ANALYZE")
+
+def bench_queries(api: TestClient, sizes: list, repeats: int) -> dict:
+    """Query latency per endpoint at each table size."""
+    queries = {
+        "get_latest_threats": ("/get_latest_threats", {}),
+        "threats_first_page": ("/threats", {"limit": 100}),
+        "threats_filtered": ("/threats", {"source": "zeek", "min_confidence": 0.5, "limit": 100}),
+        "threats_delta_tail": ("/threats/delta", {"limit": 100}),
+    }
+    results = {}
+    for size in sizes:
+        fresh_database(f"query_{size}")
+        t0 = time.perf_counter()
+        populate(size)
+        load_s = time.perf_counter() - t0
+        results[str(size)] = {"load_s": round(load_s, 2)}
+        for name, (path, params) in queries.items():
+            results[str(size)][name] = timed_requests(lambda: api.get(path, params=params), repeats)
+    return results
+
+def bench_scoring(events: int, batch_sizes: list, review_calls: int) -> dict:
+    """Scoring and review throughput without HTTP or storage."""
+    results = {}
+    backend.scoring.engine.load()
+    results["model_loaded"] = backend.scoring.engine.model is not None
+    pool = [backend.RawEvent(**e) for e in mock_events(events)]
+    for size in batch_sizes:
+        start = time.perf_counter()
+        for i in range(0, len(pool), size):
+            backend.ml_detection_batch(pool[i:i + size])
+        elapsed = time.perf_counter() - start
+        results[f"ml_detection_batch_{size}"] = {"events": len(pool), "events_per_s": round(len(pool) / elapsed, 1)}
+
+    start = time.perf_counter()
+    for event in pool[:review_calls]:
+        backend.gemini_review_pipeline(event.data)
+    elapsed = time.perf_counter() - start
+    results["gemini_review_pipeline"] = {"calls": review_calls, "calls_per_s": round(review_calls / elapsed, 1)}
+    return results
+
+# ==============================
+# RUN / COMPARE
+# ==============================
+def metadata() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+    }
+
+def compare(old_path: str, new_path: str):
+    """Print the relative change of every numeric metric between two result files."""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    def walk(a, b, prefix=""):
+        for key, value in b.items():
+            if isinstance(value, dict) and isinstance(a.get(key), dict):
+                walk(a[key], value, f"{prefix}{key}.")
+            elif isinstance(value, (int, float)) and isinstance(a.get(key), (int, float)) and a[key]:
+                change = (value - a[key]) / a[key] * 100
+                print(f"{prefix}{key:<40} {a[key]:>12g} → {value:>12g}  ({change:+.1f}%)")
+
+    walk(old.get("results", {}), new.get("results", {}))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend benchmark suite")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--requests", type=int, default=1000, help="ingest requests per scenario")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="table sizes for query benchmarks")
+    parser.add_argument("--query-repeats", type=int, default=50)
+    parser.add_argument("--scoring-events", type=int, default=20000)
+    parser.add_argument("--only", choices=["ingest", "queries", "scoring"], nargs="+")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files and exit")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary databases")
+    args = parser.parse_args()
+
+    if args.keep:
+        atexit.unregister(_cleanup)
+        print(f"📁 Temporary databases kept in {_TMP_DIR}")
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    random.seed(args.seed)
+    selected = set(args.only or ["ingest", "queries", "scoring"])
+    api = TestClient(backend.app)  # no lifespan: the review worker stays off so only the measured path runs
+    results = {}
+
+    if "scoring" in selected:
+        print("▶ scoring ...")
+        results["scoring"] = bench_scoring(args.scoring_events, args.batch_sizes, min(args.scoring_events, 10000))
+    if "ingest" in selected:
+        print("▶ ingest ...")
+        results["ingest"] = bench_ingest(api, args.requests, args.batch_sizes)
+    if "queries" in selected:
+        print("▶ queries ...")
+        results["queries"] = bench_queries(api, args.sizes, args.query_repeats)
+
+    report = {"meta": {**metadata(), "args": vars(args)}, "results": results}
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"✅ Results written to {args.out}")
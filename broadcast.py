@@ -0,0 +1,95 @@
+# broadcast.py
+"""
+In-Process Broadcast Hub for Live Threat Streaming
+--------------------------------------------------
+Handles:
+- Fan-out of newly written threat detections to every connected stream subscriber
+- Bounded per-subscriber buffers; a subscriber that falls behind is dropped
+  (its stream ends and the client reconnects with Last-Event-ID to catch up)
+- Thread-safe publishing, so the background review worker can publish directly
+
+Subscribers are created on the asyncio event loop serving the stream;
+`publish()` may be called from any thread.
+"""
+
+import asyncio
+import os
+import threading
+
+# ==============================
+# CONFIGURATION
+# ==============================
+STREAM_BUFFER_SIZE = int(os.environ.get("STREAM_BUFFER_SIZE", "256"))  # messages buffered per subscriber
+
+# ==============================
+# SUBSCRIPTION
+# ==============================
+class Subscription:
+    """One subscriber's bounded message buffer."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, buffer_size: int):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=buffer_size)
+        self.dropped = False
+
+    def _offer(self, message):
+        """Runs on the subscriber's loop. Drops the subscriber if its buffer is full."""
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped = True
+            # Make room for the sentinel that wakes the consumer up
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout: float = None):
+        """Next message, or None if this subscriber was dropped. Raises asyncio.TimeoutError on timeout."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+# ==============================
+# BROADCAST HUB
+# ==============================
+class BroadcastHub:
+    """Fan-out hub with slow-consumer dropping."""
+
+    def __init__(self, buffer_size: int = STREAM_BUFFER_SIZE):
+        self.buffer_size = buffer_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self) -> Subscription:
+        """Register a subscriber on the running event loop."""
+        sub = Subscription(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.discard(sub)
+                self.dropped += sub.dropped
+
+    def publish(self, message):
+        """Deliver `message` to every subscriber. Safe to call from any thread."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self.published += 1
+        for sub in subscribers:
+            if sub.dropped:
+                self.unsubscribe(sub)
+                continue
+            try:
+                sub.loop.call_soon_threadsafe(sub._offer, message)
+            except RuntimeError:  # subscriber's loop already closed
+                self.unsubscribe(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
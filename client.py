@@ -3,28 +3,50 @@
 Simulated Data Ingestion Client
 --------------------------------
 Sends mock osquery and Zeek events to the FastAPI backend.
-Useful for demonstrating live ingestion and AI-based anomaly review.
+Useful for demonstrating live ingestion and AI-based anomaly review,
+and for load-testing the backend.
+
+Usage:
+    python client.py                      # demo: one osquery + one Zeek event per second
+    python client.py demo --spool /var/tmp/threat_spool.db
+    python client.py load --rate 2000 --hosts 500 --duration 30 --batch-size 100
+    python client.py upload /opt/zeek/logs/current/dns.log.gz --gzip
 """
 
-import requests
 import time
 import json
 from datetime import datetime
 import random
+import argparse
+import asyncio
+import bisect
+import os
+import threading
+import uuid
+import httpx
+from spool import Spool, Shipper, SPOOL_PATH
 
 # ==============================
 # CONFIGURATION
 # ==============================
-API_URL = "http://127.0.0.1:8000/ingest_data"  # FastAPI endpoint
+BASE_URL = "http://127.0.0.1:8000"
+API_URL = f"{BASE_URL}/ingest_data"  # FastAPI endpoint
+BATCH_API_URL = f"{BASE_URL}/ingest_batch"
+LOGS_API_URL = f"{BASE_URL}/ingest/logs"
+UPLOAD_CHUNK_BYTES = 1024 * 1024
 SEND_INTERVAL = 1  # seconds between sending events
 
+# Latency histogram bucket upper bounds (milliseconds)
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf")]
+
 # ==============================
 # MOCK EVENT GENERATOR
 # ==============================
-def generate_mock_event(source: str) -> dict:
+def generate_mock_event(source: str, host: str = None) -> dict:
     """
     Generates a mock log event resembling osquery or Zeek output.
     Includes a random anomaly factor to simulate threat scoring.
+    `host` pins the Zeek originating address to one simulated host.
     """
     timestamp = datetime.now().isoformat()
     anomaly_factor = 0.0 if random.random() < 0.8 else random.uniform(0.5, 1.0)
@@ -47,7 +69,7 @@ def generate_mock_event(source: str) -> dict:
             "timestamp": timestamp,
             "event_type": "dns_query",
             "data": (
-                f"id.orig_h=10.0.0.{random.randint(2, 100)}, "
+                f"id.orig_h={host or f'10.0.0.{random.randint(2, 100)}'}, "
                 f"id.resp_h=8.8.8.8, query=malicious-{int(time.time())}.com, "
                 f"proto=udp, anomaly_factor={anomaly_factor:.4f}"
             ),
@@ -59,40 +81,228 @@ def generate_mock_event(source: str) -> dict:
 # ==============================
 # SEND DATA LOOP
 # ==============================
-def send_events():
-    """Continuously sends mock osquery + Zeek data to FastAPI backend."""
+def print_results(events: list, results: list):
+    """Print one line per event the backend accepted."""
+    for event, result in zip(events, results):
+        status = "🟢 OK" if result.get("is_anomaly") else "🟢 Normal"
+        print(f"[{event['source']}] Sent {event['event_type']} | Anomaly Score: {result['anomaly_score']:.2f} | {status}")
+
+def send_events(spool_path: str = SPOOL_PATH):
+    """
+    Continuously generates mock osquery + Zeek data into the local spool; a background
+    shipper delivers it to the FastAPI backend in batches (see spool.py).
+    Events survive backend outages and client restarts.
+    """
     print("\n--- Starting Demo Data Ingestion Client ---")
-    print(f"Target API: {API_URL}\n")
+    print(f"Target API: {BATCH_API_URL} • spool: {spool_path}\n")
+
+    spool = Spool(spool_path)
+    if spool.depth:
+        print(f"📦 Resuming with {spool.depth} spooled events from a previous run")
+    shipper = Shipper(spool, BATCH_API_URL, on_response=print_results)
+    shipper.start()
 
-    while True:
-        try:
-            events = [
+    try:
+        while True:
+            spool.append([
                 generate_mock_event("osquery"),
                 generate_mock_event("zeek"),
-            ]
+            ])
+            if shipper.error:
+                break  # shipping stopped (wrong URL or credentials); the spool keeps what it holds
+            if shipper.failures:
+                print(f"⚠️  Backend unreachable at {BASE_URL}; {spool.depth} events spooled, retrying with backoff")
+            time.sleep(SEND_INTERVAL)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        shipper.stop()
+        spool.close()
 
-            for event in events:
-                response = requests.post(API_URL, headers={"Content-Type": "application/json"}, data=json.dumps(event))
+# ==============================
+# LOAD GENERATOR
+# ==============================
+class LatencyRecorder:
+    """Collects request latencies and summarizes them as percentiles and a histogram."""
 
-                if response.status_code == 200:
-                    result = response.json()
-                    status = "🟢 OK" if result.get("is_anomaly") else "🟢 Normal"
-                    print(f"[{event['source']}] Sent {event['event_type']} | Anomaly Score: {result['anomaly_score']:.2f} | {status}")
-                else:
-                    print(f"[{event['source']}] ❌ Failed: {response.status_code} - {response.text}")
+    def __init__(self):
+        self.latencies_ms = []
+        self.events = 0
+        self.errors = 0
+        self.status_counts = {}
 
-        except requests.exceptions.ConnectionError:
-            print("⚠️  Connection Error: Is the FastAPI server running on port 8000?")
-            time.sleep(3)  # Wait before retrying
-            continue
+    def record(self, latency_ms: float, events: int, status: int):
+        self.latencies_ms.append(latency_ms)
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        if status == 200:
+            self.events += events
+        else:
+            self.errors += 1
 
-        except Exception as e:
-            print(f"⚠️  Unexpected error: {e}")
+    def percentile(self, p: float) -> float:
+        if not self.latencies_ms:
+            return 0.0
+        ordered = sorted(self.latencies_ms)
+        return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
 
-        time.sleep(SEND_INTERVAL)
+    def histogram(self) -> list:
+        counts = [0] * len(LATENCY_BUCKETS_MS)
+        for latency in self.latencies_ms:
+            counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency)] += 1
+        return list(zip(LATENCY_BUCKETS_MS, counts))
+
+    def report(self, elapsed: float) -> dict:
+        return {
+            "requests": len(self.latencies_ms),
+            "events_sent": self.events,
+            "errors": self.errors,
+            "status_counts": self.status_counts,
+            "elapsed_s": round(elapsed, 3),
+            "events_per_s": round(self.events / elapsed, 1) if elapsed else 0.0,
+            "p50_ms": round(self.percentile(50), 2),
+            "p95_ms": round(self.percentile(95), 2),
+            "p99_ms": round(self.percentile(99), 2),
+            "max_ms": round(max(self.latencies_ms, default=0.0), 2),
+        }
+
+def simulated_hosts(count: int) -> list:
+    """Distinct 10.0.x.y addresses, one per simulated host."""
+    return [f"10.0.{i // 250}.{i % 250 + 2}" for i in range(count)]
+
+async def _send(client: httpx.AsyncClient, hosts: list, batch_size: int, recorder: LatencyRecorder, slots: asyncio.Semaphore):
+    events = [
+        generate_mock_event(random.choice(["osquery", "zeek"]), host=random.choice(hosts))
+        for _ in range(batch_size)
+    ]
+    start = time.perf_counter()
+    try:
+        if batch_size > 1:
+            response = await client.post(BATCH_API_URL, json=events)
+        else:
+            response = await client.post(API_URL, json=events[0])
+        status = response.status_code
+    except httpx.HTTPError:
+        status = 0
+    finally:
+        slots.release()
+    recorder.record((time.perf_counter() - start) * 1000, batch_size, status)
+
+async def run_load(rate: float, duration: float, hosts: int = 100, batch_size: int = 1, concurrency: int = 64) -> dict:
+    """
+    Send events at `rate` events/s for `duration` seconds from `hosts` simulated hosts.
+    Requests are paced open-loop; when `concurrency` requests are already in flight the
+    pacer waits, so the achieved rate in the report shows where the backend saturates.
+    """
+    host_list = simulated_hosts(hosts)
+    recorder = LatencyRecorder()
+    slots = asyncio.Semaphore(concurrency)
+    interval = batch_size / rate
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        tasks = set()
+        start = time.perf_counter()
+        next_send = start
+        while next_send - start < duration:
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await slots.acquire()
+            task = asyncio.create_task(_send(client, host_list, batch_size, recorder, slots))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            next_send += interval
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+
+    return {**recorder.report(elapsed), "histogram_ms": recorder.histogram()}
+
+def print_report(report: dict):
+    """Pretty-print a run_load report."""
+    print("\n--- Load Test Report ---")
+    for key in ["requests", "events_sent", "errors", "elapsed_s", "events_per_s", "p50_ms", "p95_ms", "p99_ms", "max_ms"]:
+        print(f"{key:>14}: {report[key]}")
+    print(f"{'status_counts':>14}: {report['status_counts']}")
+    print("\nLatency histogram:")
+    total = max(1, report["requests"])
+    for bound, count in report["histogram_ms"]:
+        label = f"<= {bound:g} ms" if bound != float("inf") else "> 5000 ms"
+        print(f"{label:>12} | {'#' * int(50 * count / total):<50} {count}")
+
+# ==============================
+# LOG FILE UPLOAD
+# ==============================
+def upload_log(path: str, format: str = "auto", gzip: bool = False, batch_size: int = 5000) -> dict:
+    """
+    Stream a Zeek / osquery log file to /ingest/logs in chunks (never read whole)
+    and return the backend's final counts. Progress is printed while it runs.
+    """
+    upload_id = uuid.uuid4().hex
+    total = os.path.getsize(path)
+
+    def chunks():
+        with open(path, "rb") as f:
+            while chunk := f.read(UPLOAD_CHUNK_BYTES):
+                yield chunk
+
+    def watch(done):
+        with httpx.Client(timeout=5) as poller:
+            while not done.wait(1):
+                try:
+                    progress = poller.get(f"{LOGS_API_URL}/{upload_id}").json()
+                except (httpx.HTTPError, ValueError):
+                    continue
+                if "bytes" in progress:
+                    print(f"  {progress['bytes'] / max(total, 1):6.1%}  {progress['events']} events  "
+                          f"{progress['events_per_s']:g}/s")
+
+    done = threading.Event()
+    threading.Thread(target=watch, args=(done,), daemon=True).start()
+    headers = {"Content-Type": "application/octet-stream"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    try:
+        response = httpx.post(
+            LOGS_API_URL, content=chunks(), headers=headers, timeout=None,
+            params={"format": format, "batch_size": batch_size, "upload_id": upload_id},
+        )
+    finally:
+        done.set()
+    response.raise_for_status()
+    return response.json()
 
 # ==============================
 # MAIN ENTRY POINT
 # ==============================
 if __name__ == "__main__":
-    send_events()
+    parser = argparse.ArgumentParser(description="Mock osquery/Zeek ingestion client")
+    sub = parser.add_subparsers(dest="command")
+    demo = sub.add_parser("demo", help="Send one osquery and one Zeek event per second (default)")
+    demo.add_argument("--spool", default=SPOOL_PATH, help="on-disk spool file for undelivered events")
+    load = sub.add_parser("load", help="Generate load and report latency percentiles")
+    load.add_argument("--rate", type=float, default=1000, help="target events per second")
+    load.add_argument("--duration", type=float, default=30, help="seconds to run")
+    load.add_argument("--hosts", type=int, default=100, help="number of simulated hosts")
+    load.add_argument("--batch-size", type=int, default=1, help="events per request; >1 uses /ingest_batch")
+    load.add_argument("--concurrency", type=int, default=64, help="max requests in flight")
+    load.add_argument("--json", action="store_true", help="print the report as JSON")
+    upload = sub.add_parser("upload", help="Stream a Zeek or osquery log file to the backend")
+    upload.add_argument("path", help="log file (Zeek TSV/JSON, osquery results or RawEvent NDJSON)")
+    upload.add_argument("--format", default="auto", choices=["auto", "zeek", "zeek_json", "osquery", "ndjson"])
+    upload.add_argument("--gzip", action="store_true", help="the file is gzip-compressed")
+    upload.add_argument("--batch-size", type=int, default=5000, help="events stored per transaction")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        print(f"Target: {BASE_URL} • {args.rate:g} events/s for {args.duration:g}s • "
+              f"{args.hosts} hosts • batch size {args.batch_size}")
+        report = asyncio.run(run_load(args.rate, args.duration, args.hosts, args.batch_size, args.concurrency))
+        if args.json:
+            print(json.dumps(report, indent=2, default=str))
+        else:
+            print_report(report)
+    elif args.command == "upload":
+        print(json.dumps(upload_log(args.path, args.format, args.gzip, args.batch_size), indent=2))
+    else:
+        send_events(getattr(args, "spool", SPOOL_PATH))
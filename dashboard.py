@@ -250,11 +250,11 @@
 import streamlit as st
 import pandas as pd
 import requests
-import time
 import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google.cloud import firestore as gcf
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from firebase_admin import firestore
+import firestore_data
 
 # -------------------------------
 # PAGE CONFIG
@@ -273,13 +273,43 @@ st.sidebar.write("⏱ Refresh interval:", refresh_rate, "seconds")
 # -------------------------------
 # FIREBASE INITIALIZATION
 # -------------------------------
-firebase_path = "firebase_key.json"  # <-- adjust if needed
+# Client, caching and change listeners live in firestore_data.py (once per server process)
+firestore_data.start_listeners()
 
-if not firebase_admin._apps:
-    cred = credentials.Certificate(firebase_path)
-    firebase_admin.initialize_app(cred)
-
-db = firestore.client()
+# -------------------------------
+# CACHED SUMMARIES
+# -------------------------------
+BACKEND_URL = "http://127.0.0.1:8000"
+
+@st.cache_resource(show_spinner=False)
+def backend_session():
+    """Keep-alive HTTP session shared by all reruns and sessions."""
+    return requests.Session()
+
+@st.cache_resource(show_spinner=False)
+def fetch_pool():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="dashboard-fetch")
+
+def fetch_concurrently(**calls):
+    """Run independent zero-argument fetches in parallel; returns {name: result}."""
+    ctx = get_script_run_ctx()
+
+    def run(fn):
+        add_script_run_ctx(None, ctx)  # lets st.cache_data work from the pool thread
+        return fn()
+
+    futures = {name: fetch_pool().submit(run, fn) for name, fn in calls.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+@st.cache_data(ttl=5, show_spinner=False)
+def fetch_backend_summary():
+    """Headline AI-detection numbers from the backend's /summary endpoint."""
+    try:
+        r = backend_session().get(f"{BACKEND_URL}/summary", timeout=5)
+        r.raise_for_status()
+        return r.json()
+    except requests.exceptions.RequestException:
+        return {}
 
 # -------------------------------
 # TABS (GCP VM STYLE)
@@ -296,33 +326,57 @@ tabs = st.tabs([
 # ============================================================
 # HOME TAB
 # ============================================================
-with tabs[0]:
-    st.header("📊 System Summary")
-
-    total_clients = len(list(db.collection("clients").stream()))
-    total_networks = len(list(db.collection("networks").stream()))
-    total_pcaps = len(list(db.collection("pcaps").stream()))
+# Live panels are fragments: only they rerun every `refresh_rate` seconds,
+# the rest of the page (tabs, forms, Firebase client) is left alone.
+@st.fragment(run_every=refresh_rate)
+def home_summary():
+    fetched = fetch_concurrently(counts=firestore_data.counts, ai_summary=fetch_backend_summary)
+    counts, ai_summary = fetched["counts"], fetched["ai_summary"]
 
     col1, col2, col3 = st.columns(3)
-    col1.metric("Total Clients", total_clients)
-    col2.metric("Monitored Networks", total_networks)
-    col3.metric("Detected PCAP Events", total_pcaps)
+    col1.metric("Total Clients", counts["clients"])
+    col2.metric("Monitored Networks", counts["networks"])
+    col3.metric("Detected PCAP Events", counts["pcaps"])
+
+    if ai_summary:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Ingested Events", ai_summary["total_events"])
+        col2.metric("ML Anomalies", ai_summary["total_anomalies"])
+        col3.metric("AI-Reviewed Threats", ai_summary["reviewed_threats"])
 
+with tabs[0]:
+    st.header("📊 System Summary")
+    home_summary()
     st.caption("Live Firebase-backed system summary.")
 
+def show_collection_page(collection):
+    """Render one cached page of a Firestore collection with Prev/Next cursor navigation."""
+    key = f"{collection}_cursors"  # cursors of the pages visited so far; last one is current
+    if key not in st.session_state:
+        st.session_state[key] = [None]
+    cursors = st.session_state[key]
+
+    page = firestore_data.fetch_page(collection, cursors[-1])
+    if page["rows"]:
+        st.dataframe(pd.DataFrame(page["rows"]), use_container_width=True)
+
+    col1, col2, col3 = st.columns([1, 1, 6])
+    if col1.button("◀ Prev", key=f"{collection}_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if col2.button("Next ▶", key=f"{collection}_next", disabled=page["next_cursor"] is None):
+        cursors.append(page["next_cursor"])
+        st.rerun()
+    col3.caption(f"Page {len(cursors)} • {firestore_data.PAGE_SIZE} per page")
+    return page["rows"]
+
 # ============================================================
 # CLIENTS TAB
 # ============================================================
 with tabs[1]:
     st.header("👥 Registered Clients")
 
-    client_docs = db.collection("clients").stream()
-    client_data = [doc.to_dict() for doc in client_docs]
-
-    if client_data:
-        df_clients = pd.DataFrame(client_data)
-        st.dataframe(df_clients, use_container_width=True)
-    else:
+    if not show_collection_page("clients"):
         st.info("No client data found in Firebase.")
 
 # ============================================================
@@ -331,13 +385,7 @@ with tabs[1]:
 with tabs[2]:
     st.header("🌐 Network Data")
 
-    network_docs = db.collection("networks").stream()
-    network_data = [doc.to_dict() for doc in network_docs]
-
-    if network_data:
-        df_networks = pd.DataFrame(network_data)
-        st.dataframe(df_networks, use_container_width=True)
-    else:
+    if not show_collection_page("networks"):
         st.info("No network entries found in Firebase.")
 
 # ============================================================
@@ -346,13 +394,7 @@ with tabs[2]:
 with tabs[3]:
     st.header("🚨 PCAP Threat Events (Firebase)")
 
-    pcap_docs = db.collection("pcaps").stream()
-    pcap_data = [doc.to_dict() for doc in pcap_docs]
-
-    if pcap_data:
-        df_pcaps = pd.DataFrame(pcap_data)
-        st.dataframe(df_pcaps, use_container_width=True)
-    else:
+    if not show_collection_page("pcaps"):
         st.warning("No PCAP entries available in Firebase.")
 
     st.caption("Real-time PCAP logging from Firestore.")
@@ -377,8 +419,7 @@ with tabs[4]:
 
     if submitted:
         if doc_id:
-            doc_ref = db.collection("pcaps").document(doc_id)
-            doc_ref.set({
+            firestore_data.add_document("pcaps", doc_id, {
                 "source": source,
                 "uploaded_by": uploaded_by,
                 "event_type": event_type,
@@ -393,30 +434,81 @@ with tabs[4]:
 # ============================================================
 # AI THREAT DETECTION TAB (FASTAPI BACKEND)
 # ============================================================
-with tabs[5]:
-    st.header("🛡 AI Threat Detection (FastAPI Backend)")
-
-    API_URL = "http://127.0.0.1:8000/get_latest_threats"
-
-    def fetch_ai_threats():
-        try:
-            r = requests.get(API_URL)
-            return pd.DataFrame(r.json())
-        except:
-            return pd.DataFrame()
+API_URL = f"{BACKEND_URL}/threats/delta"
+HISTORY_PAGE_SIZE = 100
+TREND_WINDOWS = {"Last 24 hours": (1, "hour"), "Last 7 days": (7, "hour"), "Last 30 days": (30, "day")}
+
+# Column rendering for threat tables: cells are drawn by the (virtualized) grid, no per-cell Styler pass
+THREAT_COLUMNS = {
+    "ML Score": st.column_config.ProgressColumn("ML Score", min_value=0.0, max_value=1.0, format="%.3f"),
+    "Gemini Confidence": st.column_config.ProgressColumn(
+        "Gemini Confidence", min_value=0.0, max_value=1.0, format="%.2f"
+    ),
+    "Raw Event Log": st.column_config.TextColumn("Raw Event Log", width="large"),
+}
+MAX_AI_ROWS = 1000  # rows kept in session state
+
+def fetch_ai_threat_deltas(since_id):
+    """Fetch only detections newer than the session's high-water mark; None if the request fails."""
+    params = {"limit": 500}
+    if since_id is not None:
+        params["since_id"] = since_id
+    try:
+        r = backend_session().get(API_URL, params=params, timeout=5)
+        r.raise_for_status()
+        return r.json()
+    except (requests.exceptions.RequestException, ValueError):  # ValueError: body is not JSON
+        return None
+
+def catch_up_ai_threats(since_id):
+    """
+    Follow /threats/delta pages from `since_id`; returns (new items oldest first, high-water mark).
+    A failed page stops the catch-up: the rows and mark of the pages already fetched are kept,
+    and the next refresh resumes from there.
+    """
+    items = []
+    for _ in range(10):  # bounded catch-up after a long pause
+        delta = fetch_ai_threat_deltas(since_id)
+        if delta is None:
+            break
+        items.extend(delta["items"])
+        since_id = delta["high_water_mark"]
+        if not delta.get("has_more"):
+            break
+    return items, since_id
+
+@st.fragment(run_every=refresh_rate)
+def ai_threat_panel():
+    # Keep already-fetched rows across reruns and append only the deltas
+    if "ai_threats" not in st.session_state:
+        st.session_state.ai_threats = pd.DataFrame()
+        st.session_state.ai_threats_hwm = None
+
+    fetched = fetch_concurrently(
+        deltas=lambda hwm=st.session_state.ai_threats_hwm: catch_up_ai_threats(hwm),
+        ai_summary=fetch_backend_summary,
+    )
+    new_items, st.session_state.ai_threats_hwm = fetched["deltas"]
+    ai_summary = fetched["ai_summary"]
+    if new_items:
+        new_rows = pd.DataFrame(new_items).iloc[::-1]  # newest first
+        st.session_state.ai_threats = pd.concat(
+            [new_rows, st.session_state.ai_threats], ignore_index=True
+        ).head(MAX_AI_ROWS)
 
-    data = fetch_ai_threats()
+    data = st.session_state.ai_threats.copy()
 
     if data.empty:
         st.warning("Waiting for AI-reviewed threats...")
     else:
-        # METRICS
+        # METRICS (server-side totals, not just the rows held in this session)
         st.subheader("📈 AI Detection Summary")
 
         col1, col2, col3 = st.columns(3)
-        col1.metric("Total Reviewed Events", len(data))
-        col2.metric("Max Confidence", f"{data['gemini_confidence'].max()*100:.2f}%")
-        col3.metric("Latest Source", data['source'].iloc[0])
+        col1.metric("Total Reviewed Events", ai_summary.get("reviewed_threats", len(data)))
+        max_confidence = ai_summary.get("max_confidence") or data["gemini_confidence"].max()
+        col2.metric("Max Confidence", f"{max_confidence*100:.2f}%")
+        col3.metric("Latest Source", ai_summary.get("latest_source") or data["source"].iloc[0])
 
         st.markdown("---")
 
@@ -425,7 +517,7 @@ with tabs[5]:
             data["timestamp"], errors="coerce"
         ).dt.strftime("%b %d, %Y %I:%M %p")
 
-        df = data.rename(columns={
+        df = data.drop(columns=["detection_id"]).rename(columns={
             "timestamp": "Timestamp",
             "source": "Source",
             "event_type": "Event Type",
@@ -435,19 +527,8 @@ with tabs[5]:
             "raw_data": "Raw Event Log"
         })
 
-        # COLOR MAP
-        def color_conf(val):
-            if val > 0.8: return "background-color:#ff4c4c;color:white"
-            elif val > 0.5: return "background-color:orange"
-            elif val > 0.2: return "background-color:yellow"
-            return ""
-
         st.subheader("🧠 AI-Reviewed Threat Events")
-        st.dataframe(
-            df.style.applymap(color_conf, subset=["Gemini Confidence"]),
-            use_container_width=True,
-            height=500
-        )
+        st.dataframe(df, column_config=THREAT_COLUMNS, use_container_width=True, height=500, hide_index=True)
 
     st.markdown("---")
     st.caption(
@@ -455,8 +536,103 @@ with tabs[5]:
         f"{datetime.datetime.now().strftime('%I:%M:%S %p')}"
     )
 
-# ============================================================
-# AUTO REFRESH LOOP
-# ============================================================
-time.sleep(refresh_rate)
-st.rerun()
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_threat_aggregates(days, interval, until_hour):
+    """Server-side time-bucketed counts and percentiles for one trend window."""
+    since = (datetime.datetime.fromisoformat(until_hour) - datetime.timedelta(days=days)).isoformat()
+    try:
+        r = backend_session().get(
+            f"{BACKEND_URL}/threats/aggregates",
+            params={"since": since, "until": until_hour, "interval": interval}, timeout=10
+        )
+        r.raise_for_status()
+        return pd.DataFrame(r.json())
+    except requests.exceptions.RequestException:
+        return pd.DataFrame()
+
+@st.fragment(run_every=max(refresh_rate, 30))
+def threat_trends():
+    window = st.selectbox("Trend window", list(TREND_WINDOWS), key="trend_window")
+    days, interval = TREND_WINDOWS[window]
+    # Window end rounded up to the next hour so every session shares the same cache entry
+    until_hour = (datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+                  + datetime.timedelta(hours=1)).isoformat()
+    trends = fetch_threat_aggregates(days, interval, until_hour)
+    if trends.empty:
+        st.info("No events in this window yet.")
+        return
+
+    trends["bucket"] = pd.to_datetime(trends["bucket"])
+    col1, col2 = st.columns(2)
+    col1.caption("Anomalies per source")
+    col1.line_chart(trends.pivot(index="bucket", columns="source", values="anomalies").fillna(0))
+    if "gemini_confidence_p50" in trends:
+        col2.caption("Gemini confidence p50 / p90")
+        col2.line_chart(trends.groupby("bucket")[["gemini_confidence_p50", "gemini_confidence_p90"]].max())
+    if "anomaly_score_p90" in trends:
+        st.caption("Anomaly score p90 per source")
+        st.line_chart(trends.pivot(index="bucket", columns="source", values="anomaly_score_p90"))
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_threat_page(cursor, source, min_confidence):
+    params = {"limit": HISTORY_PAGE_SIZE, "min_confidence": min_confidence}
+    if cursor:
+        params["cursor"] = cursor
+    if source != "All":
+        params["source"] = source
+    try:
+        r = backend_session().get(f"{BACKEND_URL}/threats", params=params, timeout=10)
+        r.raise_for_status()
+        return r.json()
+    except requests.exceptions.RequestException:
+        return {"items": [], "next_cursor": None}
+
+def threat_history():
+    """Server-paginated detail table (keyset cursors from /threats)."""
+    col1, col2 = st.columns(2)
+    source = col1.selectbox("Source", ["All", "osquery", "zeek"], key="history_source")
+    min_confidence = col2.slider("Min Gemini confidence", 0.0, 1.0, 0.0, 0.05, key="history_min_conf")
+
+    filters = (source, min_confidence)
+    if st.session_state.get("history_filters") != filters:  # new filter: back to the first page
+        st.session_state.history_filters = filters
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+
+    page = fetch_threat_page(cursors[-1], source, min_confidence)
+    rows = pd.DataFrame(page["items"])
+    if rows.empty:
+        st.info("No reviewed threats match these filters.")
+    else:
+        rows["timestamp"] = pd.to_datetime(rows["timestamp"], errors="coerce").dt.strftime("%b %d, %Y %I:%M %p")
+        st.dataframe(
+            rows.rename(columns={
+                "timestamp": "Timestamp",
+                "source": "Source",
+                "event_type": "Event Type",
+                "anomaly_score": "ML Score",
+                "gemini_confidence": "Gemini Confidence",
+                "mitigation_suggestion": "Mitigation",
+                "raw_data": "Raw Event Log"
+            }),
+            column_config=THREAT_COLUMNS, use_container_width=True, height=400, hide_index=True
+        )
+
+    col1, col2, col3 = st.columns([1, 1, 6])
+    if col1.button("◀ Newer", key="history_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    if col2.button("Older ▶", key="history_next", disabled=page["next_cursor"] is None):
+        cursors.append(page["next_cursor"])
+        st.rerun()
+    col3.caption(f"Page {len(cursors)} • {HISTORY_PAGE_SIZE} per page")
+
+with tabs[5]:
+    st.header("🛡 AI Threat Detection (FastAPI Backend)")
+    ai_threat_panel()
+
+    st.subheader("📉 Threat Trends")
+    threat_trends()
+
+    st.subheader("🗂 Threat History")
+    threat_history()
@@ -0,0 +1,46 @@
+# executor.py
+"""
+Blocking-Work Executor for the AI Threat Detection Backend
+----------------------------------------------------------
+Handles:
+- A sized thread pool for blocking SQLite, pandas and model calls
+- A per-event-loop cap on in-flight blocking jobs, so a burst of requests
+  waits on the event loop instead of piling up in the executor queue
+
+Configuration (environment variables):
+    THREAT_EXECUTOR_WORKERS  threads available for blocking work
+    THREAT_MAX_INFLIGHT      blocking jobs allowed to be queued or running at once
+"""
+
+import asyncio
+import functools
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+
+# ==============================
+# CONFIGURATION
+# ==============================
+EXECUTOR_WORKERS = int(os.environ.get("THREAT_EXECUTOR_WORKERS", str(storage.POOL_SIZE)))
+MAX_INFLIGHT = int(os.environ.get("THREAT_MAX_INFLIGHT", "64"))
+
+_executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="threat-io")
+_limits = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+
+# ==============================
+# PUBLIC API
+# ==============================
+def _limit() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    sem = _limits.get(loop)
+    if sem is None:
+        sem = _limits[loop] = asyncio.Semaphore(MAX_INFLIGHT)
+    return sem
+
+async def run_blocking(fn, *args, **kwargs):
+    """Run `fn(*args, **kwargs)` on the executor without blocking the event loop."""
+    async with _limit():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
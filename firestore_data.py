@@ -0,0 +1,144 @@
+# firestore_data.py
+"""
+Firestore Data Access for the Dashboard
+---------------------------------------
+Handles:
+- One Firebase app / Firestore client per Streamlit server process
+- Ordered, paginated collection queries with page cursors and field projection
+- Document counts via aggregation queries
+- `st.cache_data` caching shared by all sessions, keyed by a per-collection
+  version that on_snapshot listeners bump whenever a collection changes,
+  so cached pages are reused until the data actually changes (or the TTL expires)
+
+Listeners read each collection once when they start (per server process) and
+then only receive changes. Set FIRESTORE_LISTENERS=0 to rely on the TTL alone.
+
+Configuration (environment variables):
+    FIREBASE_KEY_PATH, FIRESTORE_CACHE_TTL, FIRESTORE_PAGE_SIZE, FIRESTORE_LISTENERS
+"""
+
+import os
+import threading
+
+import streamlit as st
+import firebase_admin
+from firebase_admin import credentials, firestore
+
+# ==============================
+# CONFIGURATION
+# ==============================
+FIREBASE_KEY_PATH = os.environ.get("FIREBASE_KEY_PATH", "firebase_key.json")
+CACHE_TTL = float(os.environ.get("FIRESTORE_CACHE_TTL", "60"))   # seconds; listeners usually invalidate sooner
+PAGE_SIZE = int(os.environ.get("FIRESTORE_PAGE_SIZE", "50"))
+LISTENERS_ENABLED = os.environ.get("FIRESTORE_LISTENERS", "1") == "1"
+
+# Per-collection ordering (field, direction) and projected fields (None = all fields).
+# Document ID is always the final sort key so cursors are unambiguous.
+COLLECTIONS = {
+    "clients": {"order_by": [], "fields": None},
+    "networks": {"order_by": [], "fields": None},
+    "pcaps": {
+        "order_by": [("timestamp", firestore.Query.DESCENDING)],
+        "fields": ["source", "uploaded_by", "event_type", "description", "timestamp"],
+    },
+}
+
+DOCUMENT_ID = "__name__"
+
+_versions = {name: 0 for name in COLLECTIONS}
+_versions_lock = threading.Lock()
+
+# ==============================
+# CLIENT
+# ==============================
+@st.cache_resource(show_spinner=False)
+def get_db():
+    """Firestore client, created once per server process (not once per rerun)."""
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(FIREBASE_KEY_PATH))
+    return firestore.client()
+
+# ==============================
+# CACHE INVALIDATION
+# ==============================
+def version(collection: str) -> int:
+    return _versions[collection]
+
+def invalidate(collection: str):
+    """Make cached pages and counts of `collection` stale (e.g. after a write)."""
+    with _versions_lock:
+        _versions[collection] += 1
+
+@st.cache_resource(show_spinner=False)
+def start_listeners():
+    """Register one on_snapshot listener per collection for this server process."""
+    if not LISTENERS_ENABLED:
+        return {}
+    db = get_db()
+    watches = {}
+    for name in COLLECTIONS:
+        initial = threading.Event()
+
+        def on_change(snapshots, changes, read_time, name=name, initial=initial):
+            if not initial.is_set():  # first callback is the initial snapshot, not a change
+                initial.set()
+                return
+            if changes:
+                invalidate(name)
+
+        watches[name] = db.collection(name).on_snapshot(on_change)
+    return watches
+
+# ==============================
+# QUERIES
+# ==============================
+def _ordered_query(collection: str):
+    spec = COLLECTIONS[collection]
+    query = get_db().collection(collection)
+    if spec["fields"]:
+        query = query.select(spec["fields"])
+    for field, direction in spec["order_by"]:
+        query = query.order_by(field, direction=direction)
+    return query.order_by(DOCUMENT_ID)
+
+def _cursor(collection: str, doc) -> tuple:
+    """Sort-key values of `doc`, usable as the next page's start_after cursor."""
+    values = [doc.get(field) for field, _ in COLLECTIONS[collection]["order_by"]]
+    return tuple(values) + (doc.id,)
+
+# `generation` is part of the cache key only: bumping a collection's version misses the cache
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def _fetch_page(collection: str, cursor: tuple, page_size: int, generation: int) -> dict:
+    query = _ordered_query(collection)
+    if cursor is not None:
+        keys = [field for field, _ in COLLECTIONS[collection]["order_by"]] + [DOCUMENT_ID]
+        query = query.start_after(dict(zip(keys, cursor)))
+    docs = list(query.limit(page_size).stream())
+    return {
+        "rows": [{"id": doc.id, **doc.to_dict()} for doc in docs],
+        "next_cursor": _cursor(collection, docs[-1]) if len(docs) == page_size else None,
+    }
+
+def fetch_page(collection: str, cursor: tuple = None, page_size: int = PAGE_SIZE) -> dict:
+    """
+    One page of `collection` in its configured order:
+    {"rows": [...], "next_cursor": cursor for the following page or None}.
+    """
+    return _fetch_page(collection, cursor, page_size, version(collection))
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def _count(collection: str, generation: int) -> int:
+    result = get_db().collection(collection).count(alias="total").get()
+    return result[0][0].value
+
+def count(collection: str) -> int:
+    """Document count via an aggregation query (no documents are downloaded)."""
+    return _count(collection, version(collection))
+
+def counts() -> dict:
+    return {name: count(name) for name in COLLECTIONS}
+
+def add_document(collection: str, doc_id: str, data: dict):
+    """Create or overwrite a document and invalidate the collection's cache."""
+    get_db().collection(collection).document(doc_id).set(data)
+    invalidate(collection)
@@ -0,0 +1,361 @@
+# ingest.py
+"""
+Event Ingestion Core and Multi-Process Mode
+-------------------------------------------
+Handles:
+- Scoring and writing event rows (shared by the in-process and multi-process paths):
+  events, review-queue entries and per-minute rollups in the caller's transaction.
+  Payloads are parsed once per batch, for both the model features and the typed
+  payload columns (see payloads.py). Payloads are checked against the IOC set and
+  added to the search index in the same transaction (see search.py).
+- An optional multi-process deployment (THREAT_INGEST_MODE=multiprocess):
+    * a process pool of scoring workers that parse, validate and score request
+      bodies in parallel, outside the API process's GIL
+    * one writer process that owns SQLite ingest writes: scored rows reach it
+      through a multiprocessing queue, and it commits everything that arrived
+      within THREAT_GROUP_COMMIT_WAIT_MS (up to THREAT_GROUP_COMMIT_MAX_EVENTS)
+      in one transaction
+    * the API process awaits the writer's acknowledgement (the assigned ids), for at
+      most THREAT_WRITER_ACK_TIMEOUT seconds; if the writer process dies, waiting
+      and later requests fail with 503 instead of hanging
+
+The review worker and partition maintenance keep running in the API process;
+their writes are small and infrequent next to ingest.
+
+Configuration (environment variables):
+    THREAT_INGEST_MODE, THREAT_INGEST_WORKERS,
+    THREAT_GROUP_COMMIT_MAX_EVENTS, THREAT_GROUP_COMMIT_WAIT_MS, THREAT_WRITER_QUEUE_SIZE,
+    THREAT_WRITER_ACK_TIMEOUT
+"""
+
+import asyncio
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from fastapi import HTTPException
+
+import metrics
+import models
+import partitions
+import payloads
+import review_queue
+import scoring
+import search
+import storage
+
+# ==============================
+# CONFIGURATION
+# ==============================
+INGEST_MODE = os.environ.get("THREAT_INGEST_MODE", "inprocess")   # "inprocess" | "multiprocess"
+INGEST_WORKERS = int(os.environ.get("THREAT_INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+GROUP_COMMIT_MAX_EVENTS = int(os.environ.get("THREAT_GROUP_COMMIT_MAX_EVENTS", "20000"))
+GROUP_COMMIT_WAIT_MS = float(os.environ.get("THREAT_GROUP_COMMIT_WAIT_MS", "5"))
+WRITER_QUEUE_SIZE = int(os.environ.get("THREAT_WRITER_QUEUE_SIZE", "256"))  # batches; bounds memory, applies backpressure
+WRITER_ACK_TIMEOUT = float(os.environ.get("THREAT_WRITER_ACK_TIMEOUT", "60"))  # seconds
+WRITER_POLL_INTERVAL = 1.0  # seconds between writer liveness checks
+ANOMALY_THRESHOLD = 0.5
+
+# ==============================
+# SCORING AND WRITING
+# ==============================
+ROW_COLUMNS = payloads.COLUMNS + ["ioc_match"]  # per-row values after the six base fields
+EVENT_INSERT = (
+    "INSERT INTO events (timestamp, source, event_type, raw_data, anomaly_score, is_anomaly, "
+    + ", ".join(f'"{c}"' for c in ROW_COLUMNS)
+    + ") VALUES (" + ", ".join("?" * (6 + len(ROW_COLUMNS))) + ")"
+)
+
+def parse_payloads(events: list) -> pd.DataFrame:
+    """key=value payloads of RawEvents as a wide frame (see scoring.parse_payloads)."""
+    return scoring.parse_payloads(pd.Series([e.data for e in events], dtype=object))
+
+def score_events(events: list, parsed: pd.DataFrame = None) -> list:
+    """One anomaly score per RawEvent, in order (see scoring.py)."""
+    frame = pd.DataFrame({
+        "source": [e.source for e in events],
+        "event_type": [e.event_type for e in events],
+        "data": [e.data for e in events],
+    })
+    return [float(score) for score in scoring.engine.score(frame, parsed)]
+
+def event_rows(events: list, scores: list, parsed: pd.DataFrame = None) -> list:
+    """
+    (timestamp, source, event_type, data, score, is_anomaly, columns) tuples: the unit passed
+    to the writer. `columns` holds the ROW_COLUMNS values (ioc_match last). is_anomaly is the
+    model's verdict only; IOC matches are queued for review through ioc_match.
+    """
+    if parsed is None:
+        parsed = parse_payloads(events)
+    fields = payloads.extract([e.source for e in events], [e.event_type for e in events], parsed)
+    matches = search.iocs.match([e.data for e in events])
+    return [
+        (e.timestamp, e.source, e.event_type, e.data, score,
+         1 if score > ANOMALY_THRESHOLD else 0, columns + (ioc,))
+        for e, score, columns, ioc in zip(events, scores, fields, matches)
+    ]
+
+def write_events(cursor, rows: list) -> list:
+    """
+    Insert scored rows, queue anomalies for review and update rollups on the caller's
+    cursor (the caller commits). Returns the new event ids, in order.
+    """
+    # 1. Store raw events; AUTOINCREMENT ids are contiguous inside the transaction
+    with metrics.timed("events_insert"):
+        cursor.executemany(EVENT_INSERT, (row[:6] + row[6] for row in rows))
+        last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+        event_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+
+    # 2. Keep the search index in step
+    with metrics.timed("search_index"):
+        search.index_events(cursor, [(event_id, row[3]) for event_id, row in zip(event_ids, rows)])
+
+    # 3. Queue anomalies for Gemini AI review
+    with metrics.timed("review_enqueue"):
+        review_queue.enqueue(cursor, [
+            (event_id, row[3]) for event_id, row in zip(event_ids, rows) if row[5] or row[6][-1]
+        ])
+
+    # 4. Fold into per-minute rollups
+    with metrics.timed("rollups_update"):
+        partitions.update_rollups(cursor, [(t, s, et, score, flag) for t, s, et, _, score, flag, _ in rows])
+    return event_ids
+
+def record_ingested(rows: list):
+    for _, source, _, _, _, flag, columns in rows:
+        metrics.EVENTS_INGESTED.inc(source=source)
+        if flag:
+            metrics.ANOMALIES.inc(source=source)
+        if columns[-1]:
+            metrics.IOC_MATCHES.inc(source=source)
+
+def responses(rows: list, event_ids: list) -> list:
+    """ThreatResponses for stored rows (anomalies and IOC matches are pending review)."""
+    record_ingested(rows)
+    return [
+        models.threat_response(event_id, t, s, et, score, flag, columns[-1])
+        for event_id, (t, s, et, _, score, flag, columns) in zip(event_ids, rows)
+    ]
+
+# ==============================
+# SCORING WORKER PROCESSES
+# ==============================
+_writer_queue = None  # set in each scoring worker by _init_scorer
+
+def _init_scorer(writer_queue):
+    global _writer_queue
+    _writer_queue = writer_queue
+    scoring.engine.load()
+
+def _score_and_forward(request_id: int, body: bytes, content_type: str):
+    """
+    Runs in a scoring worker: parse, validate and score a request body, then hand the
+    rows to the writer. Returns ("ok", rows without payloads) or ("error", status, detail).
+    """
+    try:
+        events = models.parse_events(body, content_type)
+    except HTTPException as e:
+        return ("error", e.status_code, e.detail)
+    if not events:
+        return ("ok", [])
+    return _rows_and_forward(request_id, events)
+
+def _rows_and_forward(request_id: int, events: list, scores: list = None, parsed: pd.DataFrame = None):
+    """
+    Runs in a scoring worker: score `events` (unless `scores` are given), build their rows
+    and hand them to the writer. `parsed` (parse_payloads of the events) skips parsing them again.
+    Returns ("ok", rows without payloads) or ("error", status, detail).
+    """
+    if parsed is None:
+        parsed = parse_payloads(events)
+    if scores is None:
+        scores = score_events(events, parsed)
+    rows = event_rows(events, scores, parsed)
+    try:
+        _writer_queue.put((request_id, rows), timeout=WRITER_ACK_TIMEOUT)
+    except queue.Full:
+        return ("error", 503, "Ingest writer is not accepting writes")
+    return ("ok", [(t, s, et, None, score, flag, columns) for t, s, et, _, score, flag, columns in rows])
+
+# ==============================
+# WRITER PROCESS
+# ==============================
+def _writer_main(db_file: str, requests_q, results_q, max_events: int, max_wait: float):
+    """Drain `requests_q`, group-commit the rows and report (request_id, first id, error) batches."""
+    storage.configure(db_file=db_file, size=1)
+    running = True
+    while running:
+        item = requests_q.get()
+        if item is None:
+            break
+        group, count = [item], len(item[1])
+        deadline = time.monotonic() + max_wait
+        while count < max_events:
+            try:
+                item = requests_q.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if item is None:
+                running = False
+                break
+            group.append(item)
+            count += len(item[1])
+
+        results = []
+        try:
+            with storage.connection() as conn:
+                cursor = conn.cursor()
+                for request_id, rows in group:
+                    ids = write_events(cursor, rows) if rows else []
+                    results.append((request_id, ids[0] if ids else None, None))
+                conn.commit()
+        except Exception as e:  # report to every waiting request in the group
+            results = [(request_id, None, f"{type(e).__name__}: {e}") for request_id, _ in group]
+        results_q.put(results)
+    results_q.put(None)
+
+# ==============================
+# API-SIDE COORDINATOR
+# ==============================
+class IngestPool:
+    """Owns the scoring process pool and the writer process; used by the API in multiprocess mode."""
+
+    def __init__(self, workers: int = INGEST_WORKERS, db_file: str = None,
+                 max_events: int = GROUP_COMMIT_MAX_EVENTS, max_wait_ms: float = GROUP_COMMIT_WAIT_MS):
+        self.workers = workers
+        self.db_file = db_file
+        self.max_events = max_events
+        self.max_wait = max_wait_ms / 1000
+        self._ids = itertools.count(1)
+        self._waiting = {}  # request id -> (loop, future)
+        self._lock = threading.Lock()
+        self._scorers = None
+        self._writer = None
+        self._reader = None
+        self._slots = None
+        self._failure = None  # set once the writer process has died
+
+    def start(self):
+        ctx = multiprocessing.get_context("spawn")  # children import only what they need; no forked threads
+        self._requests = ctx.Queue(maxsize=WRITER_QUEUE_SIZE)
+        self._results = ctx.Queue()
+        self._writer = ctx.Process(
+            target=_writer_main, name="threat-writer", daemon=True,
+            args=(self.db_file or storage.get_pool().db_file, self._requests, self._results,
+                  self.max_events, self.max_wait),
+        )
+        self._writer.start()
+        self._scorers = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=ctx, initializer=_init_scorer, initargs=(self._requests,)
+        )
+        self._reader = threading.Thread(target=self._read_results, name="threat-writer-results", daemon=True)
+        self._reader.start()
+
+    def stop(self, timeout: float = 10):
+        if self._scorers is not None:
+            self._scorers.shutdown(wait=True)
+        if self._writer is not None:
+            try:
+                self._requests.put(None, timeout=timeout)
+            except queue.Full:  # writer is gone or wedged; don't block shutdown
+                pass
+            self._writer.join(timeout)
+            self._reader.join(timeout)
+        self._scorers = self._writer = self._reader = None
+
+    @property
+    def writer_backlog(self) -> int:
+        try:
+            return self._requests.qsize()
+        except (NotImplementedError, AttributeError):  # qsize is unavailable on macOS
+            return 0
+
+    def _read_results(self):
+        writer = self._writer
+        while True:
+            try:
+                results = self._results.get(timeout=WRITER_POLL_INTERVAL)
+            except queue.Empty:
+                if not writer.is_alive():
+                    self._writer_died(writer.exitcode)
+                    return
+                continue
+            if results is None:
+                return
+            for request_id, first_id, error in results:
+                with self._lock:
+                    loop, future = self._waiting.pop(request_id, (None, None))
+                if future is not None:
+                    loop.call_soon_threadsafe(_resolve, future, first_id, error)
+
+    def _writer_died(self, exitcode):
+        """Fail every waiting request; later requests are refused (see _register)."""
+        print(f"❌ Ingest writer process exited unexpectedly (exit code {exitcode})")
+        with self._lock:
+            self._failure = f"writer process exited with code {exitcode}"
+            waiting, self._waiting = self._waiting, {}
+        for loop, future in waiting.values():
+            loop.call_soon_threadsafe(_resolve, future, None, self._failure)
+
+    def _register(self) -> tuple:
+        loop = asyncio.get_running_loop()
+        request_id = next(self._ids)
+        future = loop.create_future()
+        with self._lock:
+            if self._failure is not None:
+                raise HTTPException(status_code=503, detail=f"Ingest writer unavailable: {self._failure}")
+            self._waiting[request_id] = (loop, future)
+        return request_id, future
+
+    def _forget(self, request_id: int):
+        with self._lock:
+            self._waiting.pop(request_id, None)
+
+    def _slots_for_loop(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers * 4)  # bounds queued bodies in the API process
+        return self._slots
+
+    async def _submit(self, fn, *args) -> list:
+        """Run `fn(request_id, *args)` on a scoring worker, await the writer's ack; returns ThreatResponses."""
+        request_id, future = self._register()
+        loop = asyncio.get_running_loop()
+        try:
+            async with self._slots_for_loop():
+                result = await loop.run_in_executor(self._scorers, fn, request_id, *args)
+            if result[0] == "error":
+                raise HTTPException(status_code=result[1], detail=result[2])
+            rows = result[1]
+            if not rows:
+                return []
+            try:
+                first_id = await asyncio.wait_for(future, WRITER_ACK_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail="Timed out waiting for the ingest writer")
+        finally:
+            self._forget(request_id)
+        return await loop.run_in_executor(None, responses, rows, range(first_id, first_id + len(rows)))
+
+    async def ingest_body(self, body: bytes, content_type: str) -> list:
+        """Parse, score and store a batch body; returns ThreatResponses."""
+        return await self._submit(_score_and_forward, body, content_type)
+
+    async def store(self, events: list, scores: list = None, parsed: pd.DataFrame = None) -> list:
+        """
+        Store parsed events through a scoring worker and the writer process (scoring them
+        there unless `scores` are given, parsing their payloads unless `parsed` is); returns ThreatResponses.
+        """
+        return await self._submit(_rows_and_forward, events, scores, parsed)
+
+def _resolve(future, first_id, error):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(HTTPException(status_code=503, detail=f"Ingest writer failed: {error}"))
+    else:
+        future.set_result(first_id)
@@ -0,0 +1,192 @@
+# metrics.py
+"""
+Prometheus-Style Metrics and Hot-Path Instrumentation
+-----------------------------------------------------
+Handles:
+- Minimal thread-safe Counter / Gauge / Histogram types rendered in the
+  Prometheus text exposition format (served by the backend at /metrics)
+- `timed(stage)`: per-stage latency histogram for the ingest, review and query paths
+- An optional sampling profiler that periodically captures every thread's stack
+  and returns collapsed stacks (flamegraph.pl / speedscope compatible)
+
+The profiler is only reachable when THREAT_ENABLE_PROFILER=1.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+# ==============================
+# CONFIGURATION
+# ==============================
+PROFILER_ENABLED = os.environ.get("THREAT_ENABLE_PROFILER", "0") == "1"
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+# ==============================
+# METRIC TYPES
+# ==============================
+def _format_labels(names, values, extra=None) -> str:
+    pairs = list(zip(names, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escape = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    body = ",".join(f'{k}="{escape(v)}"' for k, v in pairs)
+    return "{" + body + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def samples(self):
+        """Yield (suffix, label values, extra labels, value) tuples."""
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield "", key, None, value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {value}")
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """Current value; either set directly or computed at scrape time by `set_function`."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        super().__init__(name, documentation, labels)
+        self._function = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, fn):
+        """`fn()` returns a number, or a dict of {label value(s): number} for labelled gauges."""
+        self._function = fn
+
+    def samples(self):
+        if self._function is None:
+            yield from super().samples()
+            return
+        try:
+            result = self._function()
+        except Exception:
+            return
+        if not isinstance(result, dict):
+            yield "", (), None, result
+            return
+        for key, value in result.items():
+            yield "", key if isinstance(key, tuple) else (key,), None, value
+
+class Histogram(_Metric):
+    """Cumulative-bucket latency histogram."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]  # bucket counts, count, sum
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += 1
+            state[2] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        for key, (counts, count, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield "_bucket", key, [("le", f"{bound:g}")], cumulative
+            yield "_bucket", key, [("le", "+Inf")], count
+            yield "_count", key, None, count
+            yield "_sum", key, None, round(total, 6)
+
+def render() -> str:
+    """All registered metrics in Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+# ==============================
+# SHARED METRICS
+# ==============================
+STAGE_SECONDS = Histogram(
+    "threat_stage_seconds", "Time spent in each hot-path stage.", labels=("stage",)
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "threat_http_request_seconds", "HTTP request latency by route.", labels=("method", "route", "status")
+)
+EVENTS_INGESTED = Counter("threat_events_ingested_total", "Events stored.", labels=("source",))
+ANOMALIES = Counter("threat_anomalies_total", "Events scored above the anomaly threshold.", labels=("source",))
+IOC_MATCHES = Counter("threat_ioc_matches_total", "Events matching a known-bad indicator.", labels=("source",))
+REVIEWS = Counter("threat_reviews_total", "Review attempts by outcome.", labels=("outcome",))
+
+def timed(stage: str):
+    """Context manager recording the block's duration under `stage`."""
+    return STAGE_SECONDS.time(stage=stage)
+
+# ==============================
+# SAMPLING PROFILER
+# ==============================
+def sample_stacks(seconds: float = 5.0, interval: float = 0.005) -> str:
+    """
+    Sample every thread's Python stack for `seconds` and return collapsed stacks
+    ("frame;frame;frame count" per line), hottest first.
+    """
+    tally = _Tally()
+    own = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            tally[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {count}" for stack, count in tally.most_common()) + "\n"
@@ -0,0 +1,78 @@
+# models.py
+"""
+Request/Response Models and Batch Parsing
+-----------------------------------------
+Pydantic models shared by the API process and the multi-process ingestion
+workers (see ingest.py), plus the JSON array / NDJSON batch body parser.
+Kept free of app state so worker processes can import it cheaply.
+"""
+
+import json
+from typing import List, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+
+# ==============================
+# DATA MODELS
+# ==============================
+class RawEvent(BaseModel):
+    source: str
+    timestamp: str
+    event_type: str
+    data: str
+
+class ThreatResponse(BaseModel):
+    id: int
+    timestamp: str
+    source: str
+    event_type: str
+    anomaly_score: float
+    is_anomaly: bool
+    mitigation_suggestion: str = "N/A"
+    gemini_confidence: float = 0.0
+    review_status: str = "not_required"  # "not_required" | "pending_review"
+    ioc_match: Optional[str] = None  # known-bad indicators found in the payload (see search.py)
+
+# ==============================
+# BATCH PARSING
+# ==============================
+def parse_events(body: bytes, content_type: str) -> List[RawEvent]:
+    """
+    Parse a batch request body into RawEvents.
+    Accepts either a JSON array of events or NDJSON (one event object per line).
+    """
+    try:
+        if "ndjson" in content_type or "jsonlines" in content_type:
+            items = [json.loads(line) for line in body.decode("utf-8").splitlines() if line.strip()]
+        else:
+            items = json.loads(body or b"[]")
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Malformed batch body: {e}")
+
+    if not isinstance(items, list):
+        raise HTTPException(status_code=422, detail="Batch body must be a JSON array or NDJSON stream")
+
+    events = []
+    for i, item in enumerate(items):
+        try:
+            events.append(RawEvent(**item))
+        except (TypeError, ValidationError) as e:
+            raise HTTPException(status_code=422, detail=f"Invalid event at index {i}: {e}")
+    return events
+
+def threat_response(event_id: int, timestamp: str, source: str, event_type: str,
+                    score: float, flag: int, ioc_match: str = None) -> ThreatResponse:
+    """Response for a freshly stored event (anomalies and IOC matches are pending review)."""
+    queued = bool(flag or ioc_match)
+    return ThreatResponse(
+        id=event_id,
+        timestamp=timestamp,
+        source=source,
+        event_type=event_type,
+        anomaly_score=score,
+        is_anomaly=bool(flag),
+        mitigation_suggestion="Pending AI review" if queued else "N/A - Below Anomaly Threshold",
+        review_status="pending_review" if queued else "not_required",
+        ioc_match=ioc_match,
+    )
@@ -0,0 +1,400 @@
+# partitions.py
+"""
+Time-Partitioned Event Storage, Retention and Rollups
+-----------------------------------------------------
+Handles:
+- Per-day partition files (partitions/events_YYYYMMDD.db) for normal events.
+  Once a day leaves the hot window, its below-threshold events without an IOC
+  match are moved out of the main `events` table in small id-ordered chunks. The main file stops growing
+  because SQLite reuses the freed pages, and no VACUUM is needed.
+- Retention: expired days are dropped by deleting the partition file. Old
+  anomalies and rollups are removed with indexed range deletes.
+- `event_rollups`: per-minute, per-source, per-event_type counts and score
+  statistics, maintained at ingest so trends outlive raw events.
+- Read helpers that query the main table and the partition files for a time window.
+- Each partition file carries the full-text index of its own events (see search.py).
+
+Anomalous events always stay in the main database. Detections, the review
+queue and the live feeds reference them by id.
+
+Configuration (environment variables):
+    THREAT_PARTITION_DIR, THREAT_HOT_DAYS, THREAT_RETENTION_DAYS,
+    THREAT_ROLLUP_RETENTION_DAYS, THREAT_MAINTENANCE_INTERVAL
+"""
+
+import glob
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+
+import payloads
+import storage
+
+# ==============================
+# CONFIGURATION
+# ==============================
+PARTITION_DIR = os.environ.get("THREAT_PARTITION_DIR", "partitions")
+HOT_DAYS = int(os.environ.get("THREAT_HOT_DAYS", "1"))                        # days of normal events kept in main
+RETENTION_DAYS = int(os.environ.get("THREAT_RETENTION_DAYS", "30"))           # raw events (partitions + anomalies)
+ROLLUP_RETENTION_DAYS = int(os.environ.get("THREAT_ROLLUP_RETENTION_DAYS", "365"))
+MAINTENANCE_INTERVAL = float(os.environ.get("THREAT_MAINTENANCE_INTERVAL", "3600"))  # seconds
+ROTATE_CHUNK = 20000  # rows moved per transaction, keeps the write lock short
+
+# Rows rotation moves out of the main table; anomalies and IOC matches stay there for the threat feed
+COLD_CONDITION = "is_anomaly = 0 AND ioc_match IS NULL"
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS event_rollups (
+        minute TEXT,
+        source TEXT,
+        event_type TEXT,
+        events INTEGER,
+        anomalies INTEGER,
+        score_sum REAL,
+        score_sumsq REAL,
+        score_min REAL,
+        score_max REAL,
+        PRIMARY KEY (minute, source, event_type)
+    ) WITHOUT ROWID
+    """,
+    # Events stored before rollups existed
+    """
+    INSERT INTO event_rollups
+        (minute, source, event_type, events, anomalies, score_sum, score_sumsq, score_min, score_max)
+    SELECT substr(timestamp, 1, 16), source, event_type, COUNT(*), SUM(is_anomaly),
+           SUM(anomaly_score), SUM(anomaly_score * anomaly_score), MIN(anomaly_score), MAX(anomaly_score)
+    FROM events
+    GROUP BY 1, 2, 3
+    """,
+]
+
+# Aggregation interval → (ISO timestamp prefix length, suffix completing the bucket label)
+BUCKETS = {"minute": (16, ""), "hour": (13, ":00"), "day": (10, "")}
+
+PARTITION_FILE = re.compile(r"events_(\d{8})\.db$")
+
+# Payload full-text index (see search.py): external content, so the payload text is stored only
+# once, in `events` of the same database. Partition files carry their own, dropped with the file.
+SEARCH_INDEX = "CREATE VIRTUAL TABLE {schema}.event_search USING fts5(raw_data, content='events', content_rowid='id')"
+
+# ==============================
+# ROLLUPS
+# ==============================
+def update_rollups(cursor, rows):
+    """
+    Fold (timestamp, source, event_type, score, is_anomaly) rows into event_rollups.
+    Runs on the caller's cursor so it commits with the event rows.
+    """
+    buckets = {}
+    for timestamp, source, event_type, score, flag in rows:
+        key = (timestamp[:16], source, event_type)  # YYYY-MM-DDTHH:MM
+        b = buckets.get(key)
+        if b is None:
+            buckets[key] = [1, flag, score, score * score, score, score]
+        else:
+            b[0] += 1
+            b[1] += flag
+            b[2] += score
+            b[3] += score * score
+            b[4] = min(b[4], score)
+            b[5] = max(b[5], score)
+    cursor.executemany("""
+        INSERT INTO event_rollups
+            (minute, source, event_type, events, anomalies, score_sum, score_sumsq, score_min, score_max)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (minute, source, event_type) DO UPDATE SET
+            events = events + excluded.events,
+            anomalies = anomalies + excluded.anomalies,
+            score_sum = score_sum + excluded.score_sum,
+            score_sumsq = score_sumsq + excluded.score_sumsq,
+            score_min = MIN(score_min, excluded.score_min),
+            score_max = MAX(score_max, excluded.score_max)
+    """, [key + tuple(values) for key, values in buckets.items()])
+
+def query_rollups(since: str = None, until: str = None, source: str = None, event_type: str = None,
+                  limit: int = 10000) -> list:
+    """Rollup rows with mean and standard deviation of the anomaly score, oldest first."""
+    conditions, params = [], []
+    for clause, value in [("minute >= ?", since), ("minute < ?", until),
+                          ("source = ?", source), ("event_type = ?", event_type)]:
+        if value is not None:
+            conditions.append(clause)
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with storage.connection() as conn:
+        cursor = conn.execute(f"""
+            SELECT minute, source, event_type, events, anomalies, score_sum, score_sumsq, score_min, score_max
+            FROM event_rollups {where}
+            ORDER BY minute
+            LIMIT ?
+        """, params + [limit])
+        rows = cursor.fetchall()
+
+    results = []
+    for minute, source, event_type, events, anomalies, total, sumsq, low, high in rows:
+        mean = total / events
+        results.append({
+            "minute": minute, "source": source, "event_type": event_type,
+            "events": events, "anomalies": anomalies,
+            "score_mean": mean, "score_std": max(sumsq / events - mean * mean, 0.0) ** 0.5,
+            "score_min": low, "score_max": high,
+        })
+    return results
+
+def aggregate_rollups(since: str, until: str, interval: str = "hour", source: str = None) -> list:
+    """Rollups re-bucketed to `interval` per source, with mean and std of the anomaly score, oldest first."""
+    length, suffix = BUCKETS[interval]
+    conditions, params = ["minute >= ?", "minute < ?"], [since[:16], until[:16]]  # minute keys are YYYY-MM-DDTHH:MM
+    if source is not None:
+        conditions.append("source = ?")
+        params.append(source)
+    with storage.connection() as conn:
+        rows = conn.execute(f"""
+            SELECT substr(minute, 1, {length}) || '{suffix}' AS bucket, source,
+                   SUM(events), SUM(anomalies), SUM(score_sum), SUM(score_sumsq), MIN(score_min), MAX(score_max)
+            FROM event_rollups
+            WHERE {" AND ".join(conditions)}
+            GROUP BY bucket, source
+            ORDER BY bucket, source
+        """, params).fetchall()
+
+    results = []
+    for bucket, source, events, anomalies, total, sumsq, low, high in rows:
+        mean = total / events
+        results.append({
+            "bucket": bucket, "source": source, "events": events, "anomalies": anomalies,
+            "score_mean": mean, "score_std": max(sumsq / events - mean * mean, 0.0) ** 0.5,
+            "score_min": low, "score_max": high,
+        })
+    return results
+
+# ==============================
+# PARTITION FILES
+# ==============================
+def partition_path(day: date) -> str:
+    return os.path.join(PARTITION_DIR, f"events_{day:%Y%m%d}.db")
+
+def partition_days() -> list:
+    """Days that have a partition file, oldest first."""
+    days = []
+    for path in glob.glob(os.path.join(PARTITION_DIR, "events_*.db")):
+        match = PARTITION_FILE.search(path)
+        if match:
+            days.append(datetime.strptime(match.group(1), "%Y%m%d").date())
+    return sorted(days)
+
+def _columns(conn, schema: str) -> list:
+    return [row[1] for row in conn.execute(f"PRAGMA {schema}.table_info(events)")]
+
+def _attach(conn, day: date, alias: str = "part"):
+    os.makedirs(PARTITION_DIR, exist_ok=True)
+    conn.execute(f"ATTACH DATABASE ? AS {alias}", (partition_path(day),))
+    if not _columns(conn, alias):
+        columns = ", ".join(
+            f'"{name}" INTEGER PRIMARY KEY' if name == "id" else f'"{name}" {kind}'
+            for _, name, kind, *_ in conn.execute("PRAGMA main.table_info(events)")
+        )
+        conn.execute(f"CREATE TABLE {alias}.events ({columns})")
+        conn.execute(f"CREATE INDEX {alias}.idx_part_events_timestamp ON events (timestamp, id)")
+        for column in payloads.INDEXED_COLUMNS:
+            if column in _columns(conn, alias):
+                conn.execute(
+                    f'CREATE INDEX {alias}.idx_part_events_{column} ON events ("{column}", timestamp, id) '
+                    f'WHERE "{column}" IS NOT NULL'
+                )
+        conn.commit()
+    if not conn.execute(f"SELECT 1 FROM {alias}.sqlite_master WHERE name = 'event_search'").fetchone():
+        conn.execute(SEARCH_INDEX.format(schema=alias))  # also for files written before search existed
+        conn.execute(f"INSERT INTO {alias}.event_search (event_search) VALUES ('rebuild')")
+        conn.commit()
+
+def rotate(now: datetime = None) -> dict:
+    """
+    Move normal events older than the hot window into per-day partition files.
+    Returns {day: rows moved}.
+    """
+    cutoff = ((now or datetime.now()).date() - timedelta(days=HOT_DAYS - 1)).isoformat()
+    moved = {}
+    with storage.connection() as conn:
+        oldest = conn.execute(
+            f"SELECT MIN(timestamp) FROM events WHERE {COLD_CONDITION} AND timestamp < ?", (cutoff,)
+        ).fetchone()[0]
+        if not oldest:
+            return moved
+
+        day = datetime.fromisoformat(oldest[:10]).date()
+        while day.isoformat() < cutoff:
+            start, end = day.isoformat(), (day + timedelta(days=1)).isoformat()
+            if not conn.execute(
+                f"SELECT 1 FROM main.events WHERE timestamp >= ? AND timestamp < ? AND {COLD_CONDITION} LIMIT 1",
+                (start, end)
+            ).fetchone():
+                day += timedelta(days=1)
+                continue  # no events that day: do not create an empty partition file
+            _attach(conn, day)
+            try:
+                shared = [c for c in _columns(conn, "part") if c in set(_columns(conn, "main"))]
+                columns = ", ".join(f'"{c}"' for c in shared)
+                while True:
+                    conn.execute("BEGIN IMMEDIATE")
+                    ids = [row[0] for row in conn.execute(f"""
+                        SELECT id FROM main.events
+                        WHERE timestamp >= ? AND timestamp < ? AND {COLD_CONDITION}
+                        LIMIT ?
+                    """, (start, end, ROTATE_CHUNK))]
+                    if not ids:
+                        conn.commit()
+                        break
+                    placeholders = ",".join("?" * len(ids))
+                    present = {row[0] for row in conn.execute(
+                        f"SELECT id FROM part.events WHERE id IN ({placeholders})", ids
+                    )}  # already moved by an interrupted earlier run
+                    conn.execute(
+                        f"INSERT OR IGNORE INTO part.events ({columns}) "
+                        f"SELECT {columns} FROM main.events WHERE id IN ({placeholders})", ids
+                    )
+                    new_ids = [i for i in ids if i not in present]
+                    if new_ids:
+                        conn.execute(
+                            f"INSERT INTO part.event_search (rowid, raw_data) "
+                            f"SELECT id, raw_data FROM part.events WHERE id IN ({','.join('?' * len(new_ids))})",
+                            new_ids
+                        )
+                    conn.execute(f"DELETE FROM main.events WHERE id IN ({placeholders})", ids)
+                    conn.commit()
+                    moved[start] = moved.get(start, 0) + len(ids)
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                conn.execute("DETACH DATABASE part")
+            day += timedelta(days=1)
+    return moved
+
+def enforce_retention(now: datetime = None) -> dict:
+    """
+    Drop partition files past RETENTION_DAYS, then delete expired anomalies (with their
+    detections) and rollups using indexed range deletes.
+    """
+    today = (now or datetime.now()).date()
+    cutoff = today - timedelta(days=RETENTION_DAYS)
+    dropped = []
+    for day in partition_days():
+        if day < cutoff:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(partition_path(day) + suffix):
+                    os.remove(partition_path(day) + suffix)
+            dropped.append(day.isoformat())
+
+    rollup_cutoff = (today - timedelta(days=ROLLUP_RETENTION_DAYS)).isoformat()
+    with storage.connection() as conn, conn:
+        expired = "SELECT id FROM events WHERE timestamp < ?"
+        conn.execute(f"DELETE FROM threat_detections WHERE event_id IN ({expired})", (cutoff.isoformat(),))
+        conn.execute(f"DELETE FROM review_queue WHERE event_id IN ({expired})", (cutoff.isoformat(),))
+        events_deleted = conn.execute("DELETE FROM events WHERE timestamp < ?", (cutoff.isoformat(),)).rowcount
+        rollups_deleted = conn.execute("DELETE FROM event_rollups WHERE minute < ?", (rollup_cutoff,)).rowcount
+    return {"partitions_dropped": dropped, "events_deleted": events_deleted, "rollups_deleted": rollups_deleted}
+
+# ==============================
+# READS ACROSS PARTITIONS
+# ==============================
+def query_event_history(since: str, until: str, source: str = None, event_type: str = None,
+                        limit: int = 1000, fields: dict = None) -> list:
+    """
+    Events in [since, until) from the main table and any overlapping partition files,
+    newest first. Partitions are attached one at a time, so any window fits within
+    SQLite's attached-database limit. `fields` adds equality filters on typed payload
+    columns (see payloads.py); partitions written before those columns existed are skipped.
+    """
+    fields = {k: v for k, v in (fields or {}).items() if v is not None}
+    conditions, params = ["timestamp >= ?", "timestamp < ?"], [since, until]
+    for clause, value in [("source = ?", source), ("event_type = ?", event_type)]:
+        if value is not None:
+            conditions.append(clause)
+            params.append(value)
+    for column, value in fields.items():
+        conditions.append(f'"{column}" = ?')
+        params.append(value)
+    where = " AND ".join(conditions)
+    columns = "id, timestamp, source, event_type, raw_data, anomaly_score, is_anomaly"
+
+    first, last = since[:10], until[:10]
+    rows = []
+    with storage.connection() as conn:
+        conn.row_factory = sqlite3.Row
+        try:
+            rows.extend(dict(r) for r in conn.execute(
+                f"SELECT {columns} FROM main.events WHERE {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+                params + [limit]
+            ))
+            for day in reversed(partition_days()):
+                if not first <= day.isoformat() <= last:
+                    continue
+                rows.sort(key=lambda r: (r["timestamp"], r["id"]), reverse=True)
+                if len(rows) >= limit and rows[limit - 1]["timestamp"] >= (day + timedelta(days=1)).isoformat():
+                    break  # every remaining partition is older than the rows already collected
+                conn.execute("ATTACH DATABASE ? AS hist", (partition_path(day),))
+                try:
+                    if not set(fields) <= set(_columns(conn, "hist")):
+                        continue
+                    rows.extend(dict(r) for r in conn.execute(
+                        f"SELECT {columns} FROM hist.events WHERE {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+                        params + [limit]
+                    ))
+                finally:
+                    conn.execute("DETACH DATABASE hist")
+        finally:
+            conn.row_factory = None
+
+    rows.sort(key=lambda r: (r["timestamp"], r["id"]), reverse=True)
+    return rows[:limit]
+
+# ==============================
+# BACKGROUND MAINTENANCE
+# ==============================
+class MaintenanceWorker:
+    """
+    Runs rotate() and enforce_retention() every `interval` seconds on a daemon thread.
+    `after_rotate()` (e.g. archival of cold partitions) runs between the two, and
+    `before_rotate()` (e.g. backfills that must reach rows before they move) before
+    rotate(); their results are merged into the run summary.
+    """
+
+    def __init__(self, interval: float = MAINTENANCE_INTERVAL, after_rotate=None, before_rotate=None):
+        self.interval = interval
+        self.after_rotate = after_rotate
+        self.before_rotate = before_rotate
+        self._stop = threading.Event()
+        self._thread = None
+        self.last_run = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="partition-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run_once(self) -> dict:
+        result = self.before_rotate() if self.before_rotate else {}
+        result["rotated"] = rotate()
+        if self.after_rotate:
+            result.update(self.after_rotate())
+        result.update(enforce_retention())
+        self.last_run = {"at": datetime.now().isoformat(), **result}
+        return result
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"⚠️  Partition maintenance error: {e}")
+            self._stop.wait(self.interval)
@@ -0,0 +1,124 @@
+# payloads.py
+"""
+Typed Event Payloads
+--------------------
+Handles:
+- The key fields of the key=value `data` payloads of known event types:
+    osquery process_create   host, user, pid, path, cmdline
+    zeek    dns_query        id.orig_h, id.resp_h, query
+- Extracting them once at ingest (from the payloads already parsed for
+  scoring) into real columns of `events`, so lookups such as
+  "all events from 10.0.0.42" use an index instead of LIKE over raw_data
+- The schema migration adding those columns and their indexes
+- Backfilling the columns of events stored before the migration, in short
+  chunked transactions from the maintenance run
+
+Column mapping (payload field → events column):
+    host      osquery host / Zeek id.orig_h (the originating host)
+    dst_ip    Zeek id.resp_h
+    user, pid, path, cmdline, query
+Other event types keep these columns NULL; raw_data is always stored unchanged.
+Values are not validated: a malformed pid is stored as NULL, everything else as text.
+"""
+
+import pandas as pd
+
+import scoring
+import storage
+
+# ==============================
+# CONFIGURATION
+# ==============================
+BACKFILL_CHUNK = 5000  # events updated per transaction, keeps the write lock short
+
+# (source, event_type) → {payload field: events column}
+PAYLOAD_FIELDS = {
+    ("osquery", "process_create"): {"host": "host", "user": "user", "pid": "pid", "path": "path", "cmdline": "cmdline"},
+    ("zeek", "dns_query"): {"id.orig_h": "host", "id.resp_h": "dst_ip", "query": "query"},
+}
+
+# events columns, in row order; the first group is indexed for equality lookups
+COLUMNS = ["host", "user", "pid", "path", "cmdline", "dst_ip", "query"]
+COLUMN_TYPES = {"pid": "INTEGER"}
+INDEXED_COLUMNS = ["host", "user", "dst_ip", "query"]
+
+SCHEMA = [
+    *(f'ALTER TABLE events ADD COLUMN "{c}" {COLUMN_TYPES.get(c, "TEXT")}' for c in COLUMNS),
+    *(f'CREATE INDEX IF NOT EXISTS idx_events_{c} ON events ("{c}", timestamp, id) WHERE "{c}" IS NOT NULL'
+      for c in INDEXED_COLUMNS),
+]
+
+# Backfill progress: events with next_id <= id <= end_id predate the columns
+BACKFILL_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS payload_backfill (next_id INTEGER, end_id INTEGER)",
+    "INSERT INTO payload_backfill SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM events",
+]
+
+# ==============================
+# EXTRACTION
+# ==============================
+def _typed(values: pd.Series, column: str) -> pd.Series:
+    if COLUMN_TYPES.get(column) == "INTEGER":
+        return pd.to_numeric(values, errors="coerce").astype("Int64")  # malformed pids become NULL
+    return values.astype("string")
+
+def extract(sources: list, event_types: list, payloads: pd.DataFrame) -> list:
+    """
+    One tuple of COLUMNS values per event (None where absent), from payloads parsed
+    with scoring.parse_payloads. Rows of unknown event types are all None.
+    """
+    index = payloads.index
+    out = pd.DataFrame({c: pd.Series(pd.NA, index=index, dtype="object") for c in COLUMNS})
+    kinds = pd.Series(list(zip(sources, event_types)), index=index)
+    for kind, fields in PAYLOAD_FIELDS.items():
+        mask = kinds == kind
+        if not mask.any():
+            continue
+        for key, column in fields.items():
+            if key in payloads:
+                out.loc[mask, column] = _typed(payloads.loc[mask, key], column)
+    out = out.astype(object).where(out.notna(), None)
+    return list(out.itertuples(index=False, name=None))
+
+# ==============================
+# BACKFILL
+# ==============================
+def backfill(chunk: int = BACKFILL_CHUNK) -> dict:
+    """
+    Fill the typed columns of events stored before they existed, re-parsing raw_data
+    `chunk` rows per transaction. Resumes where the previous (possibly interrupted) run
+    stopped and is a no-op once done. Returns {"payload_backfilled": rows updated}.
+    """
+    kinds = " OR ".join("(source = ? AND event_type = ?)" for _ in PAYLOAD_FIELDS)
+    kind_params = [value for kind in PAYLOAD_FIELDS for value in kind]
+    assignments = ", ".join(f'"{c}" = ?' for c in COLUMNS)
+    updated = 0
+    with storage.connection() as conn:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                progress = conn.execute("SELECT next_id, end_id FROM payload_backfill").fetchone()
+                if progress is None or progress[0] > progress[1]:
+                    conn.commit()
+                    break
+                next_id, end_id = progress
+                last_id = min(next_id + chunk - 1, end_id)
+                rows = conn.execute(f"""
+                    SELECT id, source, event_type, raw_data FROM events
+                    WHERE id BETWEEN ? AND ? AND ({kinds})
+                """, [next_id, last_id] + kind_params).fetchall()
+                if rows:
+                    ids, sources, event_types, data = zip(*rows)
+                    parsed = scoring.parse_payloads(pd.Series(data, dtype=object))
+                    values = extract(list(sources), list(event_types), parsed)
+                    conn.executemany(
+                        f"UPDATE events SET {assignments} WHERE id = ?",
+                        [row + (event_id,) for row, event_id in zip(values, ids)],
+                    )
+                conn.execute("UPDATE payload_backfill SET next_id = ?", (last_id + 1,))
+                conn.commit()
+                updated += len(rows)
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+    return {"payload_backfilled": updated}
@@ -0,0 +1,172 @@
+# review_cache.py
+"""
+Gemini Review Result Cache
+--------------------------
+Handles:
+- Normalizing event payloads into a signature (timestamps, uuids, pids, source
+  ports, connection ids, short hex ids, long numbers and random suffixes
+  stripped; addresses and file hashes kept) so repeat anomalies match
+- An in-memory LRU/TTL cache of reviews, backed by the `review_cache` SQLite table
+  so cached reviews survive restarts and are shared between worker processes
+  (expired rows are purged by the partition maintenance run, see backend.after_rotate)
+- Hit/miss counters for monitoring
+- Bypassing the cache for events that matched a known-bad indicator
+
+Configuration (environment variables):
+    REVIEW_CACHE_SIZE, REVIEW_CACHE_TTL
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import storage
+
+# ==============================
+# CONFIGURATION
+# ==============================
+REVIEW_CACHE_SIZE = int(os.environ.get("REVIEW_CACHE_SIZE", "10000"))  # in-memory entries
+REVIEW_CACHE_TTL = float(os.environ.get("REVIEW_CACHE_TTL", "86400"))   # seconds
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS review_cache (
+        signature TEXT PRIMARY KEY,
+        review TEXT,
+        created_at REAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_review_cache_created ON review_cache (created_at)",
+]
+
+# Ordered (pattern, replacement) rules; earlier rules run first. Only values that change on every
+# occurrence are stripped: addresses, destination ports, hashes and hosts stay part of the signature,
+# so a cached review is never reused for a different binary or destination.
+NORMALIZATION_RULES = [
+    (re.compile(r",?\s*anomaly_factor=[^,]*"), ""),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}[T ][\d:.]+(?:Z|[+-]\d{2}:?\d{2})?"), "<ts>"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I), "<uuid>"),
+    (re.compile(r"\b(pid|ppid)=\d+"), r"\1=<n>"),
+    (re.compile(r"\b(id\.orig_p|src_port|sport)=\d+"), r"\1=<n>"),  # ephemeral source ports
+    (re.compile(r"\buid=C[0-9A-Za-z]+"), "uid=<uid>"),              # Zeek connection uids
+    (re.compile(r"\b[0-9a-f]{8,31}\b", re.I), "<hex>"),              # short ids; 32+ hex chars are hashes
+    (re.compile(r"(?<=[A-Za-z])([-_.])\d{6,}"), r"\1<n>"),  # random suffixes like malicious-1718000000.com
+    (re.compile(r"(?<!_p=)\b\d{5,}\b"), "<n>"),  # counters and sizes, not ports
+    (re.compile(r"\s+"), " "),
+]
+
+# ==============================
+# SIGNATURES
+# ==============================
+def normalize_payload(event_data: str) -> str:
+    """Strip volatile parts of a payload so repeated activity normalizes to the same text."""
+    text = event_data or ""
+    for pattern, replacement in NORMALIZATION_RULES:
+        text = pattern.sub(replacement, text)
+    return text.strip(" ,")
+
+def event_signature(event_data: str) -> str:
+    """Stable cache key for a payload."""
+    return hashlib.sha1(normalize_payload(event_data).encode("utf-8")).hexdigest()
+
+# ==============================
+# CACHE
+# ==============================
+class ReviewCache:
+    """Two-level (memory LRU + SQLite) review cache with TTL expiry."""
+
+    def __init__(self, max_entries: int = REVIEW_CACHE_SIZE, ttl: float = REVIEW_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # signature -> (created_at, review)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.bypassed = 0  # IOC matches, never served from the cache
+
+    def get(self, signature: str):
+        """Cached review for `signature`, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry and now - entry[0] < self.ttl:
+                self._entries.move_to_end(signature)
+                self.memory_hits += 1
+                return entry[1]
+            self._entries.pop(signature, None)
+
+        with storage.connection() as conn:
+            row = conn.execute(
+                "SELECT created_at, review FROM review_cache WHERE signature = ? AND created_at > ?",
+                (signature, now - self.ttl)
+            ).fetchone()
+        if row is None:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        review = json.loads(row[1])
+        with self._lock:
+            self.db_hits += 1
+            self._remember(signature, row[0], review)
+        return review
+
+    def put(self, signature: str, review: dict):
+        """Store a review in memory and in SQLite."""
+        now = time.time()
+        with self._lock:
+            self._remember(signature, now, review)
+        with storage.connection() as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO review_cache (signature, review, created_at) VALUES (?, ?, ?)",
+                (signature, json.dumps(review), now)
+            )
+
+    def _remember(self, signature: str, created_at: float, review: dict):
+        self._entries[signature] = (created_at, review)
+        self._entries.move_to_end(signature)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        """Delete expired rows from SQLite; returns the number removed."""
+        with storage.connection() as conn, conn:
+            return conn.execute(
+                "DELETE FROM review_cache WHERE created_at <= ?", (time.time() - self.ttl,)
+            ).rowcount
+
+    def wrap(self, reviewer):
+        """
+        Return a reviewer with the same signature as `reviewer(event_data, ioc_match)` that
+        consults the cache first. Events that matched a known-bad indicator always get a fresh
+        review: the payload shape says nothing about whether its destination is on the IOC list.
+        """
+        def cached_reviewer(event_data: str, ioc_match: str = None) -> dict:
+            if ioc_match:
+                with self._lock:
+                    self.bypassed += 1
+                return reviewer(event_data, ioc_match)
+            signature = event_signature(event_data)
+            review = self.get(signature)
+            if review is None:
+                review = reviewer(event_data, None)
+                self.put(signature, review)
+            return review
+        return cached_reviewer
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_ratio": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+            }
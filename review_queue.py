@@ -0,0 +1,206 @@
+# review_queue.py
+"""
+Asynchronous AI Review Queue
+----------------------------
+Handles:
+- A persistent `review_queue` table holding anomalous events awaiting Gemini review
+- A background worker that claims queued events in batches, calls the reviewer
+  with bounded concurrency, retries failures with exponential backoff and
+  writes `threat_detections` rows once a review succeeds
+
+Ingest only enqueues (inside its own transaction), so ingest latency no longer
+depends on how long the reviewer takes.
+
+Configuration (environment variables):
+    REVIEW_BATCH_SIZE, REVIEW_CONCURRENCY, REVIEW_MAX_ATTEMPTS,
+    REVIEW_BACKOFF_BASE, REVIEW_BACKOFF_MAX, REVIEW_POLL_INTERVAL, REVIEW_CLAIM_TIMEOUT
+"""
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import storage
+
+# ==============================
+# CONFIGURATION
+# ==============================
+REVIEW_BATCH_SIZE = int(os.environ.get("REVIEW_BATCH_SIZE", "32"))
+REVIEW_CONCURRENCY = int(os.environ.get("REVIEW_CONCURRENCY", "4"))
+REVIEW_MAX_ATTEMPTS = int(os.environ.get("REVIEW_MAX_ATTEMPTS", "5"))
+REVIEW_BACKOFF_BASE = float(os.environ.get("REVIEW_BACKOFF_BASE", "2"))     # seconds
+REVIEW_BACKOFF_MAX = float(os.environ.get("REVIEW_BACKOFF_MAX", "300"))     # seconds
+REVIEW_POLL_INTERVAL = float(os.environ.get("REVIEW_POLL_INTERVAL", "0.5"))  # seconds
+REVIEW_CLAIM_TIMEOUT = float(os.environ.get("REVIEW_CLAIM_TIMEOUT", "300"))  # reclaim stuck rows after this
+
+# ==============================
+# QUEUE TABLE
+# ==============================
+def setup_review_queue(cursor):
+    """Create the persistent review queue table."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS review_queue (
+            event_id INTEGER PRIMARY KEY,
+            event_data TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL,
+            claimed_at REAL,
+            last_error TEXT,
+            enqueued_at REAL,
+            FOREIGN KEY (event_id) REFERENCES events(id)
+        )
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_review_queue_ready
+        ON review_queue (status, next_attempt_at)
+    """)
+
+def enqueue(cursor, items):
+    """
+    Queue (event_id, event_data) pairs for review.
+    Runs on the caller's cursor so it commits together with the event rows.
+    """
+    now = time.time()
+    cursor.executemany("""
+        INSERT OR IGNORE INTO review_queue (event_id, event_data, status, attempts, next_attempt_at, enqueued_at)
+        VALUES (?, ?, 'pending', 0, ?, ?)
+    """, [(event_id, data, now, now) for event_id, data in items])
+
+def queue_depth() -> dict:
+    """Return the number of queued reviews per status."""
+    with storage.connection() as conn:
+        rows = conn.execute("SELECT status, COUNT(*) FROM review_queue GROUP BY status").fetchall()
+    return dict(rows)
+
+def _backoff(attempts: int) -> float:
+    """Exponential backoff with jitter, capped at REVIEW_BACKOFF_MAX."""
+    delay = min(REVIEW_BACKOFF_BASE * (2 ** (attempts - 1)), REVIEW_BACKOFF_MAX)
+    return delay * (0.5 + random.random() / 2)
+
+# ==============================
+# BACKGROUND WORKER
+# ==============================
+class ReviewWorker:
+    """
+    Background thread draining the review queue.
+    `reviewer(event_data, ioc_match) -> {"review", "mitigation", "confidence"}` is called for
+    each claimed event on a pool of `concurrency` threads; `ioc_match` is the event's matched
+    known-bad indicators (see search.py) or None. `on_reviewed(event_ids)`,
+    if given, is called after each batch of detections is committed.
+    """
+
+    def __init__(self, reviewer, on_reviewed=None, batch_size: int = REVIEW_BATCH_SIZE, concurrency: int = REVIEW_CONCURRENCY,
+                 max_attempts: int = REVIEW_MAX_ATTEMPTS, poll_interval: float = REVIEW_POLL_INTERVAL):
+        self.reviewer = reviewer
+        self.on_reviewed = on_reviewed
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+
+    def start(self):
+        """Start the worker thread (no-op if already running)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="review")
+        self._thread = threading.Thread(target=self._run, name="review-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Signal the worker to stop and wait for the current batch to finish."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._pool:
+            self._pool.shutdown(wait=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                processed = self.process_batch()
+            except Exception as e:
+                print(f"⚠️  Review worker error: {e}")
+                processed = 0
+            if not processed:
+                self._stop.wait(self.poll_interval)
+
+    def claim_batch(self) -> list:
+        """Atomically claim up to `batch_size` ready events; returns (event_id, data, attempts, ioc_match) rows."""
+        now = time.time()
+        with storage.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Reclaim rows left in progress by a crashed worker
+            conn.execute("""
+                UPDATE review_queue SET status = 'pending'
+                WHERE status = 'in_progress' AND claimed_at < ?
+            """, (now - REVIEW_CLAIM_TIMEOUT,))
+            rows = conn.execute("""
+                SELECT q.event_id, q.event_data, q.attempts, e.ioc_match
+                FROM review_queue q
+                LEFT JOIN events e ON e.id = q.event_id
+                WHERE q.status = 'pending' AND q.next_attempt_at <= ?
+                ORDER BY q.next_attempt_at
+                LIMIT ?
+            """, (now, self.batch_size)).fetchall()
+            conn.executemany(
+                "UPDATE review_queue SET status = 'in_progress', claimed_at = ? WHERE event_id = ?",
+                [(now, row[0]) for row in rows],
+            )
+            conn.commit()
+        return rows
+
+    def _review(self, data: str, ioc_match: str):
+        try:
+            with metrics.timed("gemini_review_pipeline"):
+                return self.reviewer(data, ioc_match), None
+        except Exception as e:
+            return None, e
+
+    def process_batch(self) -> int:
+        """Claim, review and record one batch. Returns the number of events processed."""
+        rows = self.claim_batch()
+        if not rows:
+            return 0
+
+        results = list(self._pool.map(self._review, [row[1] for row in rows], [row[3] for row in rows]))
+
+        done, retries, failed = [], [], []
+        now = time.time()
+        for (event_id, _, attempts, _), (review, error) in zip(rows, results):
+            if error is None:
+                done.append((event_id, review["review"], review["mitigation"], review["confidence"]))
+            elif attempts + 1 >= self.max_attempts:
+                failed.append((attempts + 1, str(error), event_id))
+            else:
+                retries.append((attempts + 1, now + _backoff(attempts + 1), str(error), event_id))
+
+        metrics.REVIEWS.inc(len(done), outcome="done")
+        metrics.REVIEWS.inc(len(retries), outcome="retry")
+        metrics.REVIEWS.inc(len(failed), outcome="failed")
+
+        with storage.connection() as conn, conn, metrics.timed("detections_insert"):
+            conn.executemany("""
+                INSERT OR REPLACE INTO threat_detections (event_id, gemini_review, mitigation_suggestion, gemini_confidence)
+                VALUES (?, ?, ?, ?)
+            """, done)
+            conn.executemany("DELETE FROM review_queue WHERE event_id = ?", [(row[0],) for row in done])
+            conn.executemany("""
+                UPDATE review_queue SET status = 'pending', attempts = ?, next_attempt_at = ?, last_error = ?
+                WHERE event_id = ?
+            """, retries)
+            conn.executemany("""
+                UPDATE review_queue SET status = 'failed', attempts = ?, last_error = ?
+                WHERE event_id = ?
+            """, failed)
+
+        if done and self.on_reviewed:
+            self.on_reviewed([row[0] for row in done])
+        return len(rows)
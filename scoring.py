@@ -0,0 +1,197 @@
+# scoring.py
+"""
+Anomaly Scoring Engine
+----------------------
+Handles:
+- Vectorized parsing of osquery / Zeek key=value payloads into a numeric feature matrix
+- Loading a persisted Isolation Forest (joblib) once and scoring events in micro-batches
+- Training and saving that model from events already stored in SQLite
+
+If no model file is present, the engine falls back to the demo behaviour: the
+client-supplied `anomaly_factor=` hint, or a random score when it is missing.
+
+Train a model:
+    python scoring.py train --db threat_events.db --out models/isolation_forest.joblib
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# ==============================
+# CONFIGURATION
+# ==============================
+MODEL_PATH = os.environ.get("THREAT_MODEL_PATH", "models/isolation_forest.joblib")
+SCORING_BATCH_SIZE = int(os.environ.get("SCORING_BATCH_SIZE", "4096"))  # rows per model call
+
+# key=value pairs; values may be single-quoted and contain commas
+KV_PATTERN = r"(?P<key>[\w.]+)=(?P<value>'[^']*'|[^,]*)"
+PRIVATE_IP_PATTERN = r"^(?:10\.|192\.168\.|172\.(?:1[6-9]|2\d|3[01])\.|127\.)"
+
+FEATURES = [
+    "is_zeek",
+    "is_root",
+    "pid",
+    "cmdline_len",
+    "cmdline_downloader",
+    "cmdline_pipe_to_stdout",
+    "path_depth",
+    "query_len",
+    "query_digits",
+    "query_labels",
+    "orig_host_octet",
+    "resp_is_private",
+    "proto_udp",
+    "payload_len",
+    "field_count",
+]
+
+# ==============================
+# FEATURE EXTRACTION
+# ==============================
+def parse_payloads(data: pd.Series) -> pd.DataFrame:
+    """
+    Parse key=value payload strings into a wide frame (one column per key).
+    Row i of the result corresponds to data.iloc[i]; missing keys are NaN.
+    """
+    data = data.reset_index(drop=True).fillna("")
+    pairs = data.str.extractall(KV_PATTERN)
+    if pairs.empty:
+        return pd.DataFrame(index=data.index)
+    pairs["value"] = pairs["value"].str.strip().str.strip("'")
+    pairs = pairs.droplevel("match").reset_index(names="row")
+    pairs = pairs.drop_duplicates(["row", "key"])
+    wide = pairs.pivot(index="row", columns="key", values="value")
+    wide.columns.name = None
+    return wide.reindex(data.index)
+
+def extract_features(frame: pd.DataFrame, payloads: pd.DataFrame = None) -> np.ndarray:
+    """
+    Build the model feature matrix from a frame with `source`, `event_type` and `data` columns.
+    Columns follow FEATURES. The demo `anomaly_factor` hint is never used as a feature.
+    `payloads` (parse_payloads of the same rows) skips re-parsing when the caller has it.
+    """
+    frame = frame.reset_index(drop=True)
+    kv = parse_payloads(frame["data"]) if payloads is None else payloads.reset_index(drop=True)
+    kv = kv.drop(columns="anomaly_factor", errors="ignore")
+
+    def text(key):
+        return kv[key].fillna("") if key in kv else pd.Series("", index=kv.index)
+
+    cmdline = text("cmdline")
+    query = text("query")
+    features = pd.DataFrame({
+        "is_zeek": frame["source"].eq("zeek"),
+        "is_root": text("user").eq("root"),
+        "pid": pd.to_numeric(text("pid"), errors="coerce"),
+        "cmdline_len": cmdline.str.len(),
+        "cmdline_downloader": cmdline.str.contains(r"\b(?:wget|curl)\b"),
+        "cmdline_pipe_to_stdout": cmdline.str.contains(r"-O -|\|"),
+        "path_depth": text("path").str.count("/"),
+        "query_len": query.str.len(),
+        "query_digits": query.str.count(r"\d"),
+        "query_labels": query.str.count(r"\.") + query.ne(""),
+        "orig_host_octet": pd.to_numeric(text("id.orig_h").str.rsplit(".", n=1).str[-1], errors="coerce"),
+        "resp_is_private": text("id.resp_h").str.match(PRIVATE_IP_PATTERN),
+        "proto_udp": text("proto").eq("udp"),
+        "payload_len": frame["data"].fillna("").str.len(),
+        "field_count": kv.notna().sum(axis=1),
+    }, columns=FEATURES)
+    return features.astype(float).fillna(0.0).to_numpy()
+
+def anomaly_factor_scores(data: pd.Series) -> np.ndarray:
+    """Demo fallback: the `anomaly_factor=` hint, or a random score where it is missing."""
+    hints = pd.to_numeric(
+        data.reset_index(drop=True).str.extract(r"anomaly_factor=\s*([-+\d.eE]+)")[0],
+        errors="coerce"
+    ).to_numpy(dtype=float, copy=True)
+    missing = np.isnan(hints)
+    hints[missing] = np.random.random(missing.sum())
+    return hints
+
+# ==============================
+# SCORING ENGINE
+# ==============================
+class ScoringEngine:
+    """Loads the persisted Isolation Forest once and scores events in micro-batches."""
+
+    def __init__(self, model_path: str = MODEL_PATH, batch_size: int = SCORING_BATCH_SIZE):
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.model = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the model file if present. Safe to call repeatedly; only the first call does work."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.model_path):
+                print(f"ℹ️  No model at {self.model_path}; using anomaly_factor demo scoring.")
+                return
+            bundle = joblib.load(self.model_path)
+            if bundle.get("features") != FEATURES:
+                print(f"⚠️  Model at {self.model_path} was trained on different features; ignoring it.")
+                return
+            self.model = bundle["model"]
+            print(f"✅ Loaded Isolation Forest from {self.model_path}")
+
+    def score(self, frame: pd.DataFrame, payloads: pd.DataFrame = None) -> np.ndarray:
+        """
+        Anomaly scores in [0, 1] (higher = more anomalous) for a frame with
+        `source`, `event_type` and `data` columns (and optionally its parsed payloads).
+        """
+        self.load()
+        if self.model is None:
+            return anomaly_factor_scores(frame["data"])
+        scores = [
+            # decision_function < 0 marks an outlier at the trained contamination level;
+            # shift it so the backend's 0.5 anomaly threshold lines up with that boundary
+            np.clip(0.5 - self.model.decision_function(extract_features(
+                frame.iloc[start:start + self.batch_size],
+                None if payloads is None else payloads.iloc[start:start + self.batch_size],
+            )), 0.0, 1.0)
+            for start in range(0, len(frame), self.batch_size)
+        ]
+        return np.concatenate(scores) if scores else np.empty(0)
+
+engine = ScoringEngine()
+
+# ==============================
+# TRAINING
+# ==============================
+def train_model(frame: pd.DataFrame, out_path: str = MODEL_PATH, contamination: float = 0.1, n_estimators: int = 200):
+    """Fit an Isolation Forest on `frame` and persist it with joblib."""
+    from sklearn.ensemble import IsolationForest  # only needed for training
+
+    model = IsolationForest(n_estimators=n_estimators, contamination=contamination, random_state=42)
+    model.fit(extract_features(frame))
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    joblib.dump({"model": model, "features": FEATURES}, out_path)
+    return model
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Anomaly scoring engine utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    train = sub.add_parser("train", help="Train an Isolation Forest from stored events")
+    train.add_argument("--db", default="threat_events.db")
+    train.add_argument("--out", default=MODEL_PATH)
+    train.add_argument("--limit", type=int, default=500000)
+    train.add_argument("--contamination", type=float, default=0.1)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    events = pd.read_sql_query(
+        "SELECT source, event_type, raw_data AS data FROM events ORDER BY id DESC LIMIT ?",
+        conn, params=[args.limit]
+    )
+    conn.close()
+    train_model(events, args.out, contamination=args.contamination)
+    print(f"✅ Trained on {len(events)} events → {args.out}")
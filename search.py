@@ -0,0 +1,325 @@
+# search.py
+"""
+Event Search Index and IOC Matching
+-----------------------------------
+Handles:
+- `event_search`: an SQLite FTS5 index over event payloads, written in the
+  same transaction as the events themselves (rowid = events.id), so domains,
+  command lines, hashes and IPs are found with an index lookup instead of
+  LIKE '%...%' over the whole events table. It is an external-content index:
+  the payload text lives only in `events`, the index holds just the tokens.
+- A hash set of known-bad indicators (domains, IPs, file hashes) loaded from
+  THREAT_IOC_FILE. Every ingested payload is checked against it; matches are
+  recorded in events.ioc_match and the event is flagged for review regardless
+  of its anomaly score. Subdomains of a listed domain match too.
+- Search queries (plain terms or FTS5 syntax) with id-cursor pagination over the
+  main database and the partition files
+- Incremental index merges from the maintenance run, and indexing events
+  stored before the index existed in short chunked transactions (until that
+  backfill catches up, older events in the main table are not found)
+
+Index entries follow their events: a trigger removes them when rows leave the
+main table (rotation, retention), rotation indexes the moved rows in the
+partition file's own `event_search` (see partitions.py), and archiving a day
+rebuilds its index as a token-only file next to the Parquet archive (see
+archive.py), dropped with it at THREAT_ARCHIVE_RETENTION_DAYS. Events are
+therefore searchable for exactly as long as they are kept.
+
+IOC file format: one indicator per line; blank lines and `#` comments are ignored.
+The file is re-read when it changes (checked every THREAT_IOC_RELOAD_INTERVAL seconds),
+including in multi-process ingest workers.
+
+Configuration (environment variables):
+    THREAT_IOC_FILE, THREAT_IOC_RELOAD_INTERVAL
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+from fastapi import HTTPException
+
+import archive
+import partitions
+import storage
+
+# ==============================
+# CONFIGURATION
+# ==============================
+IOC_FILE = os.environ.get("THREAT_IOC_FILE", "iocs.txt")
+IOC_RELOAD_INTERVAL = float(os.environ.get("THREAT_IOC_RELOAD_INTERVAL", "30"))  # seconds
+MERGE_PAGES = 500  # FTS5 incremental merge work per maintenance run
+BACKFILL_CHUNK = 5000  # events indexed per transaction, keeps the write lock short
+
+SCHEMA = [
+    "ALTER TABLE events ADD COLUMN ioc_match TEXT",
+    "CREATE INDEX IF NOT EXISTS idx_events_ioc ON events (id) WHERE ioc_match IS NOT NULL",
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS event_search USING fts5(
+        raw_data,
+        source UNINDEXED,
+        event_type UNINDEXED,
+        timestamp UNINDEXED,
+        anomaly_score UNINDEXED,
+        ioc_match UNINDEXED
+    )
+    """,
+    # Index events already in the main table
+    """
+    INSERT INTO event_search (rowid, raw_data, source, event_type, timestamp, anomaly_score)
+    SELECT id, raw_data, source, event_type, timestamp, anomaly_score FROM events
+    """,
+]
+
+# Replaces the copy-everything index above with an empty external-content one;
+# events with next_id <= id <= end_id are indexed later by backfill()
+INDEX_SCHEMA = [
+    "DROP TRIGGER IF EXISTS events_search_delete",
+    "DROP TABLE IF EXISTS event_search",
+    partitions.SEARCH_INDEX.format(schema="main"),
+    "CREATE TABLE IF NOT EXISTS search_backfill (next_id INTEGER, end_id INTEGER)",
+    "INSERT INTO search_backfill SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM events",
+    # External content: deleting an event must remove its tokens using the old payload.
+    # Rows still waiting for the backfill have no tokens, and a 'delete' for them would corrupt the index.
+    """
+    CREATE TRIGGER IF NOT EXISTS events_search_delete AFTER DELETE ON events
+    WHEN NOT EXISTS (SELECT 1 FROM search_backfill WHERE old.id BETWEEN next_id AND end_id)
+    BEGIN
+        INSERT INTO event_search (event_search, rowid, raw_data) VALUES ('delete', old.id, old.raw_data);
+    END
+    """,
+]
+
+# Result columns, in response order
+FIELDS = ["id", "timestamp", "source", "event_type", "raw_data", "anomaly_score", "ioc_match"]
+
+# Candidate indicators in a payload: domains, IPv4/IPv6 addresses, hex hashes
+IOC_TOKEN = re.compile(r"[0-9A-Za-z][0-9A-Za-z._:-]*[0-9A-Za-z]")
+
+# ==============================
+# IOC SET
+# ==============================
+class IocSet:
+    """Known-bad indicators as a hash set, reloaded from `path` when the file changes."""
+
+    def __init__(self, path: str = IOC_FILE, reload_interval: float = IOC_RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.indicators = frozenset()
+        self.loaded_at = None
+        self._mtime = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """Re-read the file if it changed since the last load (at most every reload_interval)."""
+        now = time.monotonic()
+        if self._checked and now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = None
+            if mtime == self._mtime:
+                return
+            indicators = set()
+            if mtime is not None:
+                with open(self.path, encoding="utf-8") as f:
+                    for line in f:
+                        value = line.split("#", 1)[0].strip().lower()
+                        if value:
+                            indicators.add(value)
+            self.indicators = frozenset(indicators)
+            self._mtime = mtime
+            self.loaded_at = datetime.now().isoformat()
+
+    def _lookup(self, token: str) -> str:
+        token = token.lower()
+        if token in self.indicators:
+            return token
+        labels = token.split(".")
+        for i in range(1, len(labels) - 1):  # parent domains, never the bare TLD
+            parent = ".".join(labels[i:])
+            if parent in self.indicators:
+                return parent
+        return None
+
+    def match(self, payloads: list) -> list:
+        """For each payload string, the matched indicators (comma-separated) or None."""
+        self.refresh()
+        if not self.indicators:
+            return [None] * len(payloads)
+        matches = []
+        for data in payloads:
+            hits = {hit for hit in map(self._lookup, IOC_TOKEN.findall(data or "")) if hit}
+            matches.append(",".join(sorted(hits)) if hits else None)
+        return matches
+
+    def status(self) -> dict:
+        self.refresh()
+        return {"path": self.path, "indicators": len(self.indicators), "loaded_at": self.loaded_at}
+
+iocs = IocSet()
+
+# ==============================
+# INDEXING
+# ==============================
+def index_events(cursor, rows: list):
+    """Add (id, raw_data) rows to the search index on the caller's cursor, so they commit with the events."""
+    if rows:
+        cursor.executemany("INSERT INTO event_search (rowid, raw_data) VALUES (?, ?)", rows)
+
+def backfill(chunk: int = BACKFILL_CHUNK) -> dict:
+    """
+    Index the events stored before the main index existed, `chunk` rows per transaction.
+    Resumes where the previous (possibly interrupted) run stopped and is a no-op once done.
+    Returns {"search_backfilled": rows indexed}.
+    """
+    indexed = 0
+    with storage.connection() as conn:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                progress = conn.execute("SELECT next_id, end_id FROM search_backfill").fetchone()
+                if progress is None or progress[0] > progress[1]:
+                    conn.commit()
+                    break
+                next_id, end_id = progress
+                last_id = min(next_id + chunk - 1, end_id)
+                rows = conn.execute(
+                    "SELECT id, raw_data FROM events WHERE id BETWEEN ? AND ?", (next_id, last_id)
+                ).fetchall()
+                index_events(conn, rows)
+                conn.execute("UPDATE search_backfill SET next_id = ?", (last_id + 1,))
+                conn.commit()
+                indexed += len(rows)
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+    return {"search_backfilled": indexed}
+
+def run_maintenance() -> dict:
+    """Bounded incremental merge of the main index's segments (deletes leave tombstones to fold in)."""
+    with storage.connection() as conn, conn:
+        conn.execute("INSERT INTO event_search (event_search, rank) VALUES ('merge', ?)", (MERGE_PAGES,))
+    return {"search_merge_pages": MERGE_PAGES}
+
+# ==============================
+# QUERIES
+# ==============================
+def match_expression(q: str, syntax: str = "terms") -> str:
+    """FTS5 MATCH expression: each whitespace-separated term as a quoted phrase (all required)."""
+    if syntax == "fts":
+        return q
+    return " ".join('"' + term.replace('"', '""') + '"' for term in q.split())
+
+def _search_query(schema: str, conditions: list, ioc_column: bool) -> str:
+    ioc = "e.ioc_match" if ioc_column else "NULL"
+    return f"""
+        SELECT e.id, e.timestamp, e.source, e.event_type, e.raw_data, e.anomaly_score, {ioc} AS ioc_match
+        FROM {schema}.event_search s
+        INNER JOIN {schema}.events e ON e.id = s.rowid
+        WHERE {" AND ".join(conditions)}
+        ORDER BY s.rowid DESC
+        LIMIT ?
+    """
+
+def _archived_ids_query(conditions: list) -> str:
+    """Matching ids from an archived day's index (archive.py); the rows themselves come from Parquet."""
+    return f"""
+        SELECT e.id FROM hist.event_search s
+        INNER JOIN hist.events e ON e.id = s.rowid
+        WHERE {" AND ".join(conditions)}
+        ORDER BY s.rowid DESC
+        LIMIT ?
+    """
+
+def _read(conn, query: str, params: list, syntax: str) -> pd.DataFrame:
+    """Run a MATCH query; with raw FTS5 syntax any SQLite error means the query itself is invalid."""
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    except (sqlite3.OperationalError, pd.errors.DatabaseError) as e:
+        if syntax == "fts":
+            raise HTTPException(status_code=400, detail=f"Invalid FTS5 query: {e}")
+        raise
+
+def _in_window(day, since: str, until: str) -> bool:
+    return not ((since and day.isoformat() < since[:10]) or (until and day.isoformat() > until[:10]))
+
+def search_events(q: str = None, syntax: str = "terms", limit: int = 100, cursor: str = None,
+                  source: str = None, event_type: str = None, since: str = None, until: str = None,
+                  ioc_only: bool = False, columns: list = None) -> tuple:
+    """
+    Events whose payload matches `q`, newest (highest id) first, from the main table,
+    the partition files and the archived days overlapping [since, until), i.e. for as
+    long as the events themselves are kept. Without `q`, `ioc_only` lists IOC-flagged
+    events (always kept in the main table).
+    Returns (rows, {"next_cursor"}); pass next_cursor back as `cursor` for the next page.
+    """
+    if not q and not ioc_only:
+        raise HTTPException(status_code=422, detail="Provide q, ioc_only=true, or both")
+    conditions, params = [], []
+    if q:
+        expression = match_expression(q, syntax)
+        if not expression:
+            raise HTTPException(status_code=422, detail="Empty search query")
+        conditions.append("s.event_search MATCH ?")
+        params.append(expression)
+    for clause, value in [
+        ("e.source = ?", source),
+        ("e.event_type = ?", event_type),
+        ("e.timestamp >= ?", since),
+        ("e.timestamp < ?", until),
+        ("e.id < ?", int(cursor) if cursor else None),
+    ]:
+        if value is not None:
+            conditions.append(clause)
+            params.append(value)
+    if ioc_only:
+        conditions.append("e.ioc_match IS NOT NULL")
+
+    frames = []
+    with storage.connection() as conn:
+        if q:
+            frames.append(_read(conn, _search_query("main", conditions, True), params + [limit], syntax))
+        else:
+            frames.append(pd.read_sql_query(f"""
+                SELECT e.id, e.timestamp, e.source, e.event_type, e.raw_data, e.anomaly_score, e.ioc_match
+                FROM events e WHERE {" AND ".join(conditions)} ORDER BY e.id DESC LIMIT ?
+            """, conn, params=params + [limit]))
+        cold = q and not ioc_only
+        for day in partitions.partition_days() if cold else []:
+            if not _in_window(day, since, until):
+                continue
+            conn.execute("ATTACH DATABASE ? AS hist", (partitions.partition_path(day),))
+            try:
+                tables = {row[0] for row in conn.execute("SELECT name FROM hist.sqlite_master")}
+                if "event_search" not in tables:
+                    continue  # written before search existed; indexed when rotation next attaches it
+                has_ioc = any(row[1] == "ioc_match" for row in conn.execute("PRAGMA hist.table_info(events)"))
+                frames.append(_read(conn, _search_query("hist", conditions, has_ioc), params + [limit], syntax))
+            finally:
+                conn.execute("DETACH DATABASE hist")
+        for day in archive.archive_days() if cold else []:
+            if not _in_window(day, since, until) or not os.path.exists(archive.search_path(day)):
+                continue  # not indexed yet: archive.index_archives builds it on the next maintenance run
+            conn.execute("ATTACH DATABASE ? AS hist", (archive.search_path(day),))
+            try:
+                ids = _read(conn, _archived_ids_query(conditions), params + [limit], syntax)["id"].tolist()
+            finally:
+                conn.execute("DETACH DATABASE hist")
+            if ids:
+                frames.append(archive.read_events(day, ids)[FIELDS])
+
+    frames = [f for f in frames if len(f)]
+    df = (pd.concat(frames, ignore_index=True).drop_duplicates("id")
+          .sort_values("id", ascending=False).head(limit).reset_index(drop=True)
+          if frames else pd.DataFrame(columns=FIELDS))
+    next_cursor = str(int(df["id"].iat[-1])) if len(df) == limit else None
+    return (df[columns] if columns is not None else df), {"next_cursor": next_cursor}
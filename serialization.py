@@ -0,0 +1,189 @@
+# serialization.py
+"""
+Response Encoding for Query Endpoints
+-------------------------------------
+Handles:
+- Content negotiation for DataFrame-backed responses (`?format=` or the Accept header):
+    json      row records (default), encoded with orjson when installed
+    columnar  one array per column, so keys are not repeated per row
+    arrow     Apache Arrow IPC stream (application/vnd.apache.arrow.stream)
+- Field selection (`fields=` / `exclude=`), e.g. `exclude=raw_data`
+- gzip / zstd response compression negotiated from Accept-Encoding
+  (zstd needs the optional `zstandard` package; streaming responses such as
+  the SSE feed are passed through untouched)
+
+Configuration (environment variables):
+    THREAT_COMPRESS_MIN_BYTES, THREAT_GZIP_LEVEL, THREAT_ZSTD_LEVEL
+"""
+
+import gzip
+import json
+import os
+
+import pandas as pd
+from fastapi import HTTPException, Request
+from fastapi.responses import Response
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:  # optional: pandas' JSON encoder is used instead
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # optional: only gzip is offered
+    zstandard = None
+
+# ==============================
+# CONFIGURATION
+# ==============================
+COMPRESS_MIN_BYTES = int(os.environ.get("THREAT_COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("THREAT_GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.environ.get("THREAT_ZSTD_LEVEL", "3"))
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNAR_MEDIA_TYPE = "application/vnd.threat.columnar+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+FORMATS = {"json": JSON_MEDIA_TYPE, "columnar": COLUMNAR_MEDIA_TYPE, "arrow": ARROW_MEDIA_TYPE}
+
+# ==============================
+# FIELD SELECTION
+# ==============================
+def select_fields(available: list, fields: str = None, exclude: str = None) -> list:
+    """Columns to return, in `available` order, from comma-separated `fields` / `exclude` parameters."""
+    chosen = list(available)
+    for param, names in (("fields", fields), ("exclude", exclude)):
+        if not names:
+            continue
+        requested = [n.strip() for n in names.split(",") if n.strip()]
+        unknown = sorted(set(requested) - set(available))
+        if unknown:
+            raise HTTPException(status_code=422, detail=f"Unknown {param}: {', '.join(unknown)}")
+        chosen = [c for c in chosen if (c in requested) == (param == "fields")]
+    return chosen
+
+# ==============================
+# ENCODERS
+# ==============================
+def negotiate(request: Request, format: str = None) -> str:
+    """Pick json / columnar / arrow from an explicit `format` or the Accept header."""
+    if format:
+        if format not in FORMATS:
+            raise HTTPException(status_code=422, detail=f"format must be one of {', '.join(FORMATS)}")
+        return format
+    accept = request.headers.get("accept", "")
+    if ARROW_MEDIA_TYPE in accept:
+        return "arrow"
+    if COLUMNAR_MEDIA_TYPE in accept:
+        return "columnar"
+    return "json"
+
+def _dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value).encode()
+
+def _records(frame: pd.DataFrame) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(frame.to_dict(orient="records"), option=orjson.OPT_SERIALIZE_NUMPY)
+    return frame.to_json(orient="records").encode()
+
+def _columns(frame: pd.DataFrame) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(frame.to_dict(orient="list"), option=orjson.OPT_SERIALIZE_NUMPY)
+    parts = (_dumps(str(c)) + b":" + frame[c].to_json(orient="values").encode() for c in frame.columns)
+    return b"{" + b",".join(parts) + b"}"
+
+def _arrow(frame: pd.DataFrame, meta: dict) -> bytes:
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    if meta:
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), b"meta": _dumps(meta)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def encode_frame(frame: pd.DataFrame, format: str = "json", meta: dict = None, envelope: str = "items") -> Response:
+    """
+    Encode `frame` in `format`. Without `meta` the body is the bare rows; with `meta`
+    it is {envelope: rows, **meta}. Arrow responses carry `meta` in the schema metadata
+    and as X-<Key> headers (e.g. X-Next-Cursor).
+    """
+    if format == "arrow":
+        headers = {f"X-{k.replace('_', '-').title()}": str(v) for k, v in (meta or {}).items() if v is not None}
+        return Response(_arrow(frame, meta), media_type=ARROW_MEDIA_TYPE, headers=headers)
+
+    body = _columns(frame) if format == "columnar" else _records(frame)
+    if meta is not None:
+        rest = b"," + _dumps(meta)[1:] if meta else b"}"
+        body = b"{" + _dumps(envelope) + b":" + body + rest
+    return Response(body, media_type=FORMATS[format])
+
+# ==============================
+# COMPRESSION
+# ==============================
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing complete (single-message) response bodies with zstd or gzip.
+    Streaming responses, small bodies and already-encoded bodies are sent as is.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    def _encoding(self, scope) -> str:
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        offered = {token.split(";")[0].strip() for token in accept.split(",")}
+        if zstandard is not None and "zstd" in offered:
+            return "zstd"
+        if "gzip" in offered:
+            return "gzip"
+        return None
+
+    async def __call__(self, scope, receive, send):
+        encoding = self._encoding(scope) if scope["type"] == "http" else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                if Headers(raw=message["headers"]).get("content-type", "").startswith("text/event-stream"):
+                    await send(message)  # live stream: never hold back the headers
+                    return
+                start = message  # held until we know whether the body is complete
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=start)
+            body = message.get("body", b"")
+            if (message.get("more_body", False) or len(body) < self.minimum_size
+                    or "content-encoding" in headers):
+                await send(start)
+                start = None
+                await send(message)
+                return
+
+            body = _compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            start = None
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
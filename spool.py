@@ -0,0 +1,257 @@
+# spool.py
+"""
+Durable Client-Side Event Spool
+-------------------------------
+Handles:
+- A SQLite-backed ring buffer on the sending host: events are appended here
+  first, so a backend restart or slow period does not lose them
+  (when the spool is full the oldest events are dropped and counted)
+- A background shipper that drains the spool in FIFO batches to /ingest_batch:
+    * adaptive batch size: grows while the backend answers fast, halves on
+      slow answers, errors and 429/503
+    * retry with capped exponential backoff and full jitter (honours Retry-After),
+      so many clients do not reconnect in lock-step after an outage
+    * a cap on bytes in flight per request
+- Events are only deleted from the spool after the backend acknowledged them.
+  Status handling:
+    200              ack the batch
+    400, 422         the batch holds a bad event: split it until the bad event is
+                     isolated, then drop only that event
+    413              body too large: shrink the batch, ack nothing
+    401, 403, 404    wrong URL or credentials: stop shipping with a logged error
+                     (`Shipper.error`), keeping every event in the spool
+    anything else    retry with backoff
+
+Configuration (environment variables):
+    CLIENT_SPOOL_PATH, CLIENT_SPOOL_MAX_EVENTS, CLIENT_SPOOL_MAX_BYTES,
+    CLIENT_BATCH_MIN, CLIENT_BATCH_MAX, CLIENT_MAX_INFLIGHT_BYTES, CLIENT_TARGET_LATENCY_MS
+"""
+
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import requests
+
+# ==============================
+# CONFIGURATION
+# ==============================
+SPOOL_PATH = os.environ.get("CLIENT_SPOOL_PATH", "client_spool.db")
+SPOOL_MAX_EVENTS = int(os.environ.get("CLIENT_SPOOL_MAX_EVENTS", "1000000"))
+SPOOL_MAX_BYTES = int(os.environ.get("CLIENT_SPOOL_MAX_BYTES", str(512 * 1024 * 1024)))
+BATCH_MIN = int(os.environ.get("CLIENT_BATCH_MIN", "1"))
+BATCH_MAX = int(os.environ.get("CLIENT_BATCH_MAX", "5000"))
+MAX_INFLIGHT_BYTES = int(os.environ.get("CLIENT_MAX_INFLIGHT_BYTES", str(4 * 1024 * 1024)))
+TARGET_LATENCY_MS = float(os.environ.get("CLIENT_TARGET_LATENCY_MS", "250"))
+BACKOFF_BASE = 0.5   # seconds
+BACKOFF_MAX = 60.0   # seconds
+REJECTED_STATUS = {400, 422}      # the batch contains an event the backend will never accept
+FATAL_STATUS = {401, 403, 404}     # retrying cannot succeed until the configuration is fixed
+TOO_LARGE_STATUS = 413
+
+# ==============================
+# SPOOL
+# ==============================
+class Spool:
+    """Append-only FIFO of JSON-encoded events with a size-bounded ring-buffer policy."""
+
+    def __init__(self, path: str = SPOOL_PATH, max_events: int = SPOOL_MAX_EVENTS, max_bytes: int = SPOOL_MAX_BYTES):
+        self.path = path
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self._count, self._bytes = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM spool").fetchone()
+
+    @property
+    def depth(self) -> int:
+        return self._count
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def append(self, events: list):
+        """Persist `events` (dicts); evicts the oldest entries if the spool is over capacity."""
+        rows = [(payload, len(payload)) for payload in (json.dumps(e, separators=(",", ":")) for e in events)]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("INSERT INTO spool (payload, size) VALUES (?, ?)", rows)
+            self._count += len(rows)
+            self._bytes += sum(size for _, size in rows)
+            if self._count > self.max_events or self._bytes > self.max_bytes:
+                self._evict()
+            self._conn.execute("COMMIT")
+
+    def _evict(self):
+        """Drop the oldest rows until both limits hold again (caller holds the transaction)."""
+        excess_events = max(self._count - self.max_events, 0)
+        excess_bytes = max(self._bytes - self.max_bytes, 0)
+        seq, dropped_count, dropped_bytes = None, 0, 0
+        for row_seq, size in self._conn.execute("SELECT seq, size FROM spool ORDER BY seq"):
+            if dropped_count >= excess_events and dropped_bytes >= excess_bytes:
+                break
+            seq, dropped_count, dropped_bytes = row_seq, dropped_count + 1, dropped_bytes + size
+        if seq is not None:
+            self._conn.execute("DELETE FROM spool WHERE seq <= ?", (seq,))
+            self._count -= dropped_count
+            self._bytes -= dropped_bytes
+            self.dropped += dropped_count
+
+    def peek(self, max_events: int, max_bytes: int) -> tuple:
+        """Oldest events up to both limits (at least one): (last seq, [JSON payload strings], bytes)."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, payload, size FROM spool ORDER BY seq LIMIT ?", (max_events,)
+            ).fetchall()
+        payloads, total, last = [], 0, None
+        for seq, payload, size in rows:
+            if payloads and total + size > max_bytes:
+                break
+            payloads.append(payload)
+            total += size
+            last = seq
+        return last, payloads, total
+
+    def ack(self, last_seq: int):
+        """
+        Delete everything up to and including `last_seq` after the backend accepted it.
+        The counters follow the rows actually deleted: eviction on the append side may
+        already have dropped some of the peeked rows.
+        """
+        with self._lock:
+            sizes = self._conn.execute("DELETE FROM spool WHERE seq <= ? RETURNING size", (last_seq,)).fetchall()
+            self._count -= len(sizes)
+            self._bytes -= sum(size for size, in sizes)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# ==============================
+# SHIPPER
+# ==============================
+class Shipper:
+    """
+    Drains a Spool to the backend's batch endpoint on a daemon thread.
+    `on_response(events, results)` is called after each accepted batch.
+    """
+
+    def __init__(self, spool: Spool, url: str, on_response=None, batch_min: int = BATCH_MIN,
+                 batch_max: int = BATCH_MAX, max_inflight_bytes: int = MAX_INFLIGHT_BYTES,
+                 target_latency_ms: float = TARGET_LATENCY_MS, poll_interval: float = 0.2):
+        self.spool = spool
+        self.url = url
+        self.on_response = on_response
+        self.batch_min = batch_min
+        self.batch_max = batch_max
+        self.max_inflight_bytes = max_inflight_bytes
+        self.target_latency = target_latency_ms / 1000
+        self.poll_interval = poll_interval
+        self.batch_size = batch_min
+        self.failures = 0
+        self.shipped = 0
+        self.rejected = 0
+        self.error = None  # set when shipping stopped on a fatal status
+        self._session = requests.Session()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self.error = None
+            self._thread = threading.Thread(target=self._run, name="spool-shipper", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _backoff(self, retry_after: float = None) -> float:
+        """Full-jitter exponential backoff; Retry-After from the server is a floor."""
+        delay = random.uniform(0, min(BACKOFF_BASE * (2 ** self.failures), BACKOFF_MAX))
+        return max(delay, retry_after or 0.0)
+
+    def ship_once(self) -> float:
+        """Send one batch. Returns how long to wait before the next attempt."""
+        last_seq, payloads, _ = self.spool.peek(self.batch_size, self.max_inflight_bytes)
+        if not payloads:
+            return self.poll_interval
+
+        body = "[" + ",".join(payloads) + "]"  # already JSON; no re-encoding
+        start = time.perf_counter()
+        try:
+            response = self._session.post(
+                self.url, data=body.encode(), headers={"Content-Type": "application/json"}, timeout=30
+            )
+        except requests.exceptions.RequestException:
+            return self._failed()
+        elapsed = time.perf_counter() - start
+
+        if response.status_code == 200:
+            self.spool.ack(last_seq)
+            self.failures = 0
+            self.shipped += len(payloads)
+            self._adapt(elapsed)
+            if self.on_response:
+                self.on_response([json.loads(p) for p in payloads], response.json())
+            return 0.0
+        if response.status_code in REJECTED_STATUS:
+            # Retrying the same batch would block the spool forever: narrow down to the bad event
+            # (below batch_min if need be) and drop only that one.
+            if len(payloads) > 1:
+                self.batch_size = len(payloads) // 2
+                return 0.0
+            self.spool.ack(last_seq)
+            self.rejected += 1
+            return 0.0
+        if response.status_code in FATAL_STATUS:
+            self.error = f"HTTP {response.status_code} from {self.url}"
+            print(f"❌ Spool shipper stopped: {self.error}; {self.spool.depth} events kept in the spool")
+            self._stop.set()
+            return 0.0
+        if response.status_code == TOO_LARGE_STATUS and len(payloads) > 1:
+            self.batch_size = len(payloads) // 2
+            return 0.0
+
+        # Server errors, throttling and anything unexpected (including a single event that is
+        # still too large): keep the batch and retry later.
+        retry_after = response.headers.get("Retry-After")
+        return self._failed(float(retry_after) if retry_after and retry_after.isdigit() else None)
+
+    def _failed(self, retry_after: float = None) -> float:
+        self.failures += 1
+        self.batch_size = max(self.batch_min, self.batch_size // 2)
+        return self._backoff(retry_after)
+
+    def _adapt(self, elapsed: float):
+        """Grow the batch while the backend keeps up; shrink when it slows down."""
+        if elapsed > self.target_latency:
+            self.batch_size = max(self.batch_min, self.batch_size // 2)
+        elif self.spool.depth > self.batch_size:
+            self.batch_size = min(self.batch_max, self.batch_size * 2)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                wait = self.ship_once()
+            except Exception as e:  # e.g. a malformed 200 body or a spool I/O error; keep the thread alive
+                print(f"⚠️  Spool shipper error: {e}")
+                wait = self._failed()
+            if wait:
+                self._stop.wait(wait)
@@ -0,0 +1,148 @@
+# storage.py
+"""
+SQLite Storage Layer for the AI Threat Detection Backend
+--------------------------------------------------------
+Handles:
+- A bounded pool of long-lived SQLite connections shared by the API routes
+- WAL journaling so dashboard reads do not block ingest writes
+- Tuned pragmas (synchronous, cache_size, mmap_size, busy_timeout)
+- Prepared-statement reuse via each pooled connection's statement cache
+
+Configuration comes from environment variables so several uvicorn workers
+can share one database file:
+    THREAT_DB_FILE, THREAT_DB_POOL_SIZE, THREAT_DB_POOL_TIMEOUT
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+# ==============================
+# CONFIGURATION
+# ==============================
+DB_FILE = os.environ.get("THREAT_DB_FILE", "threat_events.db")
+POOL_SIZE = int(os.environ.get("THREAT_DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("THREAT_DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection
+
+PRAGMAS = {
+    "journal_mode": "WAL",       # readers never block the writer (and vice versa)
+    "synchronous": "NORMAL",     # safe with WAL; fsync only at checkpoints
+    "cache_size": -64000,        # ~64 MB page cache per connection
+    "mmap_size": 268435456,      # 256 MB memory-mapped reads
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,        # wait on competing writers instead of "database is locked"
+}
+
+# ==============================
+# CONNECTION POOL
+# ==============================
+class ConnectionPool:
+    """
+    Bounded pool of SQLite connections.
+    At most `size` connections exist at once; callers block (up to `timeout`)
+    when all of them are checked out.
+    """
+
+    def __init__(self, db_file: str = DB_FILE, size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.db_file = db_file
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._all = []
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a new connection and apply the tuned pragmas."""
+        conn = sqlite3.connect(
+            self.db_file,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        for name, value in PRAGMAS.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Check a connection out of the pool for the duration of a `with` block."""
+        with metrics.timed("db_pool_wait"):
+            acquired = self._slots.acquire(timeout=self.timeout)
+        if not acquired:
+            raise TimeoutError(f"No SQLite connection available after {self.timeout}s (pool size {self.size})")
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            try:
+                yield conn
+            finally:
+                # Never hand a half-finished transaction to the next caller
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @property
+    def in_use(self) -> int:
+        """Number of connections currently checked out."""
+        with self._lock:
+            return len(self._all) - self._idle.qsize()
+
+    def close_all(self):
+        """Close every connection the pool has opened."""
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+        self._idle = queue.LifoQueue()
+
+_pool = ConnectionPool()
+
+def configure(db_file: str = None, size: int = None, timeout: float = None) -> ConnectionPool:
+    """Replace the module pool, e.g. to point the backend at another database file."""
+    global _pool
+    old = _pool
+    _pool = ConnectionPool(
+        db_file=db_file or old.db_file,
+        size=size or old.size,
+        timeout=timeout or old.timeout,
+    )
+    old.close_all()
+    return _pool
+
+def get_pool() -> ConnectionPool:
+    """Return the active connection pool."""
+    return _pool
+
+def connection():
+    """Shortcut for `get_pool().connection()`."""
+    return _pool.connection()
+
+# ==============================
+# SCHEMA MIGRATIONS
+# ==============================
+def apply_migrations(conn, migrations: list) -> int:
+    """
+    Apply pending schema migrations and return the resulting schema version.
+    `migrations` is an ordered list of SQL statement lists; the number applied so far
+    is tracked in PRAGMA user_version, so each step runs exactly once per database.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(migrations[version:], start=version + 1):
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+    if version < len(migrations):
+        conn.execute("PRAGMA optimize")
+    return max(version, len(migrations))
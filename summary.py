@@ -0,0 +1,95 @@
+# summary.py
+"""
+Dashboard Summary Service
+-------------------------
+Handles:
+- One small JSON document with the headline numbers the dashboard shows
+  (events, anomalies, reviewed threats, max confidence, latest source, review backlog)
+- Every number comes from an aggregate that does not scan the raw events:
+  per-minute rollups for event/anomaly totals, indexed COUNT/MAX for detections
+- A short TTL cache with single-flight refresh, so any number of dashboards
+  polling /summary cost one set of queries per TTL
+
+Configuration (environment variables):
+    THREAT_SUMMARY_TTL
+"""
+
+import os
+import threading
+import time
+
+import review_queue
+import storage
+
+# ==============================
+# CONFIGURATION
+# ==============================
+SUMMARY_TTL = float(os.environ.get("THREAT_SUMMARY_TTL", "5"))  # seconds
+
+SCHEMA = [
+    # MAX(gemini_confidence) and min_confidence filters read this index instead of the table
+    "CREATE INDEX IF NOT EXISTS idx_detections_confidence ON threat_detections (gemini_confidence)",
+]
+
+# ==============================
+# AGGREGATES
+# ==============================
+def compute_summary() -> dict:
+    """Headline counts for the dashboard."""
+    with storage.connection() as conn:
+        by_source = {
+            source: {"events": events, "anomalies": anomalies}
+            for source, events, anomalies in conn.execute("""
+                SELECT source, SUM(events), SUM(anomalies) FROM event_rollups GROUP BY source
+            """)
+        }
+        reviewed = conn.execute("SELECT COUNT(*) FROM threat_detections").fetchone()[0]
+        # Kept separate from COUNT(*) so SQLite answers it with a single index seek
+        max_confidence = conn.execute("SELECT MAX(gemini_confidence) FROM threat_detections").fetchone()[0]
+        latest = conn.execute("""
+            SELECT e.source, e.timestamp
+            FROM threat_detections td
+            INNER JOIN events e ON e.id = td.event_id
+            ORDER BY td.id DESC
+            LIMIT 1
+        """).fetchone()
+
+    queue = review_queue.queue_depth()
+    return {
+        "total_events": sum(s["events"] for s in by_source.values()),
+        "total_anomalies": sum(s["anomalies"] for s in by_source.values()),
+        "by_source": by_source,
+        "reviewed_threats": reviewed,
+        "max_confidence": max_confidence,
+        "latest_source": latest[0] if latest else None,
+        "latest_timestamp": latest[1] if latest else None,
+        "pending_review": queue.get("pending", 0) + queue.get("in_progress", 0),
+        "generated_at": time.time(),
+    }
+
+# ==============================
+# TTL CACHE
+# ==============================
+class SummaryService:
+    """Caches `compute()` for `ttl` seconds; concurrent callers share one refresh."""
+
+    def __init__(self, compute=compute_summary, ttl: float = SUMMARY_TTL):
+        self.compute = compute
+        self.ttl = ttl
+        self._value = None
+        self._expires = 0.0
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def get(self) -> dict:
+        if self._value is not None and time.monotonic() < self._expires:
+            return self._value
+        with self._lock:
+            if self._value is None or time.monotonic() >= self._expires:  # another caller may have refreshed
+                self._value = self.compute()
+                self._expires = time.monotonic() + self.ttl
+                self.refreshes += 1
+        return self._value
+
+    def invalidate(self):
+        self._expires = 0.0
@@ -0,0 +1,41 @@
+# tests/conftest.py
+"""Shared fixtures: a fresh backend database, partition and archive directory per test."""
+
+import os
+import tempfile
+
+# Point the backend at throwaway files before it is imported (it sets up its database on import)
+_TMP_DIR = tempfile.mkdtemp(prefix="threat-tests-")
+os.environ.setdefault("THREAT_DB_FILE", os.path.join(_TMP_DIR, "import.db"))
+os.environ.setdefault("THREAT_PARTITION_DIR", os.path.join(_TMP_DIR, "partitions"))
+os.environ.setdefault("THREAT_ARCHIVE_DIR", os.path.join(_TMP_DIR, "archive"))
+os.environ.setdefault("THREAT_IOC_FILE", os.path.join(_TMP_DIR, "iocs.txt"))
+
+import pytest
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """The backend module, with storage, partitions and archives in tmp_path."""
+    import archive
+    import backend
+    import partitions
+    import storage
+
+    monkeypatch.setattr(partitions, "PARTITION_DIR", str(tmp_path / "partitions"))
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    storage.configure(db_file=str(tmp_path / "events.db"))
+    backend.setup_database()
+    yield backend
+    storage.get_pool().close_all()
+
+@pytest.fixture
+def api(db):
+    """TestClient without lifespan: background workers stay off, as in bench.py."""
+    from fastapi.testclient import TestClient
+    return TestClient(db.app)
+
+def store(backend, rows: list) -> list:
+    """Store (timestamp, source, event_type, data, score) rows; returns their event ids."""
+    from models import RawEvent
+    events = [RawEvent(timestamp=t, source=s, event_type=et, data=d) for t, s, et, d, _ in rows]
+    return [r.id for r in backend.store_events(events, [score for *_, score in rows])]
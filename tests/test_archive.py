@@ -0,0 +1,74 @@
+# tests/test_archive.py
+"""Round-trip tests for the Parquet event archive (archive.py)."""
+
+import os
+import sqlite3
+from datetime import date
+
+import pytest
+
+import archive
+import partitions
+
+DAY = date(2026, 3, 1)
+
+ZEEK_DNS = (
+    "uid=C1, id.orig_h=10.0.0.42, id.resp_h=8.8.8.8, query=example.com, "
+    "answers='1.2.3.4,5.6.7.8', TTLs='60.0,60.0', proto=udp"
+)
+OSQUERY = "host=h1, user=root, pid=0042, path=/bin/sh, cmdline='sh -c \"a, b\"', anomaly_factor=0.5000"
+
+@pytest.fixture(autouse=True)
+def dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(partitions, "PARTITION_DIR", str(tmp_path / "partitions"))
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+
+def write_partition(rows):
+    os.makedirs(partitions.PARTITION_DIR, exist_ok=True)
+    conn = sqlite3.connect(partitions.partition_path(DAY))
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY, timestamp TEXT, source TEXT, event_type TEXT,
+            raw_data TEXT, anomaly_score REAL, is_anomaly INTEGER
+        )
+    """)
+    conn.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+def query_day(**kwargs):
+    return archive.query_archive("2026-03-01", "2026-03-02", limit=100, **kwargs)
+
+def test_raw_data_round_trips_verbatim():
+    write_partition([
+        (1, "2026-03-01T10:00:00", "zeek", "dns_query", ZEEK_DNS, 0.1, 0),
+        (2, "2026-03-01T10:00:01", "osquery", "process_create", OSQUERY, 0.2, 0),
+    ])
+    assert archive.archive_partition(DAY) == 2
+    rows = {r["id"]: r for r in query_day()}
+    assert rows[1]["raw_data"] == ZEEK_DNS
+    assert rows[2]["raw_data"] == OSQUERY
+    assert set(rows[1]) == set(archive.ROW_COLUMNS)
+
+def test_rearchiving_an_archived_day_keeps_payloads():
+    write_partition([(1, "2026-03-01T10:00:00", "zeek", "dns_query", ZEEK_DNS, 0.1, 0)])
+    archive.archive_partition(DAY)
+    write_partition([(2, "2026-03-01T11:00:00", "osquery", "process_create", OSQUERY, 0.2, 0)])
+    assert archive.archive_partition(DAY) == 2
+    assert not os.path.exists(partitions.partition_path(DAY))
+    rows = {r["id"]: r["raw_data"] for r in query_day()}
+    assert rows == {1: ZEEK_DNS, 2: OSQUERY}
+
+def test_typed_columns_filter_without_touching_raw_data():
+    write_partition([
+        (1, "2026-03-01T10:00:00", "zeek", "dns_query", ZEEK_DNS, 0.1, 0),
+        (2, "2026-03-01T10:00:01", "osquery", "process_create", OSQUERY, 0.2, 0),
+    ])
+    archive.archive_partition(DAY)
+    assert [r["id"] for r in query_day(fields={"host": "10.0.0.42"})] == [1]
+    assert [r["id"] for r in query_day(fields={"host": "h1"})] == [2]
+    assert [r["raw_data"] for r in query_day(fields={"pid": 42})] == [OSQUERY]
+    assert query_day(columns=["query"]) == [
+        {"id": 2, "timestamp": "2026-03-01T10:00:01", "query": None},
+        {"id": 1, "timestamp": "2026-03-01T10:00:00", "query": "example.com"},
+    ]
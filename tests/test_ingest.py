@@ -0,0 +1,63 @@
+# tests/test_ingest.py
+"""Single-event and batch ingest through the API (backend.py, ingest.py)."""
+
+import asyncio
+import json
+
+import ingest
+
+PROCESS = {"timestamp": "2026-03-01T10:00:00", "source": "osquery", "event_type": "process_create",
+           "data": "host=ws-1, user=bob, pid=4242, path=/bin/sh, cmdline='sh -c id', anomaly_factor=0.9"}
+
+def test_single_event_payload_is_parsed_once(db, api, monkeypatch):
+    calls = []
+    parse_payloads = ingest.parse_payloads
+    monkeypatch.setattr(ingest, "parse_payloads", lambda events: calls.append(len(events)) or parse_payloads(events))
+
+    response = api.post("/ingest_data", json=PROCESS)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert calls == [1]
+    assert body["is_anomaly"] is True and body["review_status"] == "pending_review"
+
+    with db.storage.connection() as conn:
+        row = conn.execute('SELECT host, "user", pid, path FROM events WHERE id = ?', (body["id"],)).fetchone()
+    assert row == ("ws-1", "bob", 4242, "/bin/sh")
+
+def batch(n: int, offset: int = 0) -> list:
+    return [{"timestamp": f"2026-03-01T10:00:{i:02d}", "source": "zeek", "event_type": "dns_query",
+             "data": f"query=q{offset + i}.example"} for i in range(n)]
+
+def test_batch_ingest_returns_the_contiguous_ids_of_its_rows(db, api):
+    first = api.post("/ingest_batch", json=batch(5)).json()
+    with db.storage.connection() as conn, conn:
+        conn.execute("DELETE FROM events WHERE id = ?", (first[-1]["id"],))  # AUTOINCREMENT must not reuse it
+    ndjson = "\n".join(json.dumps(e) for e in batch(4, offset=5))
+    second = api.post("/ingest_batch", content=ndjson, headers={"Content-Type": "application/x-ndjson"}).json()
+
+    for response, offset in [(first[:-1], 0), (second, 5)]:
+        ids = [r["id"] for r in response]
+        assert ids == list(range(ids[0], ids[0] + len(ids)))
+        with db.storage.connection() as conn:
+            stored = dict(conn.execute(f"SELECT id, raw_data FROM events WHERE id IN ({','.join('?' * len(ids))})", ids))
+        assert [stored[i] for i in ids] == [f"query=q{offset + n}.example" for n in range(len(ids))]
+    assert second[0]["id"] == first[-1]["id"] + 1
+
+def test_group_committed_requests_each_get_the_ids_of_their_rows(db):
+    pool = ingest.IngestPool(workers=2, max_wait_ms=50)
+    pool.start()
+    try:
+        async def ingest_all():
+            bodies = [json.dumps(batch(3 + n, offset=10 * n)).encode() for n in range(4)]
+            return await asyncio.gather(*(pool.ingest_body(body, "application/json") for body in bodies))
+        results = asyncio.run(ingest_all())
+    finally:
+        pool.stop()
+
+    with db.storage.connection() as conn:
+        stored = dict(conn.execute("SELECT id, raw_data FROM events"))
+    for n, response in enumerate(results):
+        ids = [r.id for r in response]
+        assert ids == list(range(ids[0], ids[0] + 3 + n))
+        assert [stored[i] for i in ids] == [f"query=q{10 * n + i}.example" for i in range(3 + n)]
+    assert len(stored) == sum(3 + n for n in range(4))
@@ -0,0 +1,65 @@
+# tests/test_partitions.py
+"""Rotation into per-day partition files, their search indexes, and retention (partitions.py)."""
+
+import sqlite3
+from datetime import date, datetime
+
+import partitions
+from conftest import store
+
+NOW = datetime(2026, 3, 5, 12)
+
+def event(timestamp: str, query: str, score: float = 0.1) -> tuple:
+    return (timestamp, "zeek", "dns_query", f"id.orig_h=10.0.0.1, query={query}", score)
+
+def partition_rows(day: date, query: str = "SELECT id FROM events ORDER BY id") -> list:
+    with sqlite3.connect(partitions.partition_path(day)) as conn:
+        return [row[0] for row in conn.execute(query)]
+
+def search_main(db, term: str) -> list:
+    with db.storage.connection() as conn:
+        return [row[0] for row in conn.execute(
+            "SELECT rowid FROM event_search WHERE event_search MATCH ? ORDER BY rowid", (f'"{term}"',)
+        )]
+
+def test_rotate_moves_normal_events_to_their_day_file(db):
+    first = store(db, [event("2026-03-01T00:00:00", "a.example"), event("2026-03-01T23:59:59", "b.example")])
+    anomaly = store(db, [event("2026-03-01T12:00:00", "c.example", score=0.9)])
+    second = store(db, [event("2026-03-02T08:00:00", "d.example")])
+    hot = store(db, [event("2026-03-05T08:00:00", "e.example")])
+
+    assert partitions.rotate(now=NOW) == {"2026-03-01": 2, "2026-03-02": 1}
+    assert partitions.partition_days() == [date(2026, 3, 1), date(2026, 3, 2)]
+    assert partition_rows(date(2026, 3, 1)) == first
+    assert partition_rows(date(2026, 3, 2)) == second
+    with db.storage.connection() as conn:
+        assert [row[0] for row in conn.execute("SELECT id FROM events ORDER BY id")] == anomaly + hot
+    assert partitions.rotate(now=NOW) == {}
+
+def test_search_index_follows_rotated_events(db):
+    ids = store(db, [event("2026-03-01T10:00:00", "moved.example"), event("2026-03-05T10:00:00", "moved.example")])
+
+    partitions.rotate(now=NOW)
+    assert search_main(db, "moved.example") == ids[1:]
+    match = "SELECT rowid FROM event_search WHERE event_search MATCH '\"moved.example\"'"
+    assert partition_rows(date(2026, 3, 1), match) == ids[:1]
+    for path in [partitions.partition_path(date(2026, 3, 1)), db.storage.get_pool().db_file]:
+        with sqlite3.connect(path) as conn:
+            conn.execute("INSERT INTO event_search (event_search) VALUES ('integrity-check')")
+
+def test_retention_drops_only_expired_days(db, monkeypatch):
+    monkeypatch.setattr(partitions, "RETENTION_DAYS", 30)
+    store(db, [event("2026-03-01T10:00:00", "old.example"), event("2026-03-02T10:00:00", "kept.example")])
+    old_anomaly, kept_anomaly = store(db, [
+        event("2026-03-01T11:00:00", "old.example", score=0.9), event("2026-03-02T11:00:00", "kept.example", score=0.9),
+    ])
+    partitions.rotate(now=NOW)
+
+    result = partitions.enforce_retention(now=datetime(2026, 4, 1))
+    assert result["partitions_dropped"] == ["2026-03-01"] and result["events_deleted"] == 1
+    assert partitions.partition_days() == [date(2026, 3, 2)]
+    with db.storage.connection() as conn:
+        assert [row[0] for row in conn.execute("SELECT id FROM events")] == [kept_anomaly]
+        assert [row[0] for row in conn.execute("SELECT event_id FROM review_queue")] == [kept_anomaly]
+        assert conn.execute("SELECT COUNT(*) FROM event_rollups").fetchone() == (4,)
+    assert search_main(db, "old.example") == []
@@ -0,0 +1,67 @@
+# tests/test_review_cache.py
+"""Payload signatures and IOC bypass of the Gemini review cache (review_cache.py)."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import review_queue
+import search
+from conftest import store
+from review_cache import ReviewCache, event_signature, normalize_payload
+
+SHA_A = "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+SHA_B = "60303ae22b998861bce3b28f33eec1be758a213c86c93c076dbe9f558c11c752"
+
+@pytest.mark.parametrize("first, second", [
+    (f"path=/tmp/x, sha256={SHA_A}", f"path=/tmp/x, sha256={SHA_B}"),
+    (f"md5={SHA_A[:32]}", f"md5={SHA_B[:32]}"),
+    ("cmdline='nc 203.0.113.5 4444'", "cmdline='nc 10.0.0.1 4444'"),
+    ("id.orig_h=10.0.0.5, id.resp_h=203.0.113.5, id.resp_p=4444", "id.orig_h=10.0.0.5, id.resp_h=8.8.8.8, id.resp_p=4444"),
+    ("id.resp_h=203.0.113.5, id.resp_p=4444", "id.resp_h=203.0.113.5, id.resp_p=443"),
+    ("id.resp_h=203.0.113.5, id.resp_p=50050", "id.resp_h=203.0.113.5, id.resp_p=50051"),
+    ("uid=0, user=root", "uid=1000, user=bob"),
+    ("host=ws-1023", "host=ws-2044"),
+    ("query=a.example", "query=b.example"),
+])
+def test_different_binaries_and_destinations_get_different_signatures(first, second):
+    assert event_signature(first) != event_signature(second)
+
+@pytest.mark.parametrize("first, second", [
+    ("pid=1234, ppid=1, path=/bin/sh", "pid=98765, ppid=2, path=/bin/sh"),
+    ("ts=2026-03-01T10:00:00.123Z, query=a.example", "ts=2026-03-02 11:30:00, query=a.example"),
+    ("session=1b4e28ba-2fa1-11d2-883f-0016cb7c3dc1", "session=6fa459ea-ee8a-3ca4-894e-db77e160355e"),
+    ("uid=CHhAvVGS1DHFjwGM9, id.orig_p=51544, id.resp_h=8.8.8.8", "uid=C4J4Th3PJpwUYZZ6gc, id.orig_p=60211, id.resp_h=8.8.8.8"),
+    ("query=malicious-1718000000.com", "query=malicious-1718003600.com"),
+    ("bytes=123456, anomaly_factor=0.91", "bytes=654321, anomaly_factor=0.12"),
+])
+def test_volatile_values_are_stripped(first, second):
+    assert event_signature(first) == event_signature(second)
+
+def test_normalized_text_keeps_addresses_and_hashes():
+    text = normalize_payload(f"id.resp_h=203.0.113.5, sha256={SHA_A}, pid=42")
+    assert text == f"id.resp_h=203.0.113.5, sha256={SHA_A}, pid=<n>"
+
+def test_ioc_matches_are_never_served_from_the_cache(db, tmp_path, monkeypatch):
+    calls = []
+    def reviewer(event_data, ioc_match):
+        calls.append(ioc_match)
+        return {"review": "flagged" if ioc_match else "benign", "mitigation": "-", "confidence": 0.5}
+    worker = review_queue.ReviewWorker(reviewer=ReviewCache().wrap(reviewer))
+    worker._pool = ThreadPoolExecutor(1)
+    payload = "id.orig_h=10.0.0.5, id.resp_h=203.0.113.5, query=update.example"
+
+    store(db, [("2026-03-01T10:00:00", "zeek", "dns_query", payload, 0.9)])
+    assert worker.process_batch() == 1
+    ioc_file = tmp_path / "iocs.txt"
+    ioc_file.write_text("203.0.113.5\n")
+    monkeypatch.setattr(search, "iocs", search.IocSet(str(ioc_file)))
+    ids = store(db, [("2026-03-01T10:01:00", "zeek", "dns_query", payload, 0.9)] * 2)
+    assert worker.process_batch() == 2
+
+    assert calls == [None, "203.0.113.5", "203.0.113.5"]
+    with db.storage.connection() as conn:
+        reviews = conn.execute(
+            f"SELECT gemini_review FROM threat_detections WHERE event_id IN ({ids[0]}, {ids[1]})"
+        ).fetchall()
+    assert reviews == [("flagged",), ("flagged",)]
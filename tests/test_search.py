@@ -0,0 +1,123 @@
+# tests/test_search.py
+"""Full-text search across the main table, partition files and archived days (search.py)."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import archive
+import partitions
+import review_queue
+import search
+from conftest import store
+
+DAY = "2026-03-01"
+LATER = datetime(2026, 3, 5)
+
+def dns(n: int, query: str, score: float = 0.1) -> tuple:
+    return (f"{DAY}T10:00:{n:02d}", "zeek", "dns_query", f"id.orig_h=10.0.0.{n}, query={query}, proto=udp", score)
+
+def find(api, **params):
+    response = api.get("/search", params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+def test_archived_events_stay_searchable(db, api):
+    ids = store(db, [dns(1, "good.com"), dns(2, "other.org"), dns(3, "good.com")])
+
+    assert partitions.rotate(now=LATER) == {DAY: 3}
+    assert archive.run_archival(now=LATER)["archived"] == {DAY: 3}
+    assert partitions.partition_days() == []
+    assert os.path.exists(archive.search_path(date(2026, 3, 1)))
+
+    body = find(api, q="good.com")
+    assert [r["id"] for r in body["items"]] == [ids[2], ids[0]]
+    assert body["items"][0]["raw_data"] == dns(3, "good.com")[3]
+    assert find(api, q="good.com", source="osquery")["items"] == []
+
+def test_search_pages_across_hot_partitioned_and_archived_events(db, api):
+    old = store(db, [dns(n, "good.com") for n in range(1, 5)])
+    partitions.rotate(now=LATER)
+    archive.run_archival(now=LATER)
+    warm = store(db, [(f"2026-03-04T10:00:0{n}", "zeek", "dns_query", "query=good.com", 0.1) for n in range(3)])
+    partitions.rotate(now=LATER)
+    hot = store(db, [(f"{LATER:%Y-%m-%d}T10:00:00", "zeek", "dns_query", "query=good.com", 0.1)])
+
+    seen, cursor = [], None
+    while True:
+        body = find(api, q="good.com", limit=3, **({"cursor": cursor} if cursor else {}))
+        seen += [r["id"] for r in body["items"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert seen == sorted(old + warm + hot, reverse=True)
+
+def test_archives_without_an_index_are_indexed_by_maintenance(db, api):
+    ids = store(db, [dns(1, "good.com")])
+    partitions.rotate(now=LATER)
+    archive.run_archival(now=LATER)
+    os.remove(archive.search_path(date(2026, 3, 1)))  # archived before search indexes existed
+    assert find(api, q="good.com")["items"] == []
+
+    assert archive.run_archival(now=LATER)["archives_indexed"] == [DAY]
+    assert [r["id"] for r in find(api, q="good.com")["items"]] == ids
+
+def test_archive_retention_drops_the_search_index(db):
+    store(db, [dns(1, "good.com")])
+    partitions.rotate(now=LATER)
+    archive.run_archival(now=LATER)
+
+    assert archive.enforce_archive_retention(now=datetime(2027, 6, 1)) == [DAY]
+    assert not os.path.exists(archive.search_path(date(2026, 3, 1)))
+
+def test_invalid_fts_syntax_is_a_client_error(db, api):
+    store(db, [dns(1, "good.com")])
+    for q in ['"unterminated', "good AND", "nosuchcolumn:x"]:
+        response = api.get("/search", params={"q": q, "syntax": "fts"})
+        assert response.status_code == 400, (q, response.text)
+        assert response.json()["detail"].startswith("Invalid FTS5 query")
+
+def test_ioc_matches_reach_review_and_the_feed_without_counting_as_anomalies(db, api, tmp_path, monkeypatch):
+    ioc_file = tmp_path / "iocs.txt"
+    ioc_file.write_text("evil.example\n")
+    monkeypatch.setattr(search, "iocs", search.IocSet(str(ioc_file)))
+    from models import RawEvent
+    stored = db.store_events([
+        RawEvent(timestamp=f"{DAY}T10:00:00", source="zeek", event_type="dns_query", data="query=cdn.evil.example"),
+        RawEvent(timestamp=f"{DAY}T10:00:01", source="zeek", event_type="dns_query", data="query=good.com"),
+    ], [0.1, 0.1])
+
+    assert [(r.is_anomaly, r.review_status, r.ioc_match) for r in stored] == [
+        (False, "pending_review", "evil.example"), (False, "not_required", None)
+    ]
+    worker = review_queue.ReviewWorker(reviewer=lambda data, ioc: {"review": ioc, "mitigation": "-", "confidence": 0.9})
+    worker._pool = ThreadPoolExecutor(1)
+    assert worker.process_batch() == 1
+
+    threats = api.get("/threats").json()["items"]
+    assert [t["id"] for t in threats] == [stored[0].id]
+    rollups = partitions.query_rollups(source="zeek")
+    assert sum(r["events"] for r in rollups) == 2 and sum(r["anomalies"] for r in rollups) == 0
+
+    assert partitions.rotate(now=LATER) == {DAY: 1}  # the IOC match stays in the main table
+    assert [r["id"] for r in find(api, ioc_only="true")["items"]] == [stored[0].id]
+
+def test_older_events_are_indexed_by_the_maintenance_backfill(db, api):
+    ids = store(db, [dns(n, "good.com") for n in range(1, 6)])
+    with db.storage.connection() as conn, conn:
+        conn.execute("DELETE FROM search_backfill")
+        for statement in search.INDEX_SCHEMA:  # as on a database upgraded with these events in it
+            conn.execute(statement)
+    assert find(api, q="good.com")["items"] == []
+
+    with db.storage.connection() as conn, conn:  # deleting an event the backfill has not reached yet
+        conn.execute("DELETE FROM events WHERE id = ?", (ids[0],))
+    assert search.backfill(chunk=2) == {"search_backfilled": 4}
+    assert search.backfill(chunk=2) == {"search_backfilled": 0}
+    assert [r["id"] for r in find(api, q="good.com")["items"]] == ids[:0:-1]
+
+    assert partitions.rotate(now=LATER) == {DAY: 4}  # the trigger now removes their tokens
+    with db.storage.connection() as conn:
+        conn.execute("INSERT INTO event_search (event_search) VALUES ('integrity-check')")
+        assert conn.execute("SELECT COUNT(*) FROM event_search WHERE event_search MATCH 'good'").fetchone() == (0,)
+    assert [r["id"] for r in find(api, q="good.com")["items"]] == ids[:0:-1]  # now from the partition file
@@ -0,0 +1,123 @@
+# tests/test_spool.py
+"""Delivery tests for the client-side spool and shipper (spool.py) against a fake backend."""
+
+import json
+
+import pytest
+
+from spool import Shipper, Spool
+
+class FakeResponse:
+    def __init__(self, status_code: int, body=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body
+
+    def json(self):
+        return self._body
+
+class FakeBackend:
+    """Stands in for the shipper's requests.Session; `respond(events)` returns a status code."""
+
+    def __init__(self, respond):
+        self.respond = respond
+        self.accepted = []
+        self.requests = 0
+
+    def post(self, url, data, headers, timeout):
+        self.requests += 1
+        events = json.loads(data)
+        status = self.respond(events)
+        if status == 200:
+            self.accepted.extend(events)
+            return FakeResponse(200, [{"id": e["n"]} for e in events])
+        return FakeResponse(status)
+
+@pytest.fixture
+def spool(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    spool.append([{"n": n, "bad": n == 3} for n in range(8)])
+    yield spool
+    spool.close()
+
+def shipper_for(spool, respond, **kwargs):
+    shipper = Shipper(spool, "http://backend/ingest_batch", batch_min=8, **kwargs)
+    shipper._session = FakeBackend(respond)
+    return shipper
+
+def drain(shipper, attempts=50):
+    for _ in range(attempts):
+        if not shipper.spool.depth or shipper.error:
+            break
+        shipper.ship_once()
+
+def test_ack_on_200(spool):
+    results = []
+    shipper = shipper_for(spool, lambda events: 200, on_response=lambda events, response: results.extend(response))
+
+    assert shipper.ship_once() == 0.0
+    assert spool.depth == 0 and spool.bytes == 0
+    assert shipper.shipped == 8
+    assert [r["id"] for r in results] == list(range(8))
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retryable_status_keeps_every_event(spool, status):
+    shipper = shipper_for(spool, lambda events: status)
+
+    shipper.ship_once()
+    assert spool.depth == 8
+    assert shipper.failures == 1 and shipper.rejected == 0
+
+    shipper._session.respond = lambda events: 200
+    drain(shipper)
+    assert [e["n"] for e in shipper._session.accepted] == list(range(8))
+
+@pytest.mark.parametrize("status", [400, 422])
+def test_rejection_drops_only_the_bad_event(spool, status):
+    shipper = shipper_for(spool, lambda events: status if any(e["bad"] for e in events) else 200)
+
+    drain(shipper)
+    assert spool.depth == 0
+    assert shipper.rejected == 1
+    assert [e["n"] for e in shipper._session.accepted] == [0, 1, 2, 4, 5, 6, 7]
+
+@pytest.mark.parametrize("status", [401, 403, 404])
+def test_fatal_status_stops_shipping_without_dropping(spool, status):
+    shipper = shipper_for(spool, lambda events: status)
+
+    drain(shipper)
+    assert shipper.error == f"HTTP {status} from http://backend/ingest_batch"
+    assert shipper._stop.is_set()
+    assert shipper._session.requests == 1
+    assert spool.depth == 8 and shipper.rejected == 0
+
+def test_too_large_shrinks_the_batch_without_acking(spool):
+    shipper = shipper_for(spool, lambda events: 413 if len(events) > 2 else 200)
+
+    shipper.ship_once()
+    assert spool.depth == 8 and shipper.batch_size == 4
+
+    drain(shipper)
+    assert spool.depth == 0 and shipper.rejected == 0
+    assert [e["n"] for e in shipper._session.accepted] == list(range(8))
+
+def test_single_event_too_large_is_kept(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"))
+    spool.append([{"n": 0, "bad": False}])
+    shipper = shipper_for(spool, lambda events: 413)
+
+    drain(shipper, attempts=3)
+    assert spool.depth == 1 and shipper.failures == 3 and shipper.rejected == 0
+    spool.close()
+
+def test_ack_after_eviction_counts_only_deleted_rows(tmp_path):
+    spool = Spool(str(tmp_path / "spool.db"), max_events=10)
+    spool.append([{"n": n} for n in range(10)])
+    last_seq, payloads, _ = spool.peek(5, 1 << 20)
+    spool.append([{"n": n} for n in range(10, 13)])  # evicts three of the peeked rows
+
+    spool.ack(last_seq)
+    assert spool.dropped == 3
+    assert spool.depth == 8
+    assert spool.bytes == spool._conn.execute("SELECT SUM(size) FROM spool").fetchone()[0]
+    spool.close()
@@ -0,0 +1,43 @@
+# tests/test_threats.py
+"""Keyset pagination of the reviewed-threat feed (/threats)."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import review_queue
+from conftest import store
+
+def reviewed(db, rows: list) -> list:
+    """Store (timestamp, source) anomalies and review them all; returns their ids."""
+    ids = store(db, [(t, s, "dns_query", f"query=q{i}.example", 0.9) for i, (t, s) in enumerate(rows)])
+    worker = review_queue.ReviewWorker(reviewer=lambda data, ioc: {"review": "-", "mitigation": "-", "confidence": 0.8})
+    worker._pool = ThreadPoolExecutor(1)
+    while worker.process_batch():
+        pass
+    return ids
+
+def pages(api, **params) -> list:
+    result, cursor = [], None
+    while True:
+        response = api.get("/threats", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        result.append([item["id"] for item in body["items"]])
+        cursor = body["next_cursor"]
+        if not cursor:
+            return result
+
+def test_pages_cover_every_threat_once_including_timestamp_ties(db, api):
+    # Five threats share one timestamp, so a page boundary falls inside the tie
+    ids = reviewed(db, [("2026-03-01T10:00:00", "zeek")] * 5 + [("2026-03-01T09:00:00", "zeek"),
+                                                                 ("2026-03-01T11:00:00", "zeek")])
+    result = pages(api, limit=2)
+
+    assert [len(page) for page in result] == [2, 2, 2, 1]
+    assert sum(result, []) == [ids[6]] + ids[4::-1] + [ids[5]]
+
+def test_pages_apply_filters_on_every_page(db, api):
+    ids = reviewed(db, [("2026-03-01T10:00:00", "zeek" if i % 2 else "osquery") for i in range(6)])
+
+    assert sum(pages(api, limit=2, source="zeek"), []) == [ids[5], ids[3], ids[1]]
+    assert sum(pages(api, limit=2, since="2026-03-01T10:00:00", until="2026-03-01T10:00:01"), []) == ids[::-1]
+    assert pages(api, limit=2, until="2026-03-01T10:00:00") == [[]]